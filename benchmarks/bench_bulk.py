@@ -0,0 +1,59 @@
+# Throughput of the bulk Processing path against the worker count
+#   untiled - one Source index, lookups on a single thread
+#   N       - tiled lookups over N worker threads
+# Every tiled run is checked to give the same rows as the untiled run
+
+# QGIS Core
+from qgis.core import QgsCoordinateTransform
+from qgis.core import QgsProject
+
+# Python
+from time import perf_counter
+import os
+
+from common import make_line_layer
+from common import make_point_layer
+from common import start_qgis
+from common import to_gpkg
+
+NSOURCE      = 500000
+NTARGET      = 100000
+MAX_DISTANCE = 1000
+NEIGHBORS    = 50
+SRC_FIELDS   = ['name', 'type']
+OUT_FIELDS   = ['Name', 'Type']
+FIELDMAP     = dict(zip(OUT_FIELDS, SRC_FIELDS))
+
+def main():
+    from src.bulk import build_source_index
+    from src.bulk import lookup_rows
+    from src.bulk import tiled_lookup
+    from src.bulk import transform_geoms
+    from qgis.core import QgsFeedback
+
+    source = to_gpkg(make_line_layer(NSOURCE), 'source')
+    target = make_point_layer(NTARGET)
+    tr     = QgsCoordinateTransform(target.crs(), source.crs(), QgsProject.instance())
+    geoms  = transform_geoms(list(target.getFeatures()), tr)
+
+    t0 = perf_counter()
+    index, attr_cache = build_source_index(source, SRC_FIELDS)
+    expected = lookup_rows(geoms, index, attr_cache, SRC_FIELDS, OUT_FIELDS, FIELDMAP, MAX_DISTANCE, NEIGHBORS)
+    base = perf_counter() - t0
+    print('workers  seconds  targets/s  speedup')
+    print('%7s %8.2f %10.0f %8.2f' % ('untiled', base, NTARGET/base, 1))
+
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        t0   = perf_counter()
+        rows = tiled_lookup(geoms, source, None, SRC_FIELDS, OUT_FIELDS, FIELDMAP,
+                            MAX_DISTANCE, NEIGHBORS, workers, QgsFeedback())
+        secs = perf_counter() - t0
+        assert rows == expected, 'Tiled result differs with ' + str(workers) + ' workers'
+        print('%7d %8.2f %10.0f %8.2f' % (workers, secs, NTARGET/secs, base/secs))
+        workers *= 2
+
+if __name__ == '__main__':
+    qgs = start_qgis()
+    main()
+    qgs.exitQgis()
@@ -0,0 +1,63 @@
+# Neighbor engines of the Source index, QgsSpatialIndex against the NumPy segment grid
+#   build  - registry.get_now, attribute cache included
+#   single - one nearestNeighbor call per Target point, as getfeats does on a selection
+#   batch  - all Target points in one call, as auto fill and bulk lookups do
+#            (QgsSpatialIndex has no batch query, it loops over nearestNeighbor)
+# Check the results match first with check_engine_parity.py
+
+# Python
+from time import perf_counter
+
+from common import make_line_layer
+from common import make_point_layer
+from common import rss_mb
+from common import start_qgis
+
+SIZES        = [100000, 1000000]
+NQUERIES     = 2000
+NEIGHBORS    = [10, 50]
+MAX_DISTANCE = 1000
+SRC_FIELDS   = ['name', 'type']
+
+def single(index, geoms, neighbors):
+    for geom in geoms:
+        index.nearestNeighbor(geom, neighbors = neighbors, maxDistance = MAX_DISTANCE)
+
+def batch(index, geoms, neighbors):
+    if hasattr(index, 'nearest_batch'):
+        index.nearest_batch(geoms, neighbors, MAX_DISTANCE)
+    else:
+        single(index, geoms, neighbors)
+
+def per_query_us(func, *args):
+    t0 = perf_counter()
+    func(*args)
+
+    return 1e6*(perf_counter() - t0)/NQUERIES
+
+def main():
+    from src.index_registry import SpatialIndexRegistry
+
+    target = make_point_layer(NQUERIES)
+    geoms  = [f.geometry() for f in target.getFeatures()]
+
+    print('%-8s %-6s %8s %8s %5s %10s %10s' % ('size', 'engine', 'build_s', 'rss_mb', 'k', 'single_us', 'batch_us'))
+    for size in SIZES:
+        source = make_line_layer(size)
+        for engine in ['qgis', 'numpy']:
+            reg   = SpatialIndexRegistry()
+            rss0  = rss_mb()
+            t0    = perf_counter()
+            index = reg.get_now(source, SRC_FIELDS, None, engine).index
+            build = perf_counter() - t0
+            rss   = rss_mb() - rss0
+            for neighbors in NEIGHBORS:
+                print('%-8d %-6s %8.2f %8.0f %5d %10.1f %10.1f' %
+                      (size, engine, build, rss, neighbors, per_query_us(single, index, geoms, neighbors),
+                       per_query_us(batch, index, geoms, neighbors)))
+            reg.clear()
+
+if __name__ == '__main__':
+    qgs = start_qgis()
+    main()
+    qgs.exitQgis()
@@ -0,0 +1,57 @@
+# Compare the neighbor fetch in getfeats:
+#   loop  - one getFeatures() per fid (the original approach)
+#   batch - fetch_ordered_feats, one request for all fids
+# getfeats now reads the rows from the attribute cache, this compares the two layer fetches only
+
+# QGIS Core
+from qgis.core import Qgis
+from qgis.core import QgsFeatureRequest
+from qgis.core import QgsGeometry
+from qgis.core import QgsPointXY
+from qgis.core import QgsSpatialIndex
+
+# Python
+from common import make_line_layer
+from common import start_qgis
+from common import time_ms
+from common import to_gpkg
+
+NFEATS     = 200000
+NEIGHBORS  = [10, 50, 500]
+SRC_FIELDS = ['name', 'type']
+
+def fetch_loop(lyr, fids):
+    return [next(lyr.getFeatures(QgsFeatureRequest().setFilterFid(fid))) for fid in fids]
+
+# Fetch the features in a single request, only the given attributes and no geometry
+# getFeatures returns them in provider order, so reorder to match fids
+def fetch_ordered_feats(lyr, fids, fld_names):
+    request = QgsFeatureRequest().setFilterFids(fids)
+    request.setSubsetOfAttributes(fld_names, lyr.fields())
+    request.setFlags(Qgis.FeatureRequestFlag.NoGeometry)
+
+    feats_by_fid = {f.id(): f for f in lyr.getFeatures(request)}
+
+    return [feats_by_fid[fid] for fid in fids if fid in feats_by_fid]
+
+def main():
+    lyr = to_gpkg(make_line_layer(NFEATS))
+    idx = QgsSpatialIndex(lyr.getFeatures(), flags = QgsSpatialIndex.Flag.FlagStoreFeatureGeometries)
+    pt  = QgsGeometry.fromPointXY(QgsPointXY(50000, 50000))
+
+    print('neighbors  loop_ms  batch_ms  speedup')
+    for n in NEIGHBORS:
+        fids  = idx.nearestNeighbor(pt, neighbors = n)
+        loop  = time_ms(lambda: fetch_loop(lyr, fids))
+        batch = time_ms(lambda: fetch_ordered_feats(lyr, fids, SRC_FIELDS))
+
+        # Same features, same (distance) order
+        assert [f.id() for f in fetch_loop(lyr, fids)] == \
+               [f.id() for f in fetch_ordered_feats(lyr, fids, SRC_FIELDS)]
+
+        print('%9d %8.2f %9.2f %7.1fx' % (n, loop, batch, loop/batch))
+
+if __name__ == '__main__':
+    qgs = start_qgis()
+    main()
+    qgs.exitQgis()
@@ -0,0 +1,62 @@
+# Source index build against a warm start from the disk cache (index_cache.IndexDiskCache):
+#   cold - registry.get_now with an empty cache, bulk load from the layer, the cache file is then written
+#   warm - registry.get_now in a new registry, bulk load from the cache file
+# Both include the attribute cache pass. Also checks both indexes give the same neighbors
+# Run for an index in the layer CRS and one reprojected to another CRS (Index in Target CRS),
+# the warm start skips reading the Source geometry and, for the second one, reprojecting it
+#   QT_QPA_PLATFORM=offscreen python benchmarks/bench_index_cache.py
+
+# Python
+from time import perf_counter
+import tempfile
+
+from common import crs
+from common import make_line_layer
+from common import make_point_layer
+from common import start_qgis
+from common import to_gpkg
+
+SIZES      = [100000, 1000000]
+INDEX_CRS  = {'layer': None, 'reprojected': 'EPSG:32631'}
+NQUERIES   = 200
+NEIGHBORS  = 10
+SRC_FIELDS = ['name', 'type']
+
+def timed_get(registry, lyr, index_crs):
+    t0    = perf_counter()
+    entry = registry.get_now(lyr, SRC_FIELDS, index_crs)
+
+    return entry, perf_counter() - t0
+
+def main():
+    from src.index_cache    import IndexDiskCache
+    from src.index_registry import SpatialIndexRegistry
+
+    geoms = [f.geometry() for f in make_point_layer(NQUERIES).getFeatures()]
+
+    print('%-8s %-12s %8s %8s %8s %8s %9s' % ('size', 'index_crs', 'cold_s', 'save_s', 'warm_s', 'speedup', 'same'))
+    for size in SIZES:
+        lyr = to_gpkg(make_line_layer(size), 'source')
+        for name, authid in INDEX_CRS.items():
+            index_crs = crs(authid) if authid else None
+            cache     = IndexDiskCache(tempfile.mkdtemp(prefix = 'getfeats_cache_'))
+
+            # Cold build without saving, then the save on its own
+            cold_entry, cold_s = timed_get(SpatialIndexRegistry(), lyr, index_crs)
+            t0 = perf_counter()
+            cache.save(cache.lyr_fpath(lyr, cold_entry.crs if index_crs else None), cold_entry.index,
+                       cold_entry.attr_cache.fids)
+            save_s = perf_counter() - t0
+
+            warm_entry, warm_s = timed_get(SpatialIndexRegistry(cache), lyr, index_crs)
+
+            # Both indexes get the same query points, only the neighbor order is compared
+            same = sum(cold_entry.index.nearestNeighbor(g, NEIGHBORS) == warm_entry.index.nearestNeighbor(g, NEIGHBORS)
+                       for g in geoms)
+            print('%-8d %-12s %8.2f %8.2f %8.2f %7.1fx %5d/%d' %
+                  (size, name, cold_s, save_s, warm_s, cold_s/warm_s, same, NQUERIES))
+
+if __name__ == '__main__':
+    qgs = start_qgis()
+    main()
+    qgs.exitQgis()
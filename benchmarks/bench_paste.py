@@ -0,0 +1,48 @@
+# Compare the quick copy/paste write paths against the Target layer size:
+#   provider - changeAttributeValues on the data provider, reloadData and reselect
+#   buffer   - one edit command in the layer edit buffer, value read back with getFeature
+# Both use the same calls as QuickCopyPaste.paste_provider / paste_buffered
+
+# Python
+from common import make_point_layer
+from common import start_qgis
+from common import time_ms
+from common import to_gpkg
+
+NFEATS  = [10000, 100000, 500000]
+REPEATS = 10
+
+def paste_provider(lyr, fid, fld_idx, val):
+    lyr.dataProvider().changeAttributeValues({fid: {fld_idx: val}})
+    lyr.dataProvider().reloadData()
+    lyr.select(fid)
+
+    return lyr.selectedFeatures()[0][fld_idx]
+
+def paste_buffer(lyr, fid, fld_idx, val):
+    lyr.beginEditCommand('bench paste')
+    lyr.changeAttributeValue(fid, fld_idx, val)
+    lyr.endEditCommand()
+
+    return lyr.getFeature(fid)[fld_idx]
+
+def main():
+    print('   nfeats  provider_ms  buffer_ms  speedup')
+    for n in NFEATS:
+        lyr     = to_gpkg(make_point_layer(n))
+        fld_idx = lyr.fields().lookupField('Name')
+        fid     = next(lyr.getFeatures()).id()
+        lyr.selectByIds([fid])
+        lyr.startEditing()
+
+        provider = time_ms(lambda: paste_provider(lyr, fid, fld_idx, 'road 1'), REPEATS)
+        buffer   = time_ms(lambda: paste_buffer(lyr, fid, fld_idx, 'road 2'), REPEATS)
+        assert paste_buffer(lyr, fid, fld_idx, 'road 3') == 'road 3'
+
+        lyr.rollBack()
+        print('%9d %12.2f %10.2f %7.1fx' % (n, provider, buffer, provider/buffer))
+
+if __name__ == '__main__':
+    qgs = start_qgis()
+    main()
+    qgs.exitQgis()
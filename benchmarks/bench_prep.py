@@ -0,0 +1,64 @@
+# Compare the two custom prep contracts on the custom_prep_lotr.py logic:
+#   layer  - the old custom_prep(clean_lyr), run through pipeline.layer_stage (memory layer per call)
+#   record - the ported prep_rows(rows, fields), plain tuples/dicts
+# Both must give the same rows
+
+# QGIS Core
+from qgis.core import QgsFeature
+
+# Python
+from common import start_qgis
+from common import time_ms
+
+NROWS      = [5, 50, 500]
+OUT_FIELDS = ['Heading', 'Name', 'Type']
+DIRECTIONS = ['NULL', 'N', 'E', 'S', 'W']
+
+# custom_prep_lotr.py before the port, kept here as the baseline
+def legacy_custom_prep(clean_lyr):
+    nfeats = clean_lyr.featureCount()
+    if nfeats <= len(DIRECTIONS):
+        for i in range(1, len(DIRECTIONS) + 1 - nfeats):
+            clean_lyr.dataProvider().addFeatures([QgsFeature()])
+
+    features = []
+    cnt      = 0
+    for f in clean_lyr.getFeatures():
+        if cnt <= (len(DIRECTIONS) - 1):
+            f.setAttribute('Heading', DIRECTIONS[cnt])
+            cnt += 1
+        for i in ['Name', 'Type']:
+            if str(f.attribute(i)) != 'NULL':
+                newval = str(f.attribute(i)).title()
+            else:
+                newval = str(f.attribute(i))
+            f.setAttribute(i, newval)
+        features.append(f)
+
+    return features
+
+def make_rows(n):
+    return [('NULL', 'ROAD ' + str(i), ['highway', 'track'][i % 2]) for i in range(n)]
+
+def main():
+    from src.custom_prep.custom_prep_lotr import prep_rows
+    from src.pipeline                      import chain_stages
+    from src.pipeline                      import layer_stage
+
+    layer  = chain_stages([layer_stage(legacy_custom_prep)])
+    record = chain_stages([prep_rows])
+
+    print('  nrows  layer_ms  record_ms  speedup')
+    for n in NROWS:
+        rows = make_rows(n)
+        assert [[str(x) for x in r] for r in layer(rows, OUT_FIELDS)] == \
+               [[str(x) for x in r] for r in record(rows, OUT_FIELDS)]
+
+        t_layer  = time_ms(lambda: layer(rows, OUT_FIELDS))
+        t_record = time_ms(lambda: record(rows, OUT_FIELDS))
+        print('%7d %9.3f %10.3f %7.1fx' % (n, t_layer, t_record, t_layer/t_record))
+
+if __name__ == '__main__':
+    qgs = start_qgis()
+    main()
+    qgs.exitQgis()
@@ -0,0 +1,111 @@
+# Plugin cost at QGIS startup, each run in a fresh Python process so module imports count:
+#   load       - import of the plugin package, classFactory and initGui, what QGIS does while loading plugins
+#   first_open - the first run(), which builds the dialog now that it is lazy
+# Modes:
+#   before - the dialog built during load from the .ui file (loadUiType), as every startup did before
+#   lazy   - the dialog built on first open from the compiled form
+# The first lazy run also compiles the form (dialog.load_form_class), it is shown on its own
+# Then the plugin modules still imported during load, with their own and cumulative import time
+# from python -X importtime, the rest are imported by the first open:
+#   QT_QPA_PLATFORM=offscreen python benchmarks/bench_startup.py
+
+# Python
+from statistics import median
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+
+from common import REPO_DIR
+
+NRUNS = 5
+
+# Runs in the child process
+def measure(mode):
+    from time import perf_counter
+
+    from common import start_qgis_iface
+    qgs = start_qgis_iface()
+    import qgis.utils
+
+    # Without compileUi the dialog falls back to loadUiType
+    if mode == 'before':
+        from qgis.PyQt import uic
+        uic.compileUi = None
+
+    t0   = perf_counter()
+    spec = importlib.util.spec_from_file_location('getfeats_plugin', os.path.join(REPO_DIR, '__init__.py'),
+                                                  submodule_search_locations = [REPO_DIR])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['getfeats_plugin'] = module
+    spec.loader.exec_module(module)
+    plugin = module.classFactory(qgis.utils.iface)
+    plugin.initGui()
+    if mode == 'before':
+        plugin.dlg
+    load_ms = 1000*(perf_counter() - t0)
+    load_modules = sorted(x for x in sys.modules if x.startswith('getfeats_plugin.'))
+
+    t0 = perf_counter()
+    plugin.run()
+    first_open_ms = 1000*(perf_counter() - t0)
+
+    plugin.unload()
+    print(json.dumps({'load_ms': load_ms, 'first_open_ms': first_open_ms, 'load_modules': load_modules}))
+
+# Lines of -X importtime: 'import time: self [us] | cumulative | imported package'
+def parse_importtime(stderr):
+    times = {}
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            self_us, cum_us, name = line[len('import time:'):].split('|')
+            if self_us.strip().isdigit():
+                times[name.strip()] = (int(self_us), int(cum_us))
+
+    return times
+
+def run_child(mode, importtime = False):
+    env  = dict(os.environ, QT_QPA_PLATFORM = os.environ.get('QT_QPA_PLATFORM', 'offscreen'))
+    args = [sys.executable] + (['-X', 'importtime'] if importtime else []) + \
+           [os.path.abspath(__file__), '--child', mode]
+    proc = subprocess.run(args, env = env, capture_output = True, text = True, check = True)
+    res  = json.loads(proc.stdout.strip().splitlines()[-1])
+    if importtime:
+        res['importtime'] = parse_importtime(proc.stderr)
+
+    return res
+
+def main():
+    parser = argparse.ArgumentParser(description = 'GetFeats plugin startup cost')
+    parser.add_argument('--child', choices = ['before', 'lazy'], help = argparse.SUPPRESS)
+    parser.add_argument('--runs',  type = int, default = NRUNS)
+    args = parser.parse_args()
+    if args.child:
+        measure(args.child)
+        return
+
+    # Start without a compiled form, as after installing or updating the plugin
+    form_fpath = os.path.join(REPO_DIR, 'src', 'dialog_ui', 'dialog_base_ui.py')
+    if os.path.exists(form_fpath):
+        os.remove(form_fpath)
+
+    print('%-16s %10s %14s' % ('mode', 'load_ms', 'first_open_ms'))
+    for mode in ['before', 'lazy (compile)', 'lazy']:
+        nruns = 1 if mode == 'lazy (compile)' else args.runs
+        res   = [run_child(mode.split()[0]) for _ in range(nruns)]
+        print('%-16s %10.1f %14.1f' % (mode, median(x['load_ms'] for x in res),
+                                       median(x['first_open_ms'] for x in res)))
+
+    res   = run_child('lazy', importtime = True)
+    times = res['importtime']
+    print()
+    print('%-40s %8s %8s' % ('module imported at load', 'self_ms', 'cum_ms'))
+    for name in sorted(res['load_modules'], key = lambda x: -times.get(x, (0, 0))[1]):
+        self_us, cum_us = times.get(name, (0, 0))
+        print('%-40s %8.1f %8.1f' % (name.replace('getfeats_plugin.', ''), self_us/1000, cum_us/1000))
+    print('%-40s %8.1f' % ('total (self)', sum(times.get(x, (0, 0))[0] for x in res['load_modules'])/1000))
+
+if __name__ == '__main__':
+    main()
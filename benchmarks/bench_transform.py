@@ -0,0 +1,98 @@
+# Per-selection cost of preparing the query geometry in getfeats:
+#   per_event - new QgsCoordinateTransform and unit factor on every selection (the original approach)
+#   cached    - crs_cache.CrsCache, one transform and factor per CRS pair
+#   target    - Source index built in the Target CRS, no reprojection at all
+# Also checks the neighbors match between the Source CRS and Target CRS indexes
+
+# QGIS Core
+from qgis.core import QgsCoordinateTransform
+from qgis.core import QgsGeometry
+from qgis.core import QgsProject
+from qgis.core import QgsUnitTypes
+
+# Python
+from common import crs
+from common import make_line_layer
+from common import make_point_layer
+from common import start_qgis
+from common import time_ms
+
+NFEATS       = 100000
+NQUERIES     = 1000
+NEIGHBORS    = 50
+MAX_DISTANCE = 500
+SRC_FIELDS   = ['name', 'type']
+
+def per_event(target_ft, target_crs, source_crs):
+    tr   = QgsCoordinateTransform(target_crs, source_crs, QgsProject.instance())
+    geom = QgsGeometry(target_ft.geometry())
+    geom.transform(tr)
+    mult = QgsUnitTypes.fromUnitToUnitFactor(QgsUnitTypes.DistanceUnit(0), source_crs.mapUnits())
+
+    return geom, MAX_DISTANCE*mult
+
+def cached(crs_cache, target_ft, target_crs, index_crs):
+    tr   = crs_cache.transform(target_crs, index_crs)
+    geom = target_ft.geometry()
+    if tr is not None:
+        geom = QgsGeometry(geom)
+        geom.transform(tr)
+
+    return geom, MAX_DISTANCE*crs_cache.unit_factor(index_crs)
+
+def run_queries(prepare, index, target_feats):
+    for target_ft in target_feats:
+        geom, max_dist = prepare(target_ft)
+        index.nearestNeighbor(geom, neighbors = NEIGHBORS, maxDistance = max_dist)
+
+def main():
+    from src.crs_cache      import CrsCache
+    from src.index_registry import SpatialIndexRegistry
+
+    # Source in Web Mercator, Target points moved to UTM over the same area
+    source_lyr   = make_line_layer(NFEATS, crs = 'EPSG:3857')
+    target_lyr   = make_point_layer(NQUERIES, crs = 'EPSG:3857')
+    target_feats = list(target_lyr.getFeatures())
+
+    utm_crs = crs('EPSG:32631')
+    to_utm  = QgsCoordinateTransform(target_lyr.crs(), utm_crs, QgsProject.instance())
+    for f in target_feats:
+        geom = QgsGeometry(f.geometry())
+        geom.transform(to_utm)
+        f.setGeometry(geom)
+
+    crs_cache = CrsCache()
+    src_reg   = SpatialIndexRegistry()
+    tgt_reg   = SpatialIndexRegistry()
+    src_entry = src_reg.get_now(source_lyr, SRC_FIELDS)
+    tgt_entry = tgt_reg.get_now(source_lyr, SRC_FIELDS, utm_crs)
+
+    tests = [('per_event', lambda f: per_event(f, utm_crs, source_lyr.crs()),         src_entry.index),
+             ('cached',    lambda f: cached(crs_cache, f, utm_crs, src_entry.crs),    src_entry.index),
+             ('target',    lambda f: cached(crs_cache, f, utm_crs, tgt_entry.crs),    tgt_entry.index)]
+
+    print('%d queries, %d neighbors' % (NQUERIES, NEIGHBORS))
+    print('mode       prep_us  total_us')
+    base = None
+    for name, prepare, index in tests:
+        prep_ms  = time_ms(lambda: [prepare(f) for f in target_feats], repeats = 5)
+        total_ms = time_ms(lambda: run_queries(prepare, index, target_feats), repeats = 5)
+        base     = base or prep_ms
+        print('%-9s %8.1f %9.1f   prep %.1fx' % (name, 1000*prep_ms/NQUERIES, 1000*total_ms/NQUERIES, base/prep_ms))
+
+    # Nearest first order is the same for both indexes, unless two segments tie within the reprojection error
+    nmatch = 0
+    for f in target_feats:
+        geom, _ = per_event(f, utm_crs, source_lyr.crs())
+        nns_src = src_entry.index.nearestNeighbor(geom, neighbors = 5)
+        nns_tgt = tgt_entry.index.nearestNeighbor(f.geometry(), neighbors = 5)
+        nmatch += nns_src[:1] == nns_tgt[:1]
+    print('same nearest feature: %d/%d' % (nmatch, NQUERIES))
+
+    src_reg.clear()
+    tgt_reg.clear()
+
+if __name__ == '__main__':
+    qgs = start_qgis()
+    main()
+    qgs.exitQgis()
@@ -0,0 +1,117 @@
+# Checks the NumPy segment grid returns the same neighbors, in the same order, as QgsSpatialIndex
+#   built    - both indexes freshly built from the Source layer
+#   edited   - after adding, moving and deleting Source features in the edit buffer
+#   batch    - segment_index.nearest_batch against one query at a time
+# Two features at exactly the same distance have no defined order in QgsSpatialIndex,
+# the grid orders them by fid; the random layers below have no such ties
+# Exits with 1 on any mismatch:
+#   QT_QPA_PLATFORM=offscreen python benchmarks/check_engine_parity.py
+
+# QGIS Core
+from qgis.core import QgsFeature
+from qgis.core import QgsGeometry
+from qgis.core import QgsPointXY
+
+# Python
+import random
+import sys
+
+from common import make_line_layer
+from common import make_point_layer
+from common import start_qgis
+
+NSOURCE      = 20000
+NQUERIES     = 500
+NEIGHBORS    = [1, 10, 50]
+MAX_DISTANCE = [0, 300, 3000]
+NEDITS       = 200
+SRC_FIELDS   = ['name', 'type']
+
+# Lines of 2 to 6 vertices, so features have more than one segment
+def add_polylines(lyr, nfeats, seed = 2):
+    rng   = random.Random(seed)
+    feats = []
+    for i in range(nfeats):
+        x, y = rng.uniform(0, 100000), rng.uniform(0, 100000)
+        pts  = [QgsPointXY(x, y)]
+        for _ in range(rng.randint(1, 5)):
+            x, y = x + rng.uniform(-200, 200), y + rng.uniform(-200, 200)
+            pts.append(QgsPointXY(x, y))
+        f = QgsFeature(lyr.fields())
+        f.setGeometry(QgsGeometry.fromPolylineXY(pts))
+        f.setAttributes(['multi ' + str(i), 'road'])
+        feats.append(f)
+    lyr.dataProvider().addFeatures(feats)
+    lyr.updateExtents()
+
+def compare(name, qgis_index, numpy_index, geoms):
+    nbad = 0
+    for neighbors in NEIGHBORS:
+        for max_dist in MAX_DISTANCE:
+            for geom in geoms:
+                expected = qgis_index.nearestNeighbor(geom, neighbors = neighbors, maxDistance = max_dist)
+                found    = numpy_index.nearestNeighbor(geom, neighbors = neighbors, maxDistance = max_dist)
+                if expected != found:
+                    nbad += 1
+                    if nbad <= 5:
+                        print('  mismatch', neighbors, max_dist, geom.asWkt(), expected[:5], found[:5])
+    print('%-7s %d mismatches over %d queries' % (name, nbad, len(geoms)*len(NEIGHBORS)*len(MAX_DISTANCE)))
+
+    return nbad
+
+# Moves, deletes and adds features through the edit buffer, the indexes follow the layer signals
+def edit_source(lyr, seed = 3):
+    rng  = random.Random(seed)
+    fids = rng.sample(lyr.allFeatureIds(), 2*NEDITS)
+    lyr.startEditing()
+    for fid in fids[:NEDITS]:
+        geom = QgsGeometry(lyr.getFeature(fid).geometry())
+        geom.translate(rng.uniform(-500, 500), rng.uniform(-500, 500))
+        lyr.changeGeometry(fid, geom)
+    lyr.deleteFeatures(fids[NEDITS:])
+    for i in range(NEDITS):
+        x, y = rng.uniform(0, 100000), rng.uniform(0, 100000)
+        f = QgsFeature(lyr.fields())
+        f.setGeometry(QgsGeometry.fromPolylineXY([QgsPointXY(x, y), QgsPointXY(x + 100, y + 50)]))
+        f.setAttributes(['new ' + str(i), 'road'])
+        lyr.addFeature(f)
+
+def main():
+    from src.index_registry import SpatialIndexRegistry
+    from src.index_task     import numpy_available
+
+    if not numpy_available():
+        print('numpy is not installed')
+        sys.exit(1)
+
+    source = make_line_layer(NSOURCE)
+    add_polylines(source, NSOURCE//4)
+    target = make_point_layer(NQUERIES)
+    geoms  = [f.geometry() for f in target.getFeatures()]
+
+    qgis_reg  = SpatialIndexRegistry()
+    numpy_reg = SpatialIndexRegistry()
+    qgis_idx  = qgis_reg.get_now(source, SRC_FIELDS, None, 'qgis').index
+    numpy_idx = numpy_reg.get_now(source, SRC_FIELDS, None, 'numpy').index
+
+    nbad  = compare('built', qgis_idx, numpy_idx, geoms)
+    edit_source(source)
+    nbad += compare('edited', qgis_idx, numpy_idx, geoms)
+
+    batch = numpy_idx.nearest_batch(geoms, 10, 3000)
+    nbad_batch = sum(fids != numpy_idx.nearestNeighbor(geom, neighbors = 10, maxDistance = 3000)
+                     for geom, fids in zip(geoms, batch))
+    print('%-7s %d mismatches over %d queries' % ('batch', nbad_batch, len(geoms)))
+
+    source.rollBack()
+    qgis_reg.clear()
+    numpy_reg.clear()
+
+    if nbad + nbad_batch:
+        sys.exit(1)
+    print('OK')
+
+if __name__ == '__main__':
+    qgs = start_qgis()
+    main()
+    qgs.exitQgis()
@@ -0,0 +1,153 @@
+# Shared helpers for the benchmark scripts
+# Run the scripts with a Python that can import qgis, eg:
+#   QT_QPA_PLATFORM=offscreen python benchmarks/bench_fetch.py
+
+# QGIS Core
+from qgis.core import QgsApplication
+from qgis.core import QgsCoordinateReferenceSystem
+from qgis.core import QgsFeature
+from qgis.core import QgsField
+from qgis.core import QgsGeometry
+from qgis.core import QgsPointXY
+from qgis.core import QgsVectorFileWriter
+from qgis.core import QgsVectorLayer
+
+# PyQt
+from qgis.PyQt.QtCore import QMetaType
+
+# Python
+from statistics import median
+from time       import perf_counter
+import os
+import random
+import sys
+import tempfile
+
+# Make the plugin modules importable as src.*
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+ROAD_TYPES = ['highway', 'road', 'track', 'path']
+CHUNK      = 100000
+
+# Same area (~100 km square) in a projected and a geographic CRS, as (crs, origin, extent)
+AREAS = {'projected':  ('EPSG:3857', (0, 0), 100000),
+         'geographic': ('EPSG:4326', (5, 45), 1)}
+
+def start_qgis():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+
+    return qgs
+
+# GUI application with the test settings of qgis.testing and its mocked interface as
+# qgis.utils.iface, so the dialog and input checks can be built headless
+# Call before importing the plugin modules, they bind iface on import
+def start_qgis_iface():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from qgis.testing        import start_app
+    from qgis.testing.mocked import get_iface
+    import qgis.utils
+
+    qgs = start_app()
+    qgis.utils.iface = get_iface()
+
+    return qgs
+
+# Random short line segments spread over a square extent, added in chunks to bound memory
+def make_line_layer(nfeats, crs = 'EPSG:3857', extent = 100000, seed = 0, origin = (0, 0)):
+    rng = random.Random(seed)
+    lyr = QgsVectorLayer('LineString?crs=' + crs, 'bench_source', 'memory')
+    provider = lyr.dataProvider()
+    provider.addAttributes([QgsField('name', QMetaType.Type.QString),
+                            QgsField('type', QMetaType.Type.QString)])
+    lyr.updateFields()
+
+    x0, y0   = origin
+    seg_len  = extent/1000
+    features = []
+    for i in range(nfeats):
+        x, y = x0 + rng.uniform(0, extent), y0 + rng.uniform(0, extent)
+        pts  = [QgsPointXY(x, y), QgsPointXY(x + rng.uniform(-seg_len, seg_len),
+                                             y + rng.uniform(-seg_len, seg_len))]
+        f = QgsFeature(lyr.fields())
+        f.setGeometry(QgsGeometry.fromPolylineXY(pts))
+        f.setAttributes(['road ' + str(i % 5000), ROAD_TYPES[i % len(ROAD_TYPES)]])
+        features.append(f)
+        if len(features) == CHUNK:
+            provider.addFeatures(features)
+            features = []
+    provider.addFeatures(features)
+    lyr.updateExtents()
+
+    return lyr
+
+# Random points over the same extent as make_line_layer
+def make_point_layer(nfeats, crs = 'EPSG:3857', extent = 100000, seed = 1, origin = (0, 0)):
+    rng = random.Random(seed)
+    lyr = QgsVectorLayer('Point?crs=' + crs, 'bench_target', 'memory')
+    provider = lyr.dataProvider()
+    provider.addAttributes([QgsField('fid', QMetaType.Type.LongLong),
+                            QgsField('Name', QMetaType.Type.QString),
+                            QgsField('Type', QMetaType.Type.QString)])
+    lyr.updateFields()
+
+    x0, y0   = origin
+    features = []
+    for i in range(nfeats):
+        f = QgsFeature(lyr.fields())
+        f.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x0 + rng.uniform(0, extent), y0 + rng.uniform(0, extent))))
+        f.setAttributes([i + 1, None, None])
+        features.append(f)
+        if len(features) == CHUNK:
+            provider.addFeatures(features)
+            features = []
+    provider.addFeatures(features)
+    lyr.updateExtents()
+
+    return lyr
+
+# Source and Target layers over one of AREAS, storage is 'memory' or 'gpkg'
+def make_layers(nsource, ntarget, area = 'projected', storage = 'memory'):
+    crs, origin, extent = AREAS[area]
+    source = make_line_layer(nsource, crs, extent, origin = origin)
+    target = make_point_layer(ntarget, crs, extent, origin = origin)
+    if storage == 'gpkg':
+        source = to_gpkg(source, 'source')
+        target = to_gpkg(target, 'target')
+
+    return source, target
+
+# Copy a layer to a temporary GeoPackage and load it back
+def to_gpkg(lyr, name = None):
+    name  = name or lyr.name()
+    fpath = os.path.join(tempfile.mkdtemp(prefix = 'getfeats_bench_'), name + '.gpkg')
+    opts  = QgsVectorFileWriter.SaveVectorOptions()
+    opts.driverName = 'GPKG'
+    opts.layerName  = name
+    QgsVectorFileWriter.writeAsVectorFormatV3(lyr, fpath, lyr.transformContext(), opts)
+
+    return QgsVectorLayer(fpath + '|layername=' + name, name, 'ogr')
+
+def crs(authid):
+    return QgsCoordinateReferenceSystem(authid)
+
+# Resident memory of this process in MB, C++ allocations included (Linux)
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as infile:
+            return int(infile.read().split()[1])*os.sysconf('SC_PAGE_SIZE')/1024/1024
+    except (OSError, ValueError):
+        return 0
+
+# Median wall time in ms over a number of repeats
+def time_ms(func, repeats = 20):
+    times = []
+    for _ in range(repeats):
+        t0 = perf_counter()
+        func()
+        times.append((perf_counter() - t0)*1000)
+
+    return median(times)
@@ -0,0 +1,59 @@
+# Compare two suite.py reports, eg before and after a change:
+#   python benchmarks/compare.py before.json after.json --threshold 1.2
+# Prints the ratio of every timing, exits with 1 when one got slower than the threshold
+
+# Python
+import argparse
+import json
+import sys
+
+# Lower is better for all of these
+METRICS = {'index':     ['seconds', 'rss_delta_mb'],
+           'selection': ['p50_ms', 'p95_ms'],
+           'paste':     ['median_ms'],
+           'render':    ['median_ms']}
+
+def load(fpath):
+    with open(fpath) as infile:
+        report = json.load(infile)
+
+    return report['meta'], {(x['bench'], json.dumps(x['params'], sort_keys = True)): x['metrics']
+                            for x in report['results']}
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Compare two GetFeats benchmark reports')
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type = float, default = 1.2, help = 'Slowdown ratio flagged as regression')
+    args = parser.parse_args()
+
+    old_meta, old = load(args.old)
+    new_meta, new = load(args.new)
+    print('old:', old_meta.get('commit'), old_meta.get('ts'))
+    print('new:', new_meta.get('commit'), new_meta.get('ts'))
+    print('%-10s %-14s %12s %12s %7s  params' % ('bench', 'metric', 'old', 'new', 'ratio'))
+
+    regressions = 0
+    for key in sorted(set(old) & set(new)):
+        bench, params = key
+        for metric in METRICS.get(bench, []):
+            old_val = old[key].get(metric)
+            new_val = new[key].get(metric)
+            if not old_val or new_val is None:
+                continue
+            ratio = new_val/old_val
+            flag  = ''
+            if ratio > args.threshold:
+                flag = '  REGRESSION'
+                regressions += 1
+            print('%-10s %-14s %12.3f %12.3f %7.2f  %s%s' % (bench, metric, old_val, new_val, ratio, params, flag))
+
+    missing = len(set(old) ^ set(new))
+    if missing:
+        print(missing, 'results only in one report, not compared')
+    print(regressions, 'regressions over', args.threshold)
+
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,224 @@
+# Headless benchmark suite of the plugin code paths, on synthetic layers
+#   index     - Source index build (registry.get_now), time and resident memory
+#   selection - getfeats per selected point, over a NEIGHBORS x MAX_DISTANCE grid
+#   paste     - quick copy/paste of one cell (qcp.copycell), both paste modes, journal write included
+#   render    - dialog.update_table with a repaint of the table view
+# Settings and the paste journal go to the qgis.testing profile, not the user profile
+# Results are written as one JSON report, compare two reports with compare.py:
+#   QT_QPA_PLATFORM=offscreen python benchmarks/suite.py --sizes 10000 100000 --out before.json
+#   python benchmarks/compare.py before.json after.json
+
+# Python
+from datetime   import datetime
+from time       import perf_counter
+import argparse
+import json
+import platform
+import subprocess
+
+from common import AREAS
+from common import REPO_DIR
+from common import make_layers
+from common import rss_mb
+from common import start_qgis_iface
+from common import time_ms
+
+SIZES        = [10000, 100000, 1000000]
+FULL_SIZES   = SIZES + [5000000]
+NTARGET      = 1000
+NQUERIES     = 200
+NEIGHBORS    = [10, 50, 200]
+MAX_DISTANCE = [100, 1000, 10000]
+NROWS        = [5, 50, 500]
+SRC_FIELDS   = ['name', 'type']
+OUT_FIELDS   = ['Name', 'Type']
+FIELDMAP     = dict(zip(OUT_FIELDS, SRC_FIELDS))
+
+# The GetFeatsPlugin attributes getfeats uses, built from the same components
+# The result cache is off so every selection runs the whole pipeline
+class BenchPlugin:
+
+    def __init__(self, dlg, engine = 'qgis'):
+        from src.crs_cache        import CrsCache
+        from src.index_registry   import SpatialIndexRegistry
+        from src.input_check      import InputCheck
+        from src.latency          import LatencyRecorder
+        from src.layer_registry   import LayerRegistry
+        from src.prep_runner      import PrepRunner
+        from src.quick_copy_paste import QuickCopyPaste
+        from src.result_cache     import ResultCache
+        from src.scheduler        import SelectionScheduler
+
+        self.dlg          = dlg
+        self.layers       = LayerRegistry()
+        self.chk          = InputCheck(self.layers)
+        self.qcp          = QuickCopyPaste(dlg, self.chk)
+
+        # No attribute table can be open headless, the paste checks pass as if it were
+        self.chk.check_attr_table_open = lambda lyr: True
+        self.idx_reg      = SpatialIndexRegistry()
+        self.result_cache = ResultCache(0)
+        self.sched        = SelectionScheduler(None, 0)
+        self.crs_cache    = CrsCache()
+        self.latency      = LatencyRecorder(True, window = NQUERIES)
+        self.prep         = PrepRunner(0)
+
+        self.engine            = engine
+        self.source_lyr_last   = []
+        self.pending_selection = False
+
+    def update_src_lyr_hist(self):
+        self.source_lyr_last = self.dlg.sourceLayer.currentLayer().id()
+
+    def src_index_crs(self, target_lyr):
+        return None
+
+    def src_index_engine(self, source_lyr, target_lyr):
+        return self.engine
+
+def bench_index(obj, source):
+    obj.idx_reg.clear()
+    rss0 = rss_mb()
+    t0   = perf_counter()
+    obj.idx_reg.get_now(source, SRC_FIELDS, None, obj.engine)
+    secs = perf_counter() - t0
+
+    return {'seconds':        secs,
+            'features_per_s': source.featureCount()/secs if secs else 0,
+            'rss_delta_mb':   rss_mb() - rss0,
+            'rss_mb':         rss_mb()}
+
+def bench_selection(obj, source, target, neighbors, max_distance):
+    from src.getfeats import getfeats
+
+    fids = target.allFeatureIds()[:NQUERIES]
+    obj.latency.clear()
+    for fid in fids:
+        target.selectByIds([fid])
+        obj.chk.clear_valid_feature()
+        obj.latency.begin()
+        getfeats(obj, target, source, SRC_FIELDS, OUT_FIELDS, FIELDMAP, max_distance, neighbors, False)
+        obj.latency.end()
+
+    summary = obj.latency.summary()
+    total   = summary.get('total', {})
+    result  = {'queries': len(fids),
+               'p50_ms':  total.get('p50', 0),
+               'p95_ms':  total.get('p95', 0),
+               'p99_ms':  total.get('p99', 0),
+               'max_ms':  total.get('max', 0)}
+    for stage, vals in summary.items():
+        if stage != 'total':
+            result[stage + '_p50_ms'] = vals['p50']
+
+    return result
+
+# Times qcp.copycell as a click on a table cell runs it, checks and journal write included
+def bench_paste(obj, target, buffered):
+    fid = target.allFeatureIds()[0]
+    target.selectByIds([fid])
+    target.startEditing()
+    obj.chk.clear_valid_feature()
+    obj.dlg.bufferedPaste.setChecked(buffered)
+    obj.qcp.iface.activeLayer.return_value = target
+    vals = ['road 1', 'road 2']
+
+    def paste():
+        vals.reverse()
+        obj.qcp.copycell('Name', vals[0])
+        # In the plugin the Target edit signals do this
+        obj.chk.clear_valid_feature()
+
+    paste_ms = time_ms(paste)
+    target.rollBack()
+
+    return {'median_ms': paste_ms}
+
+# Alternates two row sets so every update changes the table
+def bench_render(obj, nrows):
+    view  = obj.dlg.tableView
+    rows  = [[('road ' + str(i + j), 'highway') for i in range(nrows)] for j in range(2)]
+
+    def render():
+        rows.reverse()
+        obj.dlg.update_table(OUT_FIELDS, rows[0])
+        view.viewport().repaint()
+
+    return {'median_ms': time_ms(render)}
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd = REPO_DIR, capture_output = True,
+                              text = True).stdout.strip()
+    except OSError:
+        return ''
+
+def main():
+    from qgis.core import Qgis
+    from qgis.core import QgsProject
+    from src.dialog import PluginDialog
+
+    parser = argparse.ArgumentParser(description = 'GetFeats benchmark suite')
+    parser.add_argument('--sizes',   type = int, nargs = '+', default = SIZES, help = 'Source segment counts')
+    parser.add_argument('--full',    action = 'store_true', help = 'Sizes up to 5M segments')
+    parser.add_argument('--areas',   nargs = '+', default = list(AREAS), choices = list(AREAS))
+    parser.add_argument('--storage', nargs = '+', default = ['memory', 'gpkg'], choices = ['memory', 'gpkg'])
+    parser.add_argument('--engine',  default = 'qgis', choices = ['qgis', 'numpy'], help = 'Neighbor engine')
+    parser.add_argument('--out',     default = 'bench_report.json', help = 'JSON report path')
+    args = parser.parse_args()
+    if args.full:
+        args.sizes = FULL_SIZES
+
+    dlg = PluginDialog()
+    dlg.selectFeats.setChecked(True)
+    dlg.show()
+    obj = BenchPlugin(dlg, args.engine)
+
+    report = {'meta': {'ts':      datetime.now().isoformat(timespec = 'seconds'),
+                       'commit':  git_commit(),
+                       'qgis':    Qgis.version(),
+                       'python':  platform.python_version(),
+                       'engine':  args.engine,
+                       'machine': platform.platform()},
+              'results': []}
+
+    def add(bench, params, metrics):
+        report['results'].append({'bench': bench, 'params': params, 'metrics': metrics})
+        print(bench, params, {k: round(v, 3) for k, v in metrics.items()})
+
+    for size in args.sizes:
+        for area in args.areas:
+            for storage in args.storage:
+                source, target = make_layers(size, NTARGET, area, storage)
+                QgsProject.instance().addMapLayers([source, target])
+                dlg.sourceLayer.setLayer(source)
+                dlg.targetLayer.setLayer(target)
+                params = {'size': size, 'area': area, 'storage': storage}
+
+                add('index', params, bench_index(obj, source))
+                for neighbors in NEIGHBORS:
+                    for max_distance in MAX_DISTANCE:
+                        add('selection', dict(params, neighbors = neighbors, max_distance = max_distance),
+                            bench_selection(obj, source, target, neighbors, max_distance))
+
+                # Paste only depends on the Target layer
+                if size == args.sizes[0]:
+                    for buffered in [True, False]:
+                        add('paste', {'area': area, 'storage': storage, 'buffered': buffered},
+                            bench_paste(obj, target, buffered))
+
+                obj.idx_reg.clear()
+                QgsProject.instance().removeMapLayers([source.id(), target.id()])
+
+    for nrows in NROWS:
+        add('render', {'rows': nrows}, bench_render(obj, nrows))
+
+    with open(args.out, 'w') as outfile:
+        json.dump(report, outfile, indent = 1)
+    print('Report written to', args.out)
+
+    dlg.journal.close()
+
+if __name__ == '__main__':
+    qgs = start_qgis_iface()
+    main()
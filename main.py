@@ -1,6 +1,6 @@
 # QGIS Core
+from qgis.core import QgsApplication
 from qgis.core import QgsProject
-from qgis.core import QgsSpatialIndex
 
 # PyQt
 from qgis.PyQt.QtWidgets import QAction
@@ -10,26 +10,108 @@ from qgis.PyQt.QtGui     import QIcon
 import os.path
 
 # Plugin
-from .src.getfeats         import getfeats
-from .src.dialog           import PluginDialog
-from .src.input_check      import InputCheck
-from .src.quick_copy_paste import QuickCopyPaste
+# Only what initGui needs, the lookup modules are imported with the dialog, see init_dialog
+# index_task is loaded by the Processing provider anyway
+from .src.crs_cache      import CrsCache
+from .src.index_task     import engine_supports
+from .src.input_check    import InputCheck
+from .src.layer_registry import LayerRegistry
+from .src.provider       import GetFeatsProvider
+from .src.subscriptions  import SubscriptionManager
+
+# Target layer signals that invalidate the validated Target feature
+TARGET_EDIT_SIGNALS = ['geometryChanged', 'attributeValueChanged', 'featureDeleted', 'dataChanged', 'afterRollBack']
 
 class GetFeatsPlugin:
 
     def __init__(self, iface):
         self.iface      = iface
         self.plugin_dir = os.path.dirname(__file__)
-        self.dlg        = PluginDialog()
         self.msg        = self.iface.messageBar()
-        self.chk        = InputCheck()
-        self.qcp        = QuickCopyPaste(self.dlg)
+        self.layers     = LayerRegistry()
+        self.chk        = InputCheck(self.layers)
+        self.subs       = SubscriptionManager()
+        self.crs_cache  = CrsCache()
+
+        # Built on first use, see dlg
+        self._dlg = None
+
+        self.is_first_run      = True
+        self.source_lyr_last   = []
+        self.pending_selection = False
+
+    # The dialog is only built when first needed, so loading the plugin at QGIS startup
+    # costs the toolbar action and not the .ui file, stylesheet, file models and log folder
+    @property
+    def dlg(self):
+        if self._dlg is None:
+            self.init_dialog()
+
+        return self._dlg
+
+    def init_dialog(self):
+        # Loads the .ui form, see dialog.load_form_class
+        from .src.dialog           import PluginDialog
+        from .src.index_cache      import IndexDiskCache
+        from .src.index_registry   import SpatialIndexRegistry
+        from .src.latency          import LatencyRecorder
+        from .src.prep_runner      import PrepRunner
+        from .src.quick_copy_paste import QuickCopyPaste
+        from .src.result_cache     import ResultCache
+        from .src.scheduler        import SelectionScheduler
+
+        self._dlg         = PluginDialog()
+        self.qcp          = QuickCopyPaste(self.dlg, self.chk)
+        self.idx_cache    = IndexDiskCache(self.dlg.get_user_folder(), self.dlg.indexCacheMB.value())
+        self.idx_reg      = SpatialIndexRegistry(self.idx_cache)
+        self.result_cache = ResultCache(self.dlg.resultCacheSize.value())
+        self.sched        = SelectionScheduler(self.run_getfeats, self.dlg.debounceMs.value())
+        self.prep         = PrepRunner(self.dlg.prepBudgetMs.value())
+        self.latency      = LatencyRecorder(self.dlg.recordLatency.isChecked())
 
-        self.is_first_run       = True
-        self.target_lyr_history = []
-        self.source_lyr_last    = []
+        # Declare dialog connections
+        self.dlg.targetLayer.currentIndexChanged.connect(self.check_plugin_enabled)
+        self.dlg.sourceLayer.currentIndexChanged.connect(self.check_plugin_enabled)
+        self.dlg.activatePlugin.stateChanged.connect(self.check_plugin_enabled)
+        self.dlg.selection_model.selectionChanged.connect(lambda a, b: self.qcp.selected_cell(a, b))
+        self.dlg.indexCacheMB.valueChanged.connect(self.set_index_cache_size)
+
+        # Source index builds in the background
+        self.idx_reg.buildProgress.connect(self.on_index_progress)
+        self.idx_reg.buildFinished.connect(self.on_index_finished)
+        self.dlg.cancelIndexBuild.clicked.connect(self.idx_reg.cancel_all)
+
+        # Cached tables are dropped when their Source layer is edited
+        self.idx_reg.sourceEdited.connect(self.result_cache.invalidate_source)
+        self.dlg.resultCacheSize.valueChanged.connect(self.result_cache.set_max_entries)
+
+        # Selection events are debounced, only the latest one is looked up
+        self.dlg.debounceMs.valueChanged.connect(self.sched.set_debounce)
+
+        # Custom prep runs in a worker with a time budget
+        self.dlg.prepBudgetMs.valueChanged.connect(self.prep.set_budget)
+
+        # Source index in the Target CRS or another neighbor engine
+        self.dlg.indexInTargetCrs.toggled.connect(self.on_index_option_changed)
+        self.dlg.neighborEngine.currentIndexChanged.connect(self.on_index_option_changed)
+
+        # Fill many selected Target features at once
+        self.dlg.autoFill.clicked.connect(self.run_autofill)
+
+        # Diagnostics page
+        self.dlg.refreshDiagnostics.clicked.connect(self.refresh_diagnostics)
+        self.dlg.recordLatency.toggled.connect(self.latency.set_enabled)
+        self.dlg.clearLatency.clicked.connect(self.clear_latency)
+        self.dlg.exportLatency.clicked.connect(self.export_latency)
+        self.dlg.pageMenu.currentRowChanged['int'].connect(self.on_page_changed)
+
+    def initProcessing(self):
+        self.provider = GetFeatsProvider()
+        QgsApplication.processingRegistry().addProvider(self.provider)
 
     def initGui(self):
+        self.initProcessing()
+
         icon        = os.path.join(self.plugin_dir, 'img/icon.png')
         self.action = QAction(QIcon(icon), 'GetFeats', self.iface.mainWindow())
 
@@ -39,11 +121,8 @@ class GetFeatsPlugin:
         self.action.triggered.connect(self.run)
         self.toolbar.addAction(self.action)
 
-        # Declare dialog connections
-        self.dlg.targetLayer.currentIndexChanged.connect(self.check_plugin_enabled)
-        self.dlg.sourceLayer.currentIndexChanged.connect(self.check_plugin_enabled)
-        self.dlg.activatePlugin.stateChanged.connect(self.check_plugin_enabled)
-        self.dlg.selection_model.selectionChanged.connect(lambda a, b: self.qcp.selected_cell(a, b))
+        # Cached transforms follow the project transform context
+        QgsProject.instance().transformContextChanged.connect(self.crs_cache.clear)
 
         # Create Hotkey
         self.key_action = QAction('GetFeats', self.iface.mainWindow())
@@ -55,6 +134,19 @@ class GetFeatsPlugin:
         self.iface.removeToolBarIcon(self.action)
         self.iface.removePluginMenu('& GetFeats', self.action)
         self.iface.unregisterMainWindowAction(self.key_action)
+        QgsApplication.processingRegistry().removeProvider(self.provider)
+        self.subs.disconnect_all()
+        self.layers.stop()
+        self.chk.tables.stop()
+        QgsProject.instance().transformContextChanged.disconnect(self.crs_cache.clear)
+
+        # Nothing else to clean up when the dialog was never opened
+        if self._dlg is not None:
+            self.idx_reg.clear()
+            self.sched.cancel()
+            self.dlg.hide_index_progress()
+            self.dlg.journal.close()
+            self.prep.shutdown()
         del self.action
         del self.toolbar
 
@@ -62,58 +154,162 @@ class GetFeatsPlugin:
     ### Methods ###
     ############### 
     def update_src_lyr_hist(self):
-        self.source_lyr_last = self.dlg.sourceLayer.currentLayer().name()
+        self.source_lyr_last = self.dlg.sourceLayer.currentLayer().id()
 
+    # Only the current Target layer is connected, previous Target layers are disconnected
     def set_selchanged_conn(self):
         if self.chk.check_dialog_lyrs_exist(self.dlg):
-            TARGET_LYR_NAME = self.dlg.targetLayer.currentLayer().name()
-            target_lyr      = self.chk.check_lyr_valid(TARGET_LYR_NAME)
+            TARGET_LYR_ID = self.dlg.targetLayer.currentLayer().id()
+            target_lyr    = self.chk.check_lyr_valid(TARGET_LYR_ID)
             if target_lyr:
-                if TARGET_LYR_NAME not in self.target_lyr_history:
-                    target_lyr.selectionChanged.connect(self.run_getfeats)
-                    self.target_lyr_history.append(TARGET_LYR_NAME)
+                self.subs.retarget(target_lyr, 'selectionChanged', self.on_selection_changed)
+
+                # The validated Target feature is reused until the layer is edited
+                for signal_name in TARGET_EDIT_SIGNALS:
+                    self.subs.retarget(target_lyr, signal_name, self.chk.clear_valid_feature)
+                return
+
+        self.clear_selchanged_conn()
+
+    def clear_selchanged_conn(self):
+        self.subs.disconnect_all()
+        self.sched.cancel()
+        self.chk.clear_valid_feature()
+
+    def set_index_cache_size(self, max_mb):
+        self.idx_cache.max_mb = max_mb
 
     def check_plugin_enabled(self):
-        self.chk.check_dup_layernames(self.dlg)
         self.dlg.update_source_field_box()
         self.dlg.update_target_field_box()
         self.dlg.sourceLayer.setExceptedLayerList([self.dlg.targetLayer.currentLayer()])
         self.dlg.targetLayer.setExceptedLayerList([self.dlg.sourceLayer.currentLayer()])
 
+        # Project layer and attribute table tracking only runs while the plugin is active
         if self.dlg.activatePlugin.isChecked():
+            self.layers.start()
+            self.chk.tables.start()
             self.set_selchanged_conn()
             self.build_src_spatial_index()
+        else:
+            self.clear_selchanged_conn()
+            self.layers.stop()
+            self.chk.tables.stop()
 
 
     def build_src_spatial_index(self):
         if self.chk.check_dialog_lyrs_exist(self.dlg):
-            SOURCE_LYR_NAME = self.dlg.sourceLayer.currentLayer().name()
-            source_lyr      = self.chk.check_lyr_valid(SOURCE_LYR_NAME)
+            SOURCE_LYR_ID = self.dlg.sourceLayer.currentLayer().id()
+            source_lyr    = self.chk.check_lyr_valid(SOURCE_LYR_ID)
             if source_lyr:
-                self.spatial_idx = QgsSpatialIndex(source_lyr.getFeatures(), 
-                                   flags = QgsSpatialIndex.Flag.FlagStoreFeatureGeometries)
+                # Reuses the index of this layer if it was built before, otherwise starts a task
+                fld_names  = source_lyr.fields().names()
+                SRC_FIELDS = list(dict.fromkeys([x for x in self.dlg.extract_sourcefields() if x in fld_names]))
+                target_lyr = self.dlg.targetLayer.currentLayer()
+                self.idx_reg.get(source_lyr, SRC_FIELDS, self.src_index_crs(target_lyr),
+                                 self.src_index_engine(source_lyr, target_lyr))
+                if self.idx_reg.is_building(source_lyr.id()):
+                    self.dlg.show_index_progress(0)
+
                 self.dlg.update_nnNotes()
 
-                if SOURCE_LYR_NAME in self.target_lyr_history:
-                    self.msg.pushInfo('GetFeats:', 'Warning: ' + SOURCE_LYR_NAME + 
-                                      ' previously used as Target Layer. Consider restart to avoid lag.') 
 
+    # CRS to build the Source index in, None keeps the Source CRS
+    def src_index_crs(self, target_lyr):
+        if target_lyr and self.dlg.indexInTargetCrs.isChecked():
+            return self.crs_cache.index_crs(target_lyr)
+
+        return None
+
+    # Neighbor engine of the Source index, QGIS unless the NumPy grid is chosen and supports both layers
+    def src_index_engine(self, source_lyr, target_lyr):
+        if target_lyr and self.dlg.neighbor_engine() == 'numpy' and engine_supports(source_lyr, target_lyr):
+            return 'numpy'
+
+        return 'qgis'
+
+    # Distances change with the index CRS or engine, cached tables are dropped and the index rebuilt
+    def on_index_option_changed(self, *args):
+        self.result_cache.clear()
+        if self.dlg.activatePlugin.isChecked():
+            self.build_src_spatial_index()
+
+    def on_index_progress(self, lyr_id, progress):
+        self.dlg.show_index_progress(progress)
+
+    def on_index_finished(self, lyr_id, ok):
+        if not self.idx_reg.is_building():
+            self.dlg.hide_index_progress()
+
+        # Answer the selection made while the index was building
+        if ok and self.pending_selection:
+            self.pending_selection = False
+            self.replay_selection()
+
+    def replay_selection(self):
+        target_lyr = self.dlg.targetLayer.currentLayer()
+        if target_lyr:
+            sel_ids = target_lyr.selectedFeatureIds()
+            self.sched.schedule(sel_ids, [])
+
+    def on_page_changed(self, row):
+        if self.dlg.stackedWidget.widget(row) is self.dlg.page_6:
+            self.refresh_diagnostics()
+
+    def refresh_diagnostics(self):
+        engines     = sorted(set(entry.engine for entry in self.idx_reg.entries.values()))
+        index_stats = [('Indexed layers',    len(self.idx_reg.entries)),
+                       ('Engine',            ', '.join(engines) or '-'),
+                       ('Building',          'Yes' if self.idx_reg.is_building() else 'No'),
+                       ('Waiting selection', 'Yes' if self.pending_selection else 'No')]
+        self.dlg.set_diagnostics([('Selection Events', self.sched.stats()),
+                                  ('Result Cache',     self.result_cache.stats()),
+                                  ('Custom Prep',      self.prep.stats()),
+                                  ('Source Index',     index_stats),
+                                  ('CRS Cache',        self.crs_cache.stats()),
+                                  ('Latency',          self.latency.stats()),
+                                  ('Slowest Events',   self.latency.slowest_stats()),
+                                  ('Layer Signals',    self.subs.stats()),
+                                  ('Project Layers',   self.layers.stats()),
+                                  ('Attribute Tables', self.chk.tables.stats())])
+
+    def clear_latency(self):
+        self.latency.clear()
+        self.refresh_diagnostics()
+
+    def export_latency(self):
+        csv_fpath, json_fpath = self.latency.export(self.dlg.get_user_folder())
+        self.msg.pushInfo('GetFeats:', 'Timings exported to ' + os.path.basename(csv_fpath) + 
+                          ' and ' + os.path.basename(json_fpath))
+
+    def on_selection_changed(self, selected, deselected):
+        self.chk.clear_valid_feature()
+
+        # Selections made by quick copy/paste are skipped right away, the flag is reset before the timer fires
+        if self.qcp.did_select:
+            return
+
+        self.sched.schedule(selected, deselected)
 
     def run_getfeats(self, selected, deselected):
         active_flag   = self.dlg.activatePlugin.isChecked()
-        dup_flag      = self.chk.check_dup_layernames(self.dlg)
         dlg_lyrs_flag = self.chk.check_dialog_lyrs_exist(self.dlg)
         did_sel_flag  = self.qcp.did_select
-        all_flags     = active_flag and dup_flag and dlg_lyrs_flag and not did_sel_flag
+        all_flags     = active_flag and dlg_lyrs_flag and not did_sel_flag
 
         if not selected and all_flags:
             self.dlg.clear_table(self.dlg.extract_outfields())
 
         if selected and all_flags:
-            TARGET_LYR_NAME = self.dlg.targetLayer.currentLayer().name()
-            
-            if TARGET_LYR_NAME == self.iface.activeLayer().name():
-                SOURCE_LYR_NAME = self.dlg.sourceLayer.currentLayer().name()
+            # Timed from here, events stopped by the input checks are recorded as invalid
+            self.latency.begin()
+            self.latency.outcome('invalid')
+
+            TARGET_LYR_ID = self.dlg.targetLayer.currentLayer().id()
+            active_lyr    = self.iface.activeLayer()
+
+            if active_lyr and TARGET_LYR_ID == active_lyr.id():
+                SOURCE_LYR_ID = self.dlg.sourceLayer.currentLayer().id()
         
                 SRC_FIELDS0     = self.dlg.extract_sourcefields()
                 OUT_FIELDS      = self.dlg.extract_outfields()
@@ -123,8 +319,8 @@ class GetFeatsPlugin:
                 USE_CUSTOM_PREP = self.dlg.customPrep.isChecked()
 
                 if self.chk.check_same_length_src_out(SRC_FIELDS0, OUT_FIELDS):
-                    source_lyr = self.chk.check_lyr_valid(SOURCE_LYR_NAME)
-                    target_lyr = self.chk.check_lyr_valid(TARGET_LYR_NAME)
+                    source_lyr = self.chk.check_lyr_valid(SOURCE_LYR_ID)
+                    target_lyr = self.chk.check_lyr_valid(TARGET_LYR_ID)
                     out_flag   = self.chk.check_dup_outfields(OUT_FIELDS)
 
                     if target_lyr and source_lyr and out_flag:
@@ -132,23 +328,78 @@ class GetFeatsPlugin:
                         SRC_FIELDS = list(set([x for x in SRC_FIELDS0 if x in source_lyr.fields().names()]))
         
                         if SRC_FIELDS:
-                            getfeats(self, TARGET_LYR_NAME, SOURCE_LYR_NAME, 
+                            # Loaded with the dialog, see init_dialog
+                            from .src.getfeats import getfeats
+
+                            self.latency.outcome('table')
+                            getfeats(self, target_lyr, source_lyr, 
                                      SRC_FIELDS, OUT_FIELDS, FIELDMAP, 
                                      MAX_DISTANCE, NEIGHBORS, USE_CUSTOM_PREP)
                         else:
-                            self.msg.pushInfo('GetFeats:', 'No Source Fields found in ' + SOURCE_LYR_NAME)  
-
+                            self.msg.pushInfo('GetFeats:', 'No Source Fields found in ' + source_lyr.name())  
+
+            self.latency.end()
+
+
+    def run_autofill(self):
+        if not (self.dlg.activatePlugin.isChecked() and self.chk.check_dialog_lyrs_exist(self.dlg)):
+            self.msg.pushInfo('GetFeats:', 'Enable the plugin to use Auto-Fill')
+            return
+
+        SRC_FIELDS0     = self.dlg.extract_sourcefields()
+        OUT_FIELDS      = self.dlg.extract_outfields()
+        FIELDMAP        = dict(zip(OUT_FIELDS, SRC_FIELDS0))
+        FILL_FIELDS     = self.dlg.extract_fillfields()
+        MAX_DISTANCE    = self.dlg.maxDistance.value()
+        NEIGHBORS       = self.dlg.nNeighbors.value()
+        USE_CUSTOM_PREP = self.dlg.customPrep.isChecked()
+
+        if self.chk.check_same_length_src_out(SRC_FIELDS0, OUT_FIELDS) and self.chk.check_dup_outfields(OUT_FIELDS):
+            source_lyr = self.chk.check_lyr_valid(self.dlg.sourceLayer.currentLayer().id())
+            target_lyr = self.chk.check_lyr_valid(self.dlg.targetLayer.currentLayer().id())
+
+            if source_lyr and target_lyr and self.chk.check_layer_is_editable(target_lyr):
+                SRC_FIELDS  = list(set([x for x in SRC_FIELDS0 if x in source_lyr.fields().names()]))
+                bad_fields  = [x for x in FILL_FIELDS if x not in OUT_FIELDS or x == 'fid' or
+                               target_lyr.fields().lookupField(x) < 0]
+                FILL_FIELDS = [x for x in FILL_FIELDS if x not in bad_fields]
+                if bad_fields:
+                    self.msg.pushInfo('GetFeats:', 'Auto-Fill skips fields not in Output and ' + 
+                                      target_lyr.name() + ': ' + ', '.join(bad_fields))
+
+                if not SRC_FIELDS:
+                    self.msg.pushInfo('GetFeats:', 'No Source Fields found in ' + source_lyr.name())
+                elif not target_lyr.selectedFeatureCount():
+                    self.msg.pushInfo('GetFeats:', target_lyr.name() + ' has no feature selected')
+                elif FILL_FIELDS:
+                    from .src.auto_fill import auto_fill
+
+                    res = auto_fill(self, target_lyr, source_lyr, SRC_FIELDS, OUT_FIELDS, FIELDMAP,
+                                    FILL_FIELDS, MAX_DISTANCE, NEIGHBORS, USE_CUSTOM_PREP)
+                    if res is not None:
+                        counts, entries = res
+                        summary = 'Auto-filled ' + str(counts['features']) + ' features: ' + \
+                                  str(counts['changed'])   + ' changed, ' + \
+                                  str(counts['unchanged']) + ' unchanged, ' + \
+                                  str(counts['nomatch'])   + ' without match, ' + \
+                                  str(counts['failed'])    + ' failed'
+                        # One summary row after the changed values, so the log page shows the run as a whole
+                        self.dlg.journal.add_many(target_lyr, entries, 'autofill')
+                        self.dlg.journal.add(target_lyr, None, ', '.join(FILL_FIELDS), '', summary,
+                                             not counts['failed'], 'autofill-summary')
+                        self.dlg.on_journal_added()
+                        self.msg.pushInfo('GetFeats:', summary)
 
     def run(self):
-        # Settings stores only the layer name, get those layers if possible
-        source_lyr = QgsProject.instance().mapLayersByName(self.dlg.SOURCE_LYR_NAME)
-        target_lyr = QgsProject.instance().mapLayersByName(self.dlg.TARGET_LYR_NAME)
+        # Settings store the layer id and name, the name is used when the id is not in this project
+        source_lyr = self.layers.resolve(self.dlg.SOURCE_LYR_ID, self.dlg.SOURCE_LYR_NAME)
+        target_lyr = self.layers.resolve(self.dlg.TARGET_LYR_ID, self.dlg.TARGET_LYR_NAME)
         if source_lyr and target_lyr:
         
             if self.is_first_run:
                 # Init Combobox layers
-                self.dlg.sourceLayer.setLayer(source_lyr[0])
-                self.dlg.targetLayer.setLayer(target_lyr[0])
+                self.dlg.sourceLayer.setLayer(source_lyr)
+                self.dlg.targetLayer.setLayer(target_lyr)
 
                 # Init source field combobox 
                 self.dlg.update_source_field_box()
@@ -158,11 +409,3 @@ class GetFeatsPlugin:
 
         self.check_plugin_enabled()
         self.dlg.show()
-        
-
- 
-
-
-
-
-
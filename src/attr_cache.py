@@ -0,0 +1,93 @@
+# Python
+from array import array
+
+# Column store of the Source field values, filled during the spatial index build
+# Rows are looked up by fid, each field is one column list
+class AttrCache:
+
+    def __init__(self):
+        self.lyr       = None
+        self.fld_names = []
+        self.clear()
+
+    def clear(self):
+        self.valid    = False
+        self.fids     = array('q')
+        self.columns  = []
+        self.row_idx  = {}
+        self.fld_cols = {}
+
+    # Filling does not touch the layer, so it can run in a background task
+    def reset(self, fld_names, fields):
+        self.clear()
+        self.fld_names = list(fld_names)
+        self.columns   = [[] for _ in self.fld_names]
+
+        # Map the layer field index to the cache column, used by attributeValueChanged
+        self.fld_cols = {fields.lookupField(fld): col for col, fld in enumerate(self.fld_names)}
+        self.valid    = True
+
+    # Keep the cache in sync with edits, must be called from the main thread
+    def attach(self, lyr):
+        self.disconnect()
+        self.lyr = lyr
+        lyr.attributeValueChanged.connect(self.on_attr_changed)
+        lyr.featureAdded.connect(self.on_feat_added)
+        lyr.featureDeleted.connect(self.on_feat_deleted)
+        lyr.updatedFields.connect(self.invalidate)
+
+    def disconnect(self):
+        if self.lyr is not None:
+            try:
+                self.lyr.attributeValueChanged.disconnect(self.on_attr_changed)
+                self.lyr.featureAdded.disconnect(self.on_feat_added)
+                self.lyr.featureDeleted.disconnect(self.on_feat_deleted)
+                self.lyr.updatedFields.disconnect(self.invalidate)
+            except (RuntimeError, TypeError):
+                # Layer already deleted or signals never connected
+                pass
+        self.lyr = None
+
+    def invalidate(self):
+        self.disconnect()
+        self.clear()
+
+    def add(self, feat):
+        self.row_idx[feat.id()] = len(self.fids)
+        self.fids.append(feat.id())
+        for col, fld in enumerate(self.fld_names):
+            self.columns[col].append(feat[fld])
+
+    def covers(self, lyr, fld_names):
+        return self.valid and self.lyr is not None and self.lyr.id() == lyr.id() \
+               and set(fld_names).issubset(self.fld_names)
+
+    # Return rows as {field: value}, in the same order as fids
+    def get_rows(self, fids):
+        rows = []
+        for fid in fids:
+            row = self.row_idx.get(fid)
+            if row is not None:
+                rows.append({fld: self.columns[col][row] for col, fld in enumerate(self.fld_names)})
+
+        return rows
+
+    ###############
+    ### Signals ###
+    ###############
+    def on_attr_changed(self, fid, fld_idx, value):
+        col = self.fld_cols.get(fld_idx)
+        row = self.row_idx.get(fid)
+        if col is not None and row is not None:
+            self.columns[col][row] = value
+
+    def on_feat_added(self, fid):
+        feat = self.lyr.getFeature(fid)
+        if feat.isValid():
+            # Edit buffer may re-add a fid (eg on commit), drop the old row first
+            self.on_feat_deleted(fid)
+            self.add(feat)
+
+    def on_feat_deleted(self, fid):
+        # Leave the row in the columns, it is unreachable once the fid is removed
+        self.row_idx.pop(fid, None)
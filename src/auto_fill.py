@@ -0,0 +1,116 @@
+# QGIS Core
+from qgis.core import QgsFeatureRequest
+from qgis.core import QgsFeedback
+from qgis.core import QgsVariantUtils
+
+# QGIS Utils
+from qgis.utils import iface
+
+# PyQt
+from qgis.PyQt.QtCore    import Qt
+from qgis.PyQt.QtWidgets import QProgressDialog
+
+# Plugin
+from .bulk import lookup_rows
+from .bulk import transform_geoms
+
+# Fill FILL_FIELDS of every selected Target feature from its top (deduplicated, prepped) row
+# All lookups run in one pass over the Source index, all writes are one undo step
+# Returns the counts and the (fid, field, old value, new value, ok) of every attempted write
+def auto_fill(obj, target_lyr, source_lyr, SRC_FIELDS, OUT_FIELDS, FIELDMAP, FILL_FIELDS,
+              MAX_DISTANCE, NEIGHBORS, USE_CUSTOM_PREP):
+    src_entry = obj.idx_reg.get(source_lyr, SRC_FIELDS, obj.src_index_crs(target_lyr),
+                                obj.src_index_engine(source_lyr, target_lyr))
+    if src_entry is None:
+        iface.messageBar().pushInfo('GetFeats:', 'Source index is still building, try again when it is ready')
+        return
+
+    # Geometry plus the fields to fill, the old values go into the undo command
+    fld_idxs = [target_lyr.fields().lookupField(fld) for fld in FILL_FIELDS]
+    request  = QgsFeatureRequest().setFilterFids(target_lyr.selectedFeatureIds())
+    request.setSubsetOfAttributes(fld_idxs)
+    target_feats = list(target_lyr.getFeatures(request))
+
+    tr        = obj.crs_cache.transform(target_lyr.crs(), src_entry.crs)
+    geoms     = transform_geoms(target_feats, tr)
+    max_dist  = MAX_DISTANCE*obj.crs_cache.unit_factor(src_entry.crs)
+    rows_list = lookup_rows(geoms, src_entry.index, src_entry.attr_cache, SRC_FIELDS, OUT_FIELDS, FIELDMAP,
+                            max_dist, NEIGHBORS)
+
+    # Custom prep of all targets in chunks, rows are used without prep where it fails or is canceled
+    if USE_CUSTOM_PREP:
+        rows_list, nfailed, status = prep_with_progress(obj, rows_list, OUT_FIELDS)
+        if status == 'timeout':
+            iface.messageBar().pushInfo('GetFeats:', 'Custom prep took longer than ' + 
+                                        str(obj.prep.budget_ms) + ' ms per feature, ' + str(nfailed) + 
+                                        ' features were filled without prep')
+        elif status == 'busy':
+            iface.messageBar().pushInfo('GetFeats:', 'Custom prep is still running from an earlier call, ' + 
+                                        str(nfailed) + ' features were filled without prep')
+        elif status == 'canceled':
+            iface.messageBar().pushInfo('GetFeats:', 'Custom prep canceled, ' + str(nfailed) + 
+                                        ' features were filled without prep')
+        elif nfailed:
+            iface.messageBar().pushInfo('GetFeats:', 'Custom prep failed for ' + str(nfailed) + 
+                                        ' features, their rows were used without prep')
+
+    # Top row of each target
+    top_rows = [rows[:1] for rows in rows_list]
+
+    out_cols = [OUT_FIELDS.index(fld) for fld in FILL_FIELDS]
+    counts   = {'features': len(target_feats), 'changed': 0, 'unchanged': 0, 'nomatch': 0, 'failed': 0}
+    entries  = []
+
+    target_lyr.beginEditCommand('GetFeats: auto-fill ' + str(len(target_feats)) + ' features')
+    try:
+        for target_ft, rows in zip(target_feats, top_rows):
+            if not rows:
+                counts['nomatch'] += 1
+                continue
+
+            for fld, fld_idx, col in zip(FILL_FIELDS, fld_idxs, out_cols):
+                oldval = target_ft[fld_idx]
+                newval = rows[0][col]
+                if not QgsVariantUtils.isNull(newval):
+                    try:
+                        newval = target_lyr.fields().at(fld_idx).convertCompatible(newval)
+                    except ValueError:
+                        counts['failed'] += 1
+                        entries.append((target_ft.id(), fld, oldval, rows[0][col], False))
+                        continue
+
+                if str(newval) == str(oldval):
+                    counts['unchanged'] += 1
+                    continue
+
+                ok = target_lyr.changeAttributeValue(target_ft.id(), fld_idx, newval, oldval)
+                counts['changed' if ok else 'failed'] += 1
+                entries.append((target_ft.id(), fld, oldval, newval, ok))
+    except:
+        target_lyr.destroyEditCommand()
+        raise
+
+    # Nothing to undo when no value changed
+    if counts['changed']:
+        target_lyr.endEditCommand()
+    else:
+        target_lyr.destroyEditCommand()
+
+    return counts, entries
+
+# Application modal progress dialog over the chunks of PrepRunner.run_many, its Cancel stops before the next chunk
+# Nothing else (eg a new selection) can start while it processes events between chunks
+# The dialog processes events when its value changes, it only shows up when prep takes a while
+def prep_with_progress(obj, rows_list, OUT_FIELDS):
+    progress = QProgressDialog('GetFeats: custom prep for ' + str(len(rows_list)) + ' features', 'Cancel',
+                               0, 100, obj.dlg)
+    progress.setWindowModality(Qt.WindowModality.ApplicationModal)
+    progress.setMinimumDuration(500)
+
+    feedback = QgsFeedback()
+    feedback.progressChanged.connect(lambda pct: progress.setValue(int(pct)))
+    progress.canceled.connect(feedback.cancel)
+    try:
+        return obj.prep.run_many(rows_list, OUT_FIELDS, feedback)
+    finally:
+        progress.close()
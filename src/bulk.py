@@ -0,0 +1,208 @@
+# QGIS Core
+from qgis.core import Qgis
+from qgis.core import QgsFeature
+from qgis.core import QgsFeatureRequest
+from qgis.core import QgsGeometry
+from qgis.core import QgsRectangle
+from qgis.core import QgsUnitTypes
+from qgis.core import QgsVariantUtils
+from qgis.core import QgsVectorLayerFeatureSource
+
+# Python
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from math               import ceil
+from math               import sqrt
+
+# Plugin
+from .attr_cache import AttrCache
+from .index_task import build_index
+from .index_task import fill_attr_cache
+from .pipeline   import dedupe_rows
+from .pipeline   import project_rows
+
+RANK_FIELD       = 'gf_rank'
+TILES_PER_WORKER = 4
+
+# Bulk version of getfeats: the Source index is built once, then every target is
+# answered from it with the same project -> dedupe -> prep pipeline as the table
+
+def build_source_index(source, SRC_FIELDS, feedback = None):
+    index = build_index(source.getFeatures(QgsFeatureRequest().setNoAttributes()), feedback = feedback)
+    if index is None:
+        return None, None
+
+    attr_cache = AttrCache()
+    attr_cache.reset(SRC_FIELDS, source.fields())
+    request = QgsFeatureRequest().setSubsetOfAttributes(SRC_FIELDS, source.fields())
+    request.setFlags(Qgis.FeatureRequestFlag.NoGeometry)
+    if not fill_attr_cache(source.getFeatures(request), attr_cache, feedback, source.featureCount()):
+        return None, None
+
+    return index, attr_cache
+
+# Max Distance is given in meters, the index works in Source CRS units
+def max_dist_source_units(MAX_DISTANCE, source_crs):
+    mult = QgsUnitTypes.fromUnitToUnitFactor(QgsUnitTypes.DistanceUnit(0), source_crs.mapUnits())
+
+    return MAX_DISTANCE*mult
+
+# Target geometries in the Source CRS, None for features without geometry
+# tr is None when both layers share a CRS
+def transform_geoms(target_feats, tr):
+    geoms = []
+    for target_ft in target_feats:
+        geom = None
+        if target_ft.hasGeometry():
+            geom = target_ft.geometry()
+            if tr is not None:
+                geom = QgsGeometry(geom)
+                geom.transform(tr)
+        geoms.append(geom)
+
+    return geoms
+
+# Deduplicated rows of the nearest Source features, one list per geometry
+def lookup_rows(geoms, index, attr_cache, SRC_FIELDS, OUT_FIELDS, FIELDMAP,
+                max_dist, NEIGHBORS, feedback = None):
+    # Engines with a batch query (segment_index) answer every geometry in one call
+    nns_list = None
+    if hasattr(index, 'nearest_batch'):
+        nns_list = index.nearest_batch(geoms, NEIGHBORS, max_dist)
+
+    rows_list = []
+    for cnt, geom in enumerate(geoms):
+        if feedback is not None and cnt % 100 == 0:
+            if feedback.isCanceled():
+                break
+            feedback.setProgress(100*cnt/max(len(geoms), 1))
+
+        rows = []
+        if geom is not None:
+            nns  = nns_list[cnt] if nns_list is not None else \
+                   index.nearestNeighbor(geom, neighbors = NEIGHBORS, maxDistance = max_dist)
+            rows = dedupe_rows(project_rows(attr_cache.get_rows(nns), OUT_FIELDS, FIELDMAP, SRC_FIELDS))
+        rows_list.append(rows)
+
+    return rows_list
+
+# Custom prep and top-N, runs on the main thread
+# prep is a pipeline.prep_chain callable
+def finish_rows(rows, OUT_FIELDS, TOP_N, prep = None):
+    if prep is not None and rows:
+        rows = prep(rows, OUT_FIELDS)
+
+    return rows[:TOP_N]
+
+#############
+### Tiles ###
+#############
+# Group the targets into a grid of about ntiles tiles, each target in exactly one tile
+# Tiles are returned in row-major order as (extent of members, member indices)
+def make_tiles(geoms, ntiles):
+    extent = QgsRectangle()
+    extent.setNull()
+    for geom in geoms:
+        if geom is not None:
+            extent.combineExtentWith(geom.boundingBox())
+
+    ncols  = max(ceil(sqrt(ntiles)), 1)
+    nrows  = max(ceil(ntiles/ncols), 1)
+    width  = extent.width()/ncols or 1
+    height = extent.height()/nrows or 1
+
+    members = {}
+    for i, geom in enumerate(geoms):
+        if geom is not None:
+            center = geom.boundingBox().center()
+            col    = min(int((center.x() - extent.xMinimum())/width),  ncols - 1)
+            row    = min(int((center.y() - extent.yMinimum())/height), nrows - 1)
+            members.setdefault((row, col), []).append(i)
+
+    tiles = []
+    for key in sorted(members):
+        rect = QgsRectangle()
+        rect.setNull()
+        for i in members[key]:
+            rect.combineExtentWith(geoms[i].boundingBox())
+        tiles.append((rect, members[key]))
+
+    return tiles
+
+# Runs in a worker thread: local index of the Source features near the tile, then the lookups
+# source is a QgsVectorLayerFeatureSource made for this tile only
+def query_tile(source, fields, src_fids, rect, tile_geoms, SRC_FIELDS, OUT_FIELDS, FIELDMAP,
+               max_dist, NEIGHBORS, feedback):
+    if feedback.isCanceled():
+        return []
+
+    # Every Source feature within max_dist of a target touches the buffered tile extent
+    request = QgsFeatureRequest().setFilterRect(rect.buffered(max_dist))
+    if src_fids is not None:
+        request.setFilterFids(src_fids)
+
+    # The shared feedback is only checked, progress is reported per tile by tiled_lookup
+    index = build_index(source.getFeatures(QgsFeatureRequest(request).setNoAttributes()))
+    if feedback.isCanceled():
+        return []
+
+    # The rect filter needs the geometry, so this pass reads it too
+    attr_cache = AttrCache()
+    attr_cache.reset(SRC_FIELDS, fields)
+    request.setSubsetOfAttributes(SRC_FIELDS, fields)
+    fill_attr_cache(source.getFeatures(request), attr_cache)
+
+    return lookup_rows(tile_geoms, index, attr_cache, SRC_FIELDS, OUT_FIELDS, FIELDMAP, max_dist, NEIGHBORS)
+
+# Same result as lookup_rows over a full index, split over a pool of worker threads
+# Results are merged back into target order, so the output does not depend on the worker count
+def tiled_lookup(geoms, source_lyr, src_fids, SRC_FIELDS, OUT_FIELDS, FIELDMAP,
+                 max_dist, NEIGHBORS, workers, feedback):
+    tiles     = make_tiles(geoms, workers*TILES_PER_WORKER)
+    rows_list = [[] for _ in geoms]
+    fields    = source_lyr.fields()
+
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        futures = {}
+        for rect, members in tiles:
+            # Feature sources are made on the algorithm thread, one per tile
+            source = QgsVectorLayerFeatureSource(source_lyr)
+            future = pool.submit(query_tile, source, fields, src_fids, rect, [geoms[i] for i in members],
+                                 SRC_FIELDS, OUT_FIELDS, FIELDMAP, max_dist, NEIGHBORS, feedback)
+            futures[future] = members
+
+        for cnt, future in enumerate(as_completed(futures)):
+            for i, rows in zip(futures[future], future.result()):
+                rows_list[i] = rows
+            feedback.setProgress(100*(cnt + 1)/len(futures))
+
+    return rows_list
+
+# One output feature per row, target attributes with the OUT_FIELDS filled in
+# Targets without a match are kept once with a NULL rank
+def make_out_feats(target_ft, rows, out_fields, OUT_FIELDS):
+    out_idx  = [out_fields.lookupField(fld) for fld in OUT_FIELDS]
+    rank_idx = out_fields.lookupField(RANK_FIELD)
+    base     = target_ft.attributes() + [None]*(out_fields.count() - len(target_ft.attributes()))
+
+    out_feats = []
+    nbad      = 0
+    for rank, row in enumerate(rows or [None], start = 1):
+        attrs = list(base)
+        if row is not None:
+            for idx, val in zip(out_idx, row):
+                if not QgsVariantUtils.isNull(val):
+                    try:
+                        val = out_fields.at(idx).convertCompatible(val)
+                    except ValueError:
+                        val  = None
+                        nbad += 1
+                attrs[idx] = val
+            attrs[rank_idx] = rank
+
+        feat = QgsFeature(out_fields)
+        feat.setGeometry(target_ft.geometry())
+        feat.setAttributes(attrs)
+        out_feats.append(feat)
+
+    return out_feats, nbad
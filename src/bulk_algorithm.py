@@ -0,0 +1,194 @@
+# QGIS Core
+from qgis.core import Qgis
+from qgis.core import QgsCoordinateTransform
+from qgis.core import QgsFeatureRequest
+from qgis.core import QgsFeatureSink
+from qgis.core import QgsField
+from qgis.core import QgsFields
+from qgis.core import QgsProcessingAlgorithm
+from qgis.core import QgsProcessingException
+from qgis.core import QgsProcessingFeatureSourceDefinition
+from qgis.core import QgsProcessingMultiStepFeedback
+from qgis.core import QgsProcessingParameterBoolean
+from qgis.core import QgsProcessingParameterFeatureSink
+from qgis.core import QgsProcessingParameterFeatureSource
+from qgis.core import QgsProcessingParameterNumber
+from qgis.core import QgsProcessingParameterString
+from qgis.core import QgsSettings
+
+# PyQt
+from qgis.PyQt.QtCore import QMetaType
+
+# Python
+import os
+
+# Plugin
+from .bulk     import RANK_FIELD
+from .bulk     import build_source_index
+from .bulk     import finish_rows
+from .bulk     import lookup_rows
+from .bulk     import make_out_feats
+from .bulk     import max_dist_source_units
+from .bulk     import tiled_lookup
+from .bulk     import transform_geoms
+from .pipeline import load_custom_prep
+from .pipeline import prep_chain
+
+# Runs the GetFeats table logic over every (or every selected) Target feature
+class BulkGetFeatsAlgorithm(QgsProcessingAlgorithm):
+
+    INPUT           = 'INPUT'
+    SOURCE          = 'SOURCE'
+    SOURCE_FIELDS   = 'SOURCE_FIELDS'
+    OUTPUT_FIELDS   = 'OUTPUT_FIELDS'
+    MAX_DISTANCE    = 'MAX_DISTANCE'
+    NEIGHBORS       = 'NEIGHBORS'
+    TOP_N           = 'TOP_N'
+    USE_CUSTOM_PREP = 'USE_CUSTOM_PREP'
+    WORKERS         = 'WORKERS'
+    OUTPUT          = 'OUTPUT'
+
+    def name(self):
+        return 'bulkgetfeats'
+
+    def displayName(self):
+        return 'Bulk nearest feature attributes'
+
+    def shortHelpString(self):
+        return ('For every Target feature, finds the nearest Source features and fills the Output fields '
+                'the same way as the GetFeats table (field map, max distance, neighbors, duplicates removed, '
+                'optional custom prep). The top row, or the top N rows ranked in the ' + RANK_FIELD + 
+                ' field, are written per Target feature. Use "Selected features only" to limit the Target.\n\n'
+                'With more than one worker the Target extent is split into tiles, each worker indexes only the '
+                'Source features within Max distance of its tile. The output is the same for any worker count.')
+
+    def createInstance(self):
+        return BulkGetFeatsAlgorithm()
+
+    def initAlgorithm(self, config = None):
+        # Defaults come from the saved plugin settings
+        s = QgsSettings()
+        self.addParameter(QgsProcessingParameterFeatureSource(self.INPUT, 'Target layer',
+                          [Qgis.ProcessingSourceType.VectorPoint]))
+        self.addParameter(QgsProcessingParameterFeatureSource(self.SOURCE, 'Source layer',
+                          [Qgis.ProcessingSourceType.VectorLine]))
+        self.addParameter(QgsProcessingParameterString(self.SOURCE_FIELDS, 'Source fields (comma-separated)',
+                          s.value("GetFeats/sourceFields", "NULL, name, type")))
+        self.addParameter(QgsProcessingParameterString(self.OUTPUT_FIELDS, 'Output fields (comma-separated)',
+                          s.value("GetFeats/outputFields", "Heading, Name, Type")))
+        self.addParameter(QgsProcessingParameterNumber(self.MAX_DISTANCE, 'Max distance (meters)',
+                          Qgis.ProcessingNumberParameterType.Double, float(s.value("GetFeats/maxDistance", 500)), 
+                          minValue = 0))
+        self.addParameter(QgsProcessingParameterNumber(self.NEIGHBORS, 'Neighbors',
+                          Qgis.ProcessingNumberParameterType.Integer, int(s.value("GetFeats/nNeighbors", 50)), 
+                          minValue = 1))
+        self.addParameter(QgsProcessingParameterNumber(self.TOP_N, 'Matches per Target feature',
+                          Qgis.ProcessingNumberParameterType.Integer, 1, minValue = 1))
+        self.addParameter(QgsProcessingParameterBoolean(self.USE_CUSTOM_PREP, 'Use custom prep', False))
+        self.addParameter(QgsProcessingParameterNumber(self.WORKERS, 'Worker threads',
+                          Qgis.ProcessingNumberParameterType.Integer, os.cpu_count() or 1, minValue = 1))
+        self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT, 'Output layer'))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        target = self.parameterAsSource(parameters, self.INPUT, context)
+        source = self.parameterAsSource(parameters, self.SOURCE, context)
+        if target is None or source is None:
+            raise QgsProcessingException('Invalid Target or Source layer')
+
+        SRC_FIELDS0     = [x.strip() for x in self.parameterAsString(parameters, self.SOURCE_FIELDS, context).split(',')]
+        OUT_FIELDS      = [x.strip() for x in self.parameterAsString(parameters, self.OUTPUT_FIELDS, context).split(',')]
+        MAX_DISTANCE    = self.parameterAsDouble(parameters, self.MAX_DISTANCE, context)
+        NEIGHBORS       = self.parameterAsInt(parameters, self.NEIGHBORS, context)
+        TOP_N           = self.parameterAsInt(parameters, self.TOP_N, context)
+        USE_CUSTOM_PREP = self.parameterAsBoolean(parameters, self.USE_CUSTOM_PREP, context)
+        WORKERS         = self.parameterAsInt(parameters, self.WORKERS, context)
+
+        # Same checks as the interactive plugin
+        if len(SRC_FIELDS0) != len(OUT_FIELDS):
+            raise QgsProcessingException('Source and Output fields must have same length')
+        if len(set(OUT_FIELDS)) != len(OUT_FIELDS):
+            raise QgsProcessingException('Cannot have duplicate Output fields')
+        if RANK_FIELD in OUT_FIELDS:
+            raise QgsProcessingException('Output field cannot be named ' + RANK_FIELD)
+
+        FIELDMAP   = dict(zip(OUT_FIELDS, SRC_FIELDS0))
+        SRC_FIELDS = list(dict.fromkeys([x for x in SRC_FIELDS0 if x in source.fields().names()]))
+        if not SRC_FIELDS:
+            raise QgsProcessingException('No Source fields found in the Source layer')
+
+        prep = None
+        if USE_CUSTOM_PREP:
+            try:
+                prep = prep_chain(load_custom_prep())
+            except ValueError as e:
+                raise QgsProcessingException(str(e))
+
+            # The algorithm runs in the background, scripts that need the GUI thread cannot run here
+            if prep.gui_thread:
+                raise QgsProcessingException('The custom prep script uses the older custom_prep(clean_lyr) form, '
+                                             'which runs on the GUI thread. Use prep_rows or PREP_STAGES for '
+                                             'this algorithm.')
+
+        # Target fields, plus string fields for Output fields the Target does not have
+        out_fields = QgsFields(target.fields())
+        for fld in OUT_FIELDS:
+            if out_fields.lookupField(fld) < 0:
+                out_fields.append(QgsField(fld, QMetaType.Type.QString))
+        out_fields.append(QgsField(RANK_FIELD, QMetaType.Type.Int))
+
+        sink, dest_id = self.parameterAsSink(parameters, self.OUTPUT, context, out_fields,
+                                             target.wkbType(), target.sourceCrs())
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        steps = QgsProcessingMultiStepFeedback(2, feedback)
+        tr    = QgsCoordinateTransform(target.sourceCrs(), source.sourceCrs(), context.transformContext())
+
+        target_feats = list(target.getFeatures())
+        geoms        = transform_geoms(target_feats, tr)
+        max_dist     = max_dist_source_units(MAX_DISTANCE, source.sourceCrs())
+
+        # Step 1: nearest rows for every Target feature
+        # Without a max distance a tile cannot bound its Source features, so run untiled
+        steps.setCurrentStep(0)
+        source_lyr = self.parameterAsVectorLayer(parameters, self.SOURCE, context)
+        if WORKERS > 1 and max_dist > 0 and source_lyr is not None:
+            feedback.pushInfo('Querying ' + str(len(geoms)) + ' Target features with ' + str(WORKERS) + ' workers')
+            # Tiles read the layer itself, the selection, filter expression and feature limit of the
+            # Source definition are applied through the ids of the features the Source gives
+            src_def  = parameters[self.SOURCE]
+            src_fids = None
+            if isinstance(src_def, QgsProcessingFeatureSourceDefinition) and \
+               (src_def.selectedFeaturesOnly or src_def.filterExpression or src_def.featureLimit > 0):
+                request  = QgsFeatureRequest().setFlags(Qgis.FeatureRequestFlag.NoGeometry).setNoAttributes()
+                src_fids = [f.id() for f in source.getFeatures(request)]
+            rows_list = tiled_lookup(geoms, source_lyr, src_fids, SRC_FIELDS, OUT_FIELDS, FIELDMAP,
+                                     max_dist, NEIGHBORS, WORKERS, steps)
+        else:
+            feedback.pushInfo('Building Source index')
+            index, attr_cache = build_source_index(source, SRC_FIELDS, steps)
+            if index is None:
+                return {}
+            rows_list = lookup_rows(geoms, index, attr_cache, SRC_FIELDS, OUT_FIELDS, FIELDMAP,
+                                    max_dist, NEIGHBORS, steps)
+
+        if feedback.isCanceled():
+            return {}
+
+        # Step 2: custom prep and output, on the algorithm thread in Target order
+        steps.setCurrentStep(1)
+        total = max(len(target_feats), 1)
+        nbad  = 0
+        for cnt, (target_ft, rows) in enumerate(zip(target_feats, rows_list)):
+            if feedback.isCanceled():
+                break
+            rows           = finish_rows(rows, OUT_FIELDS, TOP_N, prep)
+            out_feats, bad = make_out_feats(target_ft, rows, out_fields, OUT_FIELDS)
+            sink.addFeatures(out_feats, QgsFeatureSink.Flag.FastInsert)
+            nbad += bad
+            steps.setProgress(100*cnt/total)
+
+        if nbad:
+            feedback.reportError(str(nbad) + ' values could not be converted to the Target field type and were left NULL')
+
+        return {self.OUTPUT: dest_id}
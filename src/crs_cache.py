@@ -0,0 +1,89 @@
+# QGIS Core
+from qgis.core import QgsCoordinateReferenceSystem
+from qgis.core import QgsCoordinateTransform
+from qgis.core import QgsProject
+from qgis.core import QgsUnitTypes
+
+WGS84 = 'EPSG:4326'
+
+# Identifies a CRS, custom CRSs have no authid
+def crs_key(crs):
+    return crs.authid() or crs.toWkt()
+
+# Local azimuthal equidistant CRS in meters, distances from the center are exact
+def local_aeqd(lon, lat):
+    proj = '+proj=aeqd +lat_0=%.6f +lon_0=%.6f +x_0=0 +y_0=0 +datum=WGS84 +units=m +no_defs' % (lat, lon)
+
+    return QgsCoordinateReferenceSystem.fromProj(proj)
+
+# Transforms and meter factors, made once per CRS pair instead of once per selection
+# Cleared when the project transform context changes
+class CrsCache:
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.transforms = {}
+        self.factors    = {}
+        self.local_crs  = {}
+        self.hits       = 0
+        self.misses     = 0
+
+    # None when both CRSs are the same and geometries can be used as is
+    def transform(self, src_crs, dst_crs):
+        key = (crs_key(src_crs), crs_key(dst_crs))
+        if key[0] == key[1]:
+            return None
+
+        tr = self.transforms.get(key)
+        if tr is None:
+            self.misses += 1
+            tr = QgsCoordinateTransform(src_crs, dst_crs, QgsProject.instance())
+            self.transforms[key] = tr
+        else:
+            self.hits += 1
+
+        return tr
+
+    # Meters to the map units of crs
+    def unit_factor(self, crs):
+        key  = crs_key(crs)
+        mult = self.factors.get(key)
+        if mult is None:
+            mult = QgsUnitTypes.fromUnitToUnitFactor(QgsUnitTypes.DistanceUnit(0), crs.mapUnits())
+            self.factors[key] = mult
+
+        return mult
+
+    # CRS to build the Source index in so queries from target_lyr need no reprojection:
+    # the Target CRS when projected, else an AEQD centered on the Target extent
+    # Kept per layer so a growing extent does not move the center and force a rebuild
+    def index_crs(self, target_lyr):
+        target_crs = target_lyr.crs()
+        if not target_crs.isGeographic():
+            return target_crs
+
+        key = (target_lyr.id(), crs_key(target_crs))
+        crs = self.local_crs.get(key)
+        if crs is None:
+            # A single point has an empty but usable extent, an empty layer has none
+            extent = target_lyr.extent()
+            if extent.isNull():
+                lon, lat = 0, 0
+            else:
+                tr       = self.transform(target_crs, QgsCoordinateReferenceSystem(WGS84))
+                center   = tr.transform(extent.center()) if tr is not None else extent.center()
+                lon, lat = center.x(), center.y()
+
+            crs = local_aeqd(lon, lat)
+            self.local_crs[key] = crs
+
+        return crs
+
+    def stats(self):
+        return [('Transforms',   len(self.transforms)),
+                ('Unit factors', len(self.factors)),
+                ('Local CRSs',   len(self.local_crs)),
+                ('Hits',         self.hits),
+                ('Misses',       self.misses)]
@@ -1,46 +1,31 @@
 # QGIS Core
-from qgis.core import QgsFeature
+from qgis.core import Qgis
+from qgis.core import QgsMessageLog
+from qgis.core import QgsVariantUtils
 
-# QGIS Utils
-from qgis.utils import iface
-
-# Python
-import re
-
-DIRECTIONS = ['NULL', 'N', 'E', 'S', 'W']
+DIRECTIONS    = ['NULL', 'N', 'E', 'S', 'W']
+FLDS_REQUIRED = ['Heading', 'Name', 'Type']
 
 # Prep the table data
 # 1. Add a Heading field to manually choose direction of travel
 # 2. Set to lowercase except first letter of each word
-def custom_prep(clean_lyr):
+def prep_rows(rows, fields):
     # Require the hardcoded fields
-    fld_names     = clean_lyr.fields().names()
-    flds_required = ['Heading', 'Name', 'Type']
-    flag          = set(flds_required).issubset(fld_names)
+    if not set(FLDS_REQUIRED).issubset(fields):
+        # Runs in a worker thread, the message log is safe to use from there
+        QgsMessageLog.logMessage('Skipped custom prep. Required fields missing.', 'GetFeats', Qgis.MessageLevel.Info)
+        yield from rows
+        return
+
+    # Pad if fewer rows than directions (N, E, etc), want these in the same table
+    rows = list(rows)
+    rows += [{} for _ in range(len(DIRECTIONS) - len(rows))]
 
-    if flag:
-        # Pad if fewer features than directions (N, E, etc), want these in the same table
-        nfeats = clean_lyr.featureCount()
-        if nfeats <= len(DIRECTIONS):
-            for i in range(1, len(DIRECTIONS) + 1 - nfeats):
-                clean_lyr.dataProvider().addFeatures([QgsFeature()])
-    
-        clean_feats = clean_lyr.getFeatures()
-        features    = []
-        cnt         = 0
-        for f in clean_feats:
-            if cnt <= (len(DIRECTIONS) - 1):
-                f.setAttribute('Heading', DIRECTIONS[cnt])
-                cnt += 1
-            for i in ['Name', 'Type']:
-                if str(f.attribute(i)) != 'NULL':    
-                    newval = str(f.attribute(i)).title()
-                else:
-                    newval = str(f.attribute(i))
-                f.setAttribute(i, newval)
-            features.append(f)
-    else:
-        features = clean_lyr.getFeatures()
-        iface.messageBar().pushInfo('GetFeats:', 'Skipped custom prep. Required fields missing.')
-    
-    return features
\ No newline at end of file
+    for cnt, row in enumerate(rows):
+        rec = row if isinstance(row, dict) else dict(zip(fields, row))
+        if cnt <= (len(DIRECTIONS) - 1):
+            rec['Heading'] = DIRECTIONS[cnt]
+        for i in ['Name', 'Type']:
+            val    = rec.get(i)
+            rec[i] = 'NULL' if QgsVariantUtils.isNull(val) else str(val).title()
+        yield rec
@@ -10,11 +10,10 @@ from qgis.utils import iface
 
 # PyQt
 from qgis.PyQt           import uic
-from qgis.PyQt.Qt        import QStandardItem
+from qgis.PyQt.QtCore    import QDateTime
 from qgis.PyQt.QtCore    import QDir 
 from qgis.PyQt.QtCore    import QModelIndex
 from qgis.PyQt.QtGui     import QFont
-from qgis.PyQt.QtGui     import QStandardItemModel
 from qgis.PyQt.QtWidgets import QFileSystemModel
 from qgis.PyQt.QtWidgets import QHeaderView
 from qgis.PyQt.QtWidgets import QDialog
@@ -25,16 +24,58 @@ from qgis.PyQt.QtGui     import QDesktopServices
 from qgis.PyQt.QtCore    import QUrl
 
 # Python
-from math    import isnan
-from os.path import abspath
+from importlib import import_module
+from math      import isnan
+from os.path   import abspath
+import csv
 import os
+import sqlite3
 
 # Plugin
+from .index_task  import numpy_available
 from .input_check import InputCheck
+from .journal     import COLUMNS as JOURNAL_COLUMNS
+from .journal     import PasteJournal
+from .table_model import JournalTableModel
+from .table_model import ResultTableModel
 from .utils       import est_degree_error
 
-# Loads the .ui file
-FORM_CLASS, _ = uic.loadUiType(os.path.join(os.path.dirname(__file__), 'dialog_ui', 'dialog_base.ui'))
+LOG_PAGE_SIZE = 200
+LOG_HEADERS   = ['Time', 'Layer', 'fid', 'Field', 'Old Value', 'New Value', 'OK', 'Kind']
+
+# neighborEngine items, in order
+NEIGHBOR_ENGINES = ['qgis', 'numpy']
+
+UI_FPATH   = os.path.join(os.path.dirname(__file__), 'dialog_ui', 'dialog_base.ui')
+FORM_FPATH = os.path.join(os.path.dirname(__file__), 'dialog_ui', 'dialog_base_ui.py')
+
+# Form class of the dialog. The .ui file is compiled to dialog_base_ui.py on the first load,
+# later loads import that module instead of parsing and compiling the .ui again
+# Recompiled whenever the .ui file is newer, loadUiType is the fallback when anything fails
+# Written to a temp file and moved in place, so another QGIS starting at the same time never
+# imports a half written module
+def load_form_class():
+    tmp_fpath = FORM_FPATH + '.' + str(os.getpid()) + '.tmp'
+    try:
+        if not os.path.exists(FORM_FPATH) or os.path.getmtime(FORM_FPATH) < os.path.getmtime(UI_FPATH):
+            with open(tmp_fpath, 'w') as outfile:
+                uic.compileUi(UI_FPATH, outfile)
+            os.replace(tmp_fpath, FORM_FPATH)
+        module = import_module('.dialog_ui.dialog_base_ui', __package__)
+
+        return getattr(module, 'Ui_GetFeats')
+    except Exception:
+        # Eg a read-only plugin folder or a PyQt without compileUi
+        for fpath in [tmp_fpath, FORM_FPATH]:
+            if os.path.exists(fpath):
+                try:
+                    os.remove(fpath)
+                except OSError:
+                    pass
+
+        return uic.loadUiType(UI_FPATH)[0]
+
+FORM_CLASS = load_form_class()
 
 class PluginDialog(QDialog, FORM_CLASS):
     def __init__(self, parent = None):
@@ -59,6 +100,8 @@ class PluginDialog(QDialog, FORM_CLASS):
         s = QgsSettings()
         self.SOURCE_LYR_NAME  = s.value("GetFeats/sourceLayer", "Roads")
         self.TARGET_LYR_NAME  = s.value("GetFeats/targetLayer", "target_layer")
+        self.SOURCE_LYR_ID    = s.value("GetFeats/sourceLayerId", "")
+        self.TARGET_LYR_ID    = s.value("GetFeats/targetLayerId", "")
         self.CUSTOM_PREP_FILE = s.value("GetFeats/customPrepFile", "custom_prep_lotr.py")
 
         SRC_FIELDS0     = s.value("GetFeats/sourceFields", "NULL, name, type")
@@ -69,6 +112,15 @@ class PluginDialog(QDialog, FORM_CLASS):
         SELECT_FEATS    = s.value("GetFeats/selectFeats",  True)
         TBL_FONT_SIZE   = s.value("GetFeats/fontSpinBox",  10)
         LOG_FONT_SIZE   = s.value("GetFeats/logSpinBox",   10)
+        INDEX_CACHE_MB  = s.value("GetFeats/indexCacheMB", 512)
+        RESULT_CACHE    = s.value("GetFeats/resultCacheSize", 256)
+        DEBOUNCE_MS     = s.value("GetFeats/debounceMs",   30)
+        PREP_BUDGET_MS  = s.value("GetFeats/prepBudgetMs", 200)
+        BUFFERED_PASTE  = s.value("GetFeats/bufferedPaste", True, type = bool)
+        FILL_FIELDS     = s.value("GetFeats/autoFillFields", "")
+        INDEX_IN_TARGET = s.value("GetFeats/indexInTargetCrs", False, type = bool)
+        RECORD_LATENCY  = s.value("GetFeats/recordLatency", False, type = bool)
+        NEIGHBOR_ENGINE = s.value("GetFeats/neighborEngine", 0)
 
         # Set values from settings
         self.sourceFields.setText(SRC_FIELDS0)
@@ -79,6 +131,21 @@ class PluginDialog(QDialog, FORM_CLASS):
         self.selectFeats.setChecked(bool(SELECT_FEATS))
         self.fontSpinBox.setValue(int(TBL_FONT_SIZE))
         self.logSpinBox.setValue(int(LOG_FONT_SIZE))
+        self.indexCacheMB.setValue(int(INDEX_CACHE_MB))
+        self.resultCacheSize.setValue(int(RESULT_CACHE))
+        self.debounceMs.setValue(int(DEBOUNCE_MS))
+        self.prepBudgetMs.setValue(int(PREP_BUDGET_MS))
+        self.bufferedPaste.setChecked(bool(BUFFERED_PASTE))
+        self.autoFillFields.setText(FILL_FIELDS)
+        self.indexInTargetCrs.setChecked(bool(INDEX_IN_TARGET))
+        self.recordLatency.setChecked(bool(RECORD_LATENCY))
+
+        # The NumPy grid is only offered when numpy imports
+        if not numpy_available():
+            self.neighborEngine.model().item(1).setEnabled(False)
+            self.neighborEngine.setToolTip('NumPy Grid needs numpy in the QGIS Python environment')
+            NEIGHBOR_ENGINE = 0
+        self.neighborEngine.setCurrentIndex(int(NEIGHBOR_ENGINE))
 
         # Filter ComboBox layers
         self.sourceLayer.setFilters(QgsMapLayerProxyModel.Filter.LineLayer)
@@ -119,15 +186,18 @@ class PluginDialog(QDialog, FORM_CLASS):
         self.customPrepFile.setCurrentIndex(1)
 
         # Init the data table
-        self.model = QStandardItemModel()
+        self.model = ResultTableModel()
         self.tableView.setModel(self.model)
         self.tableView.horizontalHeader().setStretchLastSection(False)
         self.tableView.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
-        self.model.setHorizontalHeaderLabels(self.extract_outfields())
+        self.model.set_rows(self.extract_outfields(), [])
         self.selection_model = self.tableView.selectionModel()
         self.set_table_font()
         self.update_table_panel_lbls()
 
+        # Only shown while the Source index builds
+        self.hide_index_progress()
+
         # Add link to log directory
         fpath    = self.get_user_folder()
         path_str = '- <a href ="file:///%s"><span style="color:lightskyblue;">Link to Log Directory</span></a>'%(fpath)
@@ -135,6 +205,22 @@ class PluginDialog(QDialog, FORM_CLASS):
         self.logDirLink.setToolTip(fpath)
         self.logDirLink.setOpenExternalLinks(True)
 
+        # Copy/paste journal, the log page shows one page of it at a time
+        self.journal       = PasteJournal(os.path.join(fpath, 'qcpjournal.sqlite'))
+        self.journal_model = JournalTableModel()
+        self.journal_page  = 0
+        self.journalView.setModel(self.journal_model)
+        self.journalView.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        self.journalView.horizontalHeader().setStretchLastSection(True)
+        self.logFrom.setDateTime(QDateTime.currentDateTime().addDays(-1))
+        self.logTo.setDateTime(QDateTime.currentDateTime())
+
+        # The upper time bound follows the current time until it is edited, so new pastes stay listed
+        self.log_to_open = True
+
+        # History of the older text log, imported once
+        self.import_old_log(fpath)
+
         # Set log font size
         self.set_log_font()
 
@@ -155,6 +241,7 @@ class PluginDialog(QDialog, FORM_CLASS):
 
         # Update Max Distance spinbox
         self.maxDistance.valueChanged.connect(self.update_nnNotes)
+        self.indexInTargetCrs.toggled.connect(self.update_nnNotes)
 
         # Save Settings
         self.saveSettings.clicked.connect(self.save_settings)
@@ -179,11 +266,17 @@ class PluginDialog(QDialog, FORM_CLASS):
         # Update the log font size
         self.logSpinBox.valueChanged.connect(self.set_log_font)
 
-        # Connect the log buttons
+        # Connect the log buttons and filters
         self.clearLog.clicked.connect(self.clear_log)
-        self.saveLog.clicked.connect(self.save_log)
-        self.appendLog.clicked.connect(self.append_log)
-        self.loadLog.clicked.connect(self.load_log)
+        self.exportLog.clicked.connect(self.export_log)
+        self.logPrev.clicked.connect(lambda: self.show_log_page(self.journal_page - 1))
+        self.logNext.clicked.connect(lambda: self.show_log_page(self.journal_page + 1))
+        self.logLayerFilter.activated.connect(lambda: self.show_log_page(0))
+        self.logFieldFilter.activated.connect(lambda: self.show_log_page(0))
+        self.logTimeFilter.stateChanged.connect(self.on_log_time_filter)
+        self.logFrom.dateTimeChanged.connect(lambda: self.show_log_page(0))
+        self.logTo.dateTimeChanged.connect(self.on_log_to_changed)
+        self.pageMenu.currentRowChanged['int'].connect(self.on_log_page_shown)
 
         # Experimental settings
         self.allowAllSourceGeoms.clicked.connect(self.allow_all_src_geoms)
@@ -206,14 +299,14 @@ class PluginDialog(QDialog, FORM_CLASS):
 
     def save_settings(self):
         if self.chk.check_dialog_lyrs_exist(self):
-            TARGET_LYR_NAME = self.targetLayer.currentLayer().name()
-            SOURCE_LYR_NAME = self.sourceLayer.currentLayer().name()
-            source_lyr = self.chk.check_lyr_valid(SOURCE_LYR_NAME)
-            target_lyr = self.chk.check_lyr_valid(TARGET_LYR_NAME)
+            source_lyr = self.chk.check_lyr_valid(self.sourceLayer.currentLayer().id())
+            target_lyr = self.chk.check_lyr_valid(self.targetLayer.currentLayer().id())
             if source_lyr and target_lyr:
                 s = QgsSettings()
-                s.setValue("GetFeats/sourceLayer",    self.sourceLayer.currentLayer().name())
-                s.setValue("GetFeats/targetLayer",    self.targetLayer.currentLayer().name())
+                s.setValue("GetFeats/sourceLayer",    source_lyr.name())
+                s.setValue("GetFeats/targetLayer",    target_lyr.name())
+                s.setValue("GetFeats/sourceLayerId",  source_lyr.id())
+                s.setValue("GetFeats/targetLayerId",  target_lyr.id())
                 s.setValue("GetFeats/sourceFields",   self.sourceFields.text())
                 s.setValue("GetFeats/outputFields",   self.outputFields.text())
                 s.setValue("GetFeats/maxDistance",    self.maxDistance.value())
@@ -223,6 +316,15 @@ class PluginDialog(QDialog, FORM_CLASS):
                 s.setValue("GetFeats/selectFeats",    self.customPrep.isChecked())
                 s.setValue("GetFeats/fontSpinBox",    self.fontSpinBox.value())
                 s.setValue("GetFeats/logSpinBox",     self.logSpinBox.value())
+                s.setValue("GetFeats/indexCacheMB",   self.indexCacheMB.value())
+                s.setValue("GetFeats/resultCacheSize", self.resultCacheSize.value())
+                s.setValue("GetFeats/debounceMs",     self.debounceMs.value())
+                s.setValue("GetFeats/prepBudgetMs",   self.prepBudgetMs.value())
+                s.setValue("GetFeats/bufferedPaste",  self.bufferedPaste.isChecked())
+                s.setValue("GetFeats/autoFillFields", self.autoFillFields.text())
+                s.setValue("GetFeats/indexInTargetCrs", self.indexInTargetCrs.isChecked())
+                s.setValue("GetFeats/recordLatency",  self.recordLatency.isChecked())
+                s.setValue("GetFeats/neighborEngine", self.neighborEngine.currentIndex())
     
                 self.msg.pushInfo('GetFeats:', 'Settings Saved')
 
@@ -233,8 +335,8 @@ class PluginDialog(QDialog, FORM_CLASS):
     def update_source_field_box(self):
         self.sourceFieldBox.clear()
         if self.chk.check_dialog_lyrs_exist(self, warn_nolyr = False):
-            SOURCE_LYR_NAME = self.sourceLayer.currentLayer().name()
-            source_lyr      = self.chk.check_lyr_valid(SOURCE_LYR_NAME)
+            SOURCE_LYR_ID = self.sourceLayer.currentLayer().id()
+            source_lyr    = self.chk.check_lyr_valid(SOURCE_LYR_ID)
             if source_lyr:
                 self.sourceFieldBox.setLayer(source_lyr)
 
@@ -247,8 +349,8 @@ class PluginDialog(QDialog, FORM_CLASS):
     def update_target_field_box(self):
         self.targetFieldBox.clear()
         if self.chk.check_dialog_lyrs_exist(self, warn_nolyr = False):
-            TARGET_LYR_NAME = self.targetLayer.currentLayer().name()
-            target_lyr      = self.chk.check_lyr_valid(TARGET_LYR_NAME)
+            TARGET_LYR_ID = self.targetLayer.currentLayer().id()
+            target_lyr    = self.chk.check_lyr_valid(TARGET_LYR_ID)
             if target_lyr:
                 self.targetFieldBox.setLayer(target_lyr)
 
@@ -269,20 +371,46 @@ class PluginDialog(QDialog, FORM_CLASS):
     def extract_outfields(self):
         return [x.strip() for x in self.outputFields.text().split(',')]
 
+    def extract_fillfields(self):
+        FILL_FIELDS = [x.strip() for x in self.autoFillFields.text().split(',') if x.strip()]
+
+        return FILL_FIELDS or self.extract_outfields()
+
+    def neighbor_engine(self):
+        return NEIGHBOR_ENGINES[self.neighborEngine.currentIndex()]
+
     def update_nnNotes(self):
         if self.activatePlugin.isChecked() and self.chk.check_dialog_lyrs_exist(self):
-            SOURCE_LYR_NAME = self.sourceLayer.currentLayer().name()
-            source_lyr      = self.chk.check_lyr_valid(SOURCE_LYR_NAME)
+            SOURCE_LYR_ID = self.sourceLayer.currentLayer().id()
+            source_lyr    = self.chk.check_lyr_valid(SOURCE_LYR_ID)
             if source_lyr:
+                pre_redi = '<span style=" font-weight:300; font-style:italic; color:#ff774a;">'
+                pre_blue = '<span style=" font-weight:600; font-style:bold;   color:#b7b0ff;">'
+                pre_bold = '<span style=" font-weight:600; font-style:bold;">'
+                suf     = '</span>'
+
+                # Source index built in the Target CRS, or a local AEQD for a geographic Target
+                target_lyr = self.targetLayer.currentLayer()
+                if self.indexInTargetCrs.isChecked() and target_lyr:
+                    target_lyr_crs = target_lyr.crs()
+                    if target_lyr_crs.isGeographic():
+                        self.nnNotes.setText('Source index in a ' + pre_bold + 'local azimuthal equidistant' + suf + 
+                                             ' CRS centered on ' + pre_bold + target_lyr.name() + suf)
+                        self.nnNotes.append(pre_blue + ' - Max Distance' + suf + ' is exact from the center, ' + 
+                                            'close to it across the Target extent')
+                    else:
+                        self.nnNotes.setText('Source index in the Target CRS ' + pre_bold + 
+                                             target_lyr_crs.authid() + suf)
+                        self.nnNotes.append(pre_blue + ' - Max Distance' + suf + ' is measured in ' + 
+                                            QgsUnitTypes.toString(target_lyr_crs.mapUnits()))
+                        self.nnNotes.append(pre_blue + ' - Selections' + suf + ' need no reprojection')
+                    return
+
                 source_lyr_crs = source_lyr.crs()
                 src_units      = QgsUnitTypes.toString(source_lyr_crs.mapUnits())
                 if src_units == 'meters':
                     self.nnNotes.setText('No unit conversion required')
                 else:
-                    pre_redi = '<span style=" font-weight:300; font-style:italic; color:#ff774a;">'
-                    pre_blue = '<span style=" font-weight:600; font-style:bold;   color:#b7b0ff;">'
-                    pre_bold = '<span style=" font-weight:600; font-style:bold;">'
-                    suf     = '</span>'
                     self.nnNotes.setText('Converting ' + pre_bold + src_units + suf + ' to meters')
                 if src_units == 'degrees':
                     max_dist = self.maxDistance.value()
@@ -292,7 +420,8 @@ class PluginDialog(QDialog, FORM_CLASS):
                         lat = max([abs(source_lyr.extent().yMinimum()), 
                                    abs(source_lyr.extent().yMaximum())])
                     deg_err = est_degree_error(lat, max_dist)
-                    deg_msg = ' - Consider reprojecting ' + pre_bold + SOURCE_LYR_NAME + suf + ' to a linear coordinate system'
+                    deg_msg = ' - Consider reprojecting ' + pre_bold + source_lyr.name() + suf + \
+                              ' to a linear coordinate system, or indexing it in the Target CRS (Advanced)'
                     self.nnNotes.append(pre_redi + deg_msg + suf)
                     self.nnNotes.append('')
                     self.nnNotes.append('Estimated ' + pre_bold + 'Max Distance' + suf + ' error:')
@@ -300,6 +429,16 @@ class PluginDialog(QDialog, FORM_CLASS):
                     self.nnNotes.append(pre_blue + ' - Lon' + suf + ': ' + pre_bold + str(deg_err[1]) + suf + ' m')
 
 
+    def show_index_progress(self, progress):
+        self.indexProgress.setValue(int(progress))
+        self.indexProgress.setVisible(True)
+        self.cancelIndexBuild.setVisible(True)
+
+    def hide_index_progress(self):
+        self.indexProgress.setVisible(False)
+        self.cancelIndexBuild.setVisible(False)
+
+
     #####################
     ### Advanced Page ###
     ##################### 
@@ -354,22 +493,23 @@ class PluginDialog(QDialog, FORM_CLASS):
             copyAction = menu.addAction("Copy Selected Cell")
             action = menu.exec(self.mapToGlobal(event.pos()))
             if action == copyAction:
-                val = self.tableView.model().item(row, column).text()
+                val = self.model.index(row, column).data()
                 self.qapp.clipboard().setText(val)
 
     def clear_table(self, OUT_FIELDS):
-        self.model.setRowCount(0)
-        self.model.setColumnCount(0)
-        self.model.setHorizontalHeaderLabels(OUT_FIELDS)
+        self.update_table(OUT_FIELDS, [])
 
     def update_outfields(self):
         OUT_FIELDS = self.extract_outfields()
         self.clear_table(OUT_FIELDS)
 
-    def update_table(self, OUT_FIELDS, features):
-        self.clear_table(OUT_FIELDS)
-        for feat in features:
-            self.model.appendRow([QStandardItem(str(x)) for x in feat.attributes()])
+    # Only changed rows are redrawn, the scroll position is kept
+    def update_table(self, OUT_FIELDS, rows):
+        self.model.set_rows(OUT_FIELDS, rows)
+
+        # A pasted cell stays selected, clear it so the same cell can be clicked for the next feature
+        if self.enableCopyPaste.isChecked() and self.activatePlugin.isChecked():
+            self.selection_model.clearSelection()
 
     def update_table_panel_lbls(self):
         if self.activatePlugin.isChecked():
@@ -392,58 +532,117 @@ class PluginDialog(QDialog, FORM_CLASS):
     ################
     def set_log_font(self):
         font_size = self.logSpinBox.value()
-        self.copyPasteLog.setFont(QFont("Ubuntu", font_size))
+        self.journalView.setFont(QFont("Ubuntu", font_size))
+
+    def on_log_page_shown(self, row):
+        if self.stackedWidget.widget(row) is self.page_4:
+            self.update_log_filters()
+            self.show_log_page(self.journal_page)
+
+    # Called after each paste, only redraws when the newest page is on screen
+    def on_journal_added(self):
+        if self.stackedWidget.currentWidget() is self.page_4 and self.journal_page == 0:
+            self.update_log_filters()
+            self.show_log_page(0)
+
+    def update_log_filters(self):
+        for combo, column in [(self.logLayerFilter, 'layer_name'), (self.logFieldFilter, 'field')]:
+            current = combo.currentText()
+            combo.blockSignals(True)
+            combo.clear()
+            combo.addItem('All ' + ('layers' if column == 'layer_name' else 'fields'))
+            combo.addItems([str(x) for x in self.journal.distinct(column)])
+            idx = combo.findText(current)
+            combo.setCurrentIndex(max(idx, 0))
+            combo.blockSignals(False)
+
+    # Turning the time filter on lets the upper bound follow the current time again
+    def on_log_time_filter(self):
+        self.log_to_open = True
+        self.show_log_page(0)
+
+    def on_log_to_changed(self):
+        self.log_to_open = False
+        self.show_log_page(0)
+
+    def log_filters(self):
+        filters = {}
+        if self.logLayerFilter.currentIndex() > 0:
+            filters['layer_name'] = self.logLayerFilter.currentText()
+        if self.logFieldFilter.currentIndex() > 0:
+            filters['field'] = self.logFieldFilter.currentText()
+        if self.logTimeFilter.isChecked():
+            filters['t0'] = self.logFrom.dateTime().toSecsSinceEpoch()
+            if self.log_to_open:
+                # Open ended, the shown bound is only moved to now
+                self.logTo.blockSignals(True)
+                self.logTo.setDateTime(QDateTime.currentDateTime())
+                self.logTo.blockSignals(False)
+            else:
+                filters['t1'] = self.logTo.dateTime().toSecsSinceEpoch()
+
+        return filters
+
+    def show_log_page(self, page):
+        filters = self.log_filters()
+        npages  = max((self.journal.count(**filters) + LOG_PAGE_SIZE - 1)//LOG_PAGE_SIZE, 1)
+        page    = min(max(page, 0), npages - 1)
+        entries = self.journal.query(LOG_PAGE_SIZE, page*LOG_PAGE_SIZE, **filters)
+
+        rows   = []
+        failed = []
+        for i, (ts, lyr_name, fid, fld, old, new, ok, kind) in enumerate(entries):
+            dt = QDateTime.fromSecsSinceEpoch(int(ts)).toString()
+            rows.append((dt, lyr_name, fid, fld, old, new, 'Yes' if ok else 'No', kind))
+            if not ok:
+                failed.append(i)
+
+        self.journal_page = page
+        self.journal_model.set_page(LOG_HEADERS, rows, failed)
+        self.logPageLabel.setText('Page ' + str(page + 1) + ' of ' + str(npages))
+        self.logPrev.setEnabled(page > 0)
+        self.logNext.setEnabled(page < npages - 1)
 
     def clear_log(self):
         conf = QMessageBox.question(self, "Confirmation", 
-                            "This action will clear the current log window. Continue?", 
+                            "This action will delete all entries of the copy/paste journal. Continue?", 
                             QMessageBox.Yes | QMessageBox.No)
         if conf == QMessageBox.Yes:
-            self.copyPasteLog.clear() 
-
-    def save_log(self):
-        dirpath = self.get_user_folder()
-        fpath   = os.path.join(dirpath, 'qcplog.txt')
-        if os.path.isfile(fpath):
-            logmsg = 'Log file overwritten'
-            conf   = QMessageBox.question(self, "Confirmation", 
-                                          "This action will overwrite the log file. Continue?", 
-                                          QMessageBox.Yes | QMessageBox.No)
-        else:
-            logmsg = 'New log file saved'
-            conf   = QMessageBox.Yes
-
-        if conf == QMessageBox.Yes:
-            with open(fpath, 'w') as outfile:
-                outfile.write(str(self.copyPasteLog.toPlainText()))
-                self.msg.pushInfo('GetFeats:', logmsg)
-
-    def append_log(self):
-        dirpath = self.get_user_folder()
-        fpath   = os.path.join(dirpath, 'qcplog.txt')
-        with open(fpath, 'a') as outfile:
-            outfile.write('\n' + str(self.copyPasteLog.toPlainText()))
-            self.msg.pushInfo('GetFeats:', 'Log appended to file')
-
-    def load_log(self):
-        dirpath = self.get_user_folder()
-        fpath   = os.path.join(dirpath, 'qcplog.txt')
-        # Only if there is something in the TextEdit
-        if str(self.copyPasteLog.toPlainText()) != '':
-            conf = QMessageBox.question(self, "Confirmation", 
-                                        "This action will clear the current log window. Continue?", 
-                                        QMessageBox.Yes | QMessageBox.No)
-        else:
-            conf = QMessageBox.Yes
-
-        if conf == QMessageBox.Yes:
-            if os.path.isfile(fpath):
-                with open(fpath, 'r') as infile:
-                    oldlog = open(fpath).read()
-                    self.copyPasteLog.setPlainText(oldlog)
-                    self.msg.pushInfo('GetFeats:', 'Log loaded from file')
-            else:
-                self.msg.pushInfo('GetFeats:', 'No log file found')
+            self.journal.clear()
+            self.update_log_filters()
+            self.show_log_page(0)
+
+    # qcplog.txt (saved from the older log page) goes into the journal, then is renamed so it is
+    # imported only once. The file is kept for reference
+    def import_old_log(self, dirpath):
+        fpath = os.path.join(dirpath, 'qcplog.txt')
+        if not os.path.isfile(fpath):
+            return
+
+        try:
+            nrows = self.journal.import_text_log(fpath)
+            os.replace(fpath, os.path.join(dirpath, 'qcplog_imported.txt'))
+        except (OSError, sqlite3.Error):
+            return
+
+        self.msg.pushInfo('GetFeats:', 'Imported ' + str(nrows) + ' entries of qcplog.txt into the log')
+
+    # Filtered journal to CSV, read in pages so a long history is never held at once
+    def export_log(self):
+        fpath   = os.path.join(self.get_user_folder(), 'qcplog.csv')
+        filters = self.log_filters()
+        with open(fpath, 'w', newline = '') as outfile:
+            writer = csv.writer(outfile)
+            writer.writerow(JOURNAL_COLUMNS)
+            offset = 0
+            while True:
+                entries = self.journal.query(10000, offset, **filters)
+                if not entries:
+                    break
+                writer.writerows(entries)
+                offset += len(entries)
+
+        self.msg.pushInfo('GetFeats:', 'Log exported to qcplog.csv')
 
     ####################
     ### Experimental ###
@@ -469,6 +668,23 @@ class PluginDialog(QDialog, FORM_CLASS):
             self.targetLayer.setShowCrs(True)
 
 
+    ###################
+    ### Diagnostics ###
+    ###################
+    # sections: [(title, [(label, value), ...]), ...]
+    def set_diagnostics(self, sections):
+        pre_blue = '<span style=" font-weight:600; font-style:bold;   color:#b7b0ff;">'
+        pre_bold = '<span style=" font-weight:600; font-style:bold;">'
+        suf      = '</span>'
+
+        self.diagnosticsText.clear()
+        for title, stats in sections:
+            self.diagnosticsText.append(pre_blue + title + suf)
+            for label, value in stats:
+                self.diagnosticsText.append(' - ' + label + ': ' + pre_bold + str(value) + suf)
+            self.diagnosticsText.append('')
+
+
     ####################
     ### Close Dialog ###
     #################### 
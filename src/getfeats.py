@@ -1,94 +1,97 @@
 # QGIS Core
-from qgis.core import QgsCoordinateTransform
 from qgis.core import QgsGeometry
-from qgis.core import QgsFeature
-from qgis.core import QgsFeatureRequest
-from qgis.core import QgsProject
-from qgis.core import QgsProcessing
-from qgis.core import QgsSettings
-from qgis.core import QgsUnitTypes
 
 # QGIS Utils
 from qgis.utils import iface
 
-# Python
-from importlib.machinery import SourceFileLoader
-import os
-import processing
-
 # Plugin
-from .utils       import make_new_layer
-from .input_check import InputCheck
-
-# This script can load from a variable filename
-try:
-    fname       = QgsSettings().value("GetFeats/customPrepFile", "custom_prep_lotr.py")
-    module_path = os.path.join(os.path.dirname(__file__), 'custom_prep', fname)
-    custom_prep = SourceFileLoader('custom_prep', module_path).load_module()
-except:
-    pass
+from .pipeline import dedupe_rows
+from .pipeline import project_rows
 
-def getfeats(obj, TARGET_LYR_NAME, SOURCE_LYR_NAME, SRC_FIELDS, OUT_FIELDS, FIELDMAP, 
+def getfeats(obj, target_lyr, source_lyr, SRC_FIELDS, OUT_FIELDS, FIELDMAP, 
              MAX_DISTANCE, NEIGHBORS, USE_CUSTOM_PREP):
-    target_lyr = QgsProject.instance().mapLayersByName(TARGET_LYR_NAME)[0]
-    target_ft  = InputCheck.check_valid_feature(obj, target_lyr)
+    lat       = obj.latency
+    target_ft = obj.chk.check_valid_feature(target_lyr)
+    lat.mark('validate')
+
+    if not target_ft:
+        lat.outcome('invalid')
 
     if target_ft:
+        # Same Target feature and parameters as a recent selection, reuse its rows
+        if USE_CUSTOM_PREP:
+            obj.result_cache.check_prep_mtime(obj.prep.refresh())
+        cache_key = obj.result_cache.make_key(target_lyr, target_ft, source_lyr, FIELDMAP,
+                                              MAX_DISTANCE, NEIGHBORS, USE_CUSTOM_PREP)
+        cached    = obj.result_cache.get(cache_key)
+        lat.mark('cache')
+        if cached is not None:
+            lat.outcome('cached')
+            select_source_feats(obj, source_lyr, cached[1])
+            obj.dlg.update_table(OUT_FIELDS, cached[2])
+            lat.mark('render')
+            return
+
         # Find the nearest neighbors
-        source_lyr     = QgsProject.instance().mapLayersByName(SOURCE_LYR_NAME)[0]
-        source_lyr_crs = source_lyr.crs()
-        target_lyr_crs = target_lyr.crs()
-        tr   = QgsCoordinateTransform(target_lyr_crs, source_lyr_crs, QgsProject.instance())
-        geom = QgsGeometry(target_ft.geometry())
-        geom.transform(tr)
-        
-        src_units = QgsUnitTypes.toString(source_lyr_crs.mapUnits())
-        mult      = QgsUnitTypes.fromUnitToUnitFactor(QgsUnitTypes.DistanceUnit(0), source_lyr_crs.mapUnits())
-        max_dist  = MAX_DISTANCE*mult
-        nns       = obj.spatial_idx.nearestNeighbor(geom, neighbors = NEIGHBORS, maxDistance = max_dist)
+        src_entry = obj.idx_reg.get(source_lyr, SRC_FIELDS, obj.src_index_crs(target_lyr),
+                                   obj.src_index_engine(source_lyr, target_lyr))
+        lat.mark('index')
+        if src_entry is None:
+            # Index still building, answered when it is ready
+            lat.outcome('waiting')
+            obj.pending_selection = True
+            return
 
-        if obj.dlg.selectFeats.isChecked():
-            if obj.source_lyr_last:
-                old_src_lyr = QgsProject.instance().mapLayersByName(obj.source_lyr_last)[0]
-                old_src_lyr.removeSelection()
-            source_lyr.selectByIds(nns)
-            obj.update_src_lyr_hist()
+        # The index may be in the Target CRS already, then the geometry is used as is
+        tr   = obj.crs_cache.transform(target_lyr.crs(), src_entry.crs)
+        geom = target_ft.geometry()
+        if tr is not None:
+            geom = QgsGeometry(geom)
+            geom.transform(tr)
 
-        # Extract the designated output fields and put into new layer
-        # Need this ordered by distance, but getFeatures reorders by fid, so do it the slow way
-        extracted_lyr = make_new_layer('extracted_lyr', OUT_FIELDS) 
-        features = []
-        for fid in nns:
-            f = next(source_lyr.getFeatures(QgsFeatureRequest().setFilterFid(fid)))
-            newfeat = QgsFeature(extracted_lyr.fields())
-            for fld in OUT_FIELDS:
-                if FIELDMAP[fld] in SRC_FIELDS:
-                    newfeat[fld] = f[FIELDMAP[fld]]
-                else:
-                    newfeat[fld] = FIELDMAP[fld]
+        max_dist = MAX_DISTANCE*obj.crs_cache.unit_factor(src_entry.crs)
+        lat.mark('transform')
+        nns      = src_entry.index.nearestNeighbor(geom, neighbors = NEIGHBORS, maxDistance = max_dist)
+        lat.mark('nearest')
 
-            features.append(newfeat)
+        select_source_feats(obj, source_lyr, nns)
 
-        extracted_lyr.dataProvider().addFeatures(features)
+        # Rows come from the attribute cache, in the same order as nns
+        src_rows = src_entry.attr_cache.get_rows(nns)
+        lat.mark('fetch')
 
-        # Delete duplicate rows
-        alg_params = {
-            'FIELDS': OUT_FIELDS,
-            'INPUT' : extracted_lyr,
-            'OUTPUT': QgsProcessing.TEMPORARY_OUTPUT
-        }
-        clean_lyr = processing.run('native:removeduplicatesbyattribute', alg_params)['OUTPUT']
+        # Project to the output fields and drop duplicate rows, nearest first
+        rows = dedupe_rows(project_rows(src_rows, OUT_FIELDS, FIELDMAP, SRC_FIELDS))
+        lat.mark('dedupe')
 
-        # Custom data prep is done here, see custom_prep.py
+        # Custom data prep is done here in a worker, see custom_prep.py
+        prep_ok = True
         if USE_CUSTOM_PREP:
-            try:
-                features = custom_prep.custom_prep(clean_lyr)
-            except:
+            rows, status = obj.prep.run(rows, OUT_FIELDS)
+            prep_ok      = status == 'ok'
+            if status == 'error':
                 iface.messageBar().pushInfo('GetFeats:', 'Error in custom prep. Skipping that step.')
-                features = clean_lyr.getFeatures()
-        else:
-            features = clean_lyr.getFeatures()
+            elif status == 'timeout':
+                iface.messageBar().pushInfo('GetFeats:', 'Custom prep took longer than ' + 
+                                            str(obj.prep.budget_ms) + ' ms. Skipping that step.')
+            elif status == 'busy':
+                iface.messageBar().pushInfo('GetFeats:', 'Custom prep is still running from an earlier selection. '
+                                            'Skipping that step.')
+            lat.mark('prep')
+
+        # Keep for repeated selections, unless prep failed and should be retried
+        if prep_ok:
+            obj.result_cache.put(cache_key, source_lyr.id(), nns, rows)
 
         # Update table in plugin dialog
-        obj.dlg.update_table(OUT_FIELDS, features)
+        obj.dlg.update_table(OUT_FIELDS, rows)
+        lat.mark('render')
+
+def select_source_feats(obj, source_lyr, nns):
+    if obj.dlg.selectFeats.isChecked():
+        old_src_lyr = obj.layers.layer(obj.source_lyr_last) if obj.source_lyr_last else None
+        if old_src_lyr is not None:
+            old_src_lyr.removeSelection()
+        source_lyr.selectByIds(nns)
+        obj.update_src_lyr_hist()
  
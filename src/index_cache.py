@@ -0,0 +1,165 @@
+# QGIS Core
+from qgis.core import Qgis
+from qgis.core import QgsCoordinateReferenceSystem
+from qgis.core import QgsCoordinateTransformContext
+from qgis.core import QgsDataProvider
+from qgis.core import QgsFeature
+from qgis.core import QgsFeatureRequest
+from qgis.core import QgsField
+from qgis.core import QgsFields
+from qgis.core import QgsProviderRegistry
+from qgis.core import QgsSpatialIndex
+from qgis.core import QgsVectorFileWriter
+
+# PyQt
+from qgis.PyQt.QtCore import QMetaType
+
+# Python
+from hashlib import sha1
+import os
+
+VERSION    = 'gfidx2'
+SUFFIX     = '.gfidx.gpkg'
+TMP_SUFFIX = SUFFIX + '.tmp.gpkg'
+LAYER_NAME = 'index'
+CHUNK      = 10000
+
+# On-disk copy of the stored index geometries, one GeoPackage per Source layer state
+# The GeoPackage fid is the Source fid, so a warm start bulk loads QgsSpatialIndex from the
+# OGR feature iterator without any per-feature Python call
+# Files are evicted least recently used first when the folder grows over max_mb
+class IndexDiskCache:
+
+    def __init__(self, folder, max_mb = 512):
+        self.folder = os.path.join(folder, 'index_cache')
+        self.max_mb = max_mb
+
+    def enabled(self):
+        return self.max_mb > 0
+
+    # Only layers stored in a local file have a change signal (the file mtime)
+    # Database providers (eg PostGIS) and memory layers can change without one, they are never cached
+    def cacheable(self, lyr):
+        return bool(self.lyr_files(lyr))
+
+    def lyr_files(self, lyr):
+        uri  = QgsProviderRegistry.instance().decodeUri(lyr.providerType(), lyr.source())
+        path = uri.get('path', '')
+
+        return [x for x in [path, path + '-wal'] if x and os.path.isfile(x)]
+
+    # Changes whenever the layer could contain different features, or they are stored in another CRS
+    def cache_key(self, lyr, index_crs = None):
+        parts = [VERSION, lyr.source(), lyr.subsetString(), lyr.crs().toWkt(), str(lyr.featureCount())]
+        if index_crs is not None:
+            parts.append(index_crs.toWkt())
+        for fpath in self.lyr_files(lyr):
+            parts.append(str(os.path.getmtime(fpath)))
+
+        return sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+    def fpath(self, key):
+        return os.path.join(self.folder, key + SUFFIX)
+
+    # Call from the main thread, the load/save below can then run in a task
+    def lyr_fpath(self, lyr, index_crs = None):
+        return self.fpath(self.cache_key(lyr, index_crs))
+
+    # Returns a bulk loaded index, or None when there is no valid cache file or feedback was canceled
+    def load(self, fpath, feedback = None):
+        if not self.enabled() or not os.path.isfile(fpath):
+            return None
+
+        provider = QgsProviderRegistry.instance().createProvider('ogr', fpath + '|layername=' + LAYER_NAME,
+                                                                 QgsDataProvider.ProviderOptions())
+        if provider is None or not provider.isValid() or not self.fids_match(provider):
+            self.remove_file(fpath)
+            return None
+
+        request = QgsFeatureRequest().setNoAttributes()
+        index   = QgsSpatialIndex(provider.getFeatures(request), feedback,
+                                  QgsSpatialIndex.Flag.FlagStoreFeatureGeometries)
+        del provider
+        if feedback is not None and feedback.isCanceled():
+            return None
+
+        # Mark as recently used
+        os.utime(fpath)
+
+        return index
+
+    # The fid field must be the GeoPackage fid, ie the Source fid
+    def fids_match(self, provider):
+        for feat in provider.getFeatures(QgsFeatureRequest().setLimit(1)):
+            return feat.attribute('fid') == feat.id()
+
+        return True
+
+    def save(self, fpath, index, fids):
+        if not self.enabled():
+            return
+
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder, exist_ok = True)
+
+        fields = QgsFields()
+        fields.append(QgsField('fid', QMetaType.Type.LongLong))
+        opts = QgsVectorFileWriter.SaveVectorOptions()
+        opts.driverName   = 'GPKG'
+        opts.layerName    = LAYER_NAME
+        opts.layerOptions = ['SPATIAL_INDEX=NO']
+
+        # Write to a temp file first so a partial file is never loaded
+        tmp = fpath[:-len(SUFFIX)] + TMP_SUFFIX
+        self.remove_file(tmp)
+        writer = QgsVectorFileWriter.create(tmp, fields, Qgis.WkbType.Unknown, QgsCoordinateReferenceSystem(),
+                                            QgsCoordinateTransformContext(), opts)
+        if writer.hasError() != QgsVectorFileWriter.WriterError.NoError:
+            del writer
+            self.remove_file(tmp)
+            return
+
+        feats = []
+        ok    = True
+        for fid in fids:
+            geom = index.geometry(fid)
+            if not geom.isNull():
+                feat = QgsFeature(fields, fid)
+                feat.setAttributes([fid])
+                feat.setGeometry(geom)
+                feats.append(feat)
+            if len(feats) == CHUNK:
+                ok    = ok and writer.addFeatures(feats)
+                feats = []
+        ok = ok and writer.addFeatures(feats)
+        del writer
+
+        try:
+            if not ok:
+                raise OSError('Index cache write failed')
+            os.replace(tmp, fpath)
+        except OSError:
+            self.remove_file(tmp)
+            return
+
+        self.evict()
+
+    # Drop the least recently used files until under the size cap
+    # Temp files left by an interrupted save count too, they are older than any save in progress
+    def evict(self):
+        files = [os.path.join(self.folder, x) for x in os.listdir(self.folder)
+                 if x.endswith(SUFFIX) or x.endswith(TMP_SUFFIX)]
+        files = sorted(files, key = os.path.getmtime)
+        total = sum(os.path.getsize(x) for x in files)
+
+        max_bytes = self.max_mb*1024*1024
+        while files and total > max_bytes:
+            fpath  = files.pop(0)
+            total -= os.path.getsize(fpath)
+            self.remove_file(fpath)
+
+    def remove_file(self, fpath):
+        try:
+            os.remove(fpath)
+        except OSError:
+            pass
@@ -0,0 +1,303 @@
+# QGIS Core
+from qgis.core import QgsApplication
+from qgis.core import QgsCoordinateTransform
+from qgis.core import QgsFeature
+from qgis.core import QgsGeometry
+from qgis.core import QgsProject
+
+# PyQt
+from qgis.PyQt.QtCore import QObject
+from qgis.PyQt.QtCore import pyqtSignal
+
+# Plugin
+from .crs_cache  import crs_key
+from .index_task import IndexBuildTask
+
+# Spatial index and attribute cache of one Source layer
+class IndexEntry:
+
+    def __init__(self, lyr, on_edit = None, index_crs = None, engine = 'qgis'):
+        self.lyr        = lyr
+        self.on_edit    = on_edit
+        self.lyr_id     = lyr.id()
+        self.index      = None
+        self.attr_cache = None
+        self.stale      = False
+        self.engine     = engine
+
+        # CRS of the stored geometries, edits are transformed to it when it is not the layer CRS
+        self.crs     = index_crs if index_crs is not None else lyr.crs()
+        self.crs_key = crs_key(self.crs)
+        self.tr      = None
+        if self.crs_key != crs_key(lyr.crs()):
+            self.tr = QgsCoordinateTransform(lyr.crs(), self.crs, QgsProject.instance())
+
+        # While the index builds in a task, edits are only recorded and synced afterwards
+        self.building = True
+        self.dirty    = set()
+
+        self.on_lyr_deleted = None
+
+    ##########################
+    ### Incremental update ###
+    ##########################
+    def on_feat_added(self, fid):
+        self.notify()
+        if self.building:
+            self.dirty.add(fid)
+            return
+
+        feat = self.lyr.getFeature(fid)
+        if feat.hasGeometry():
+            self.remove_geom(fid)
+            self.add_geom(feat)
+
+    def on_feat_deleted(self, fid):
+        self.notify()
+        if self.building:
+            self.dirty.add(fid)
+            return
+
+        self.remove_geom(fid)
+
+    def on_geom_changed(self, fid, geom):
+        self.notify()
+        if self.building:
+            self.dirty.add(fid)
+            return
+
+        self.remove_geom(fid)
+        feat = QgsFeature(fid)
+        feat.setGeometry(geom)
+        self.add_geom(feat)
+
+    def on_attr_changed(self, fid, fld_idx, value):
+        self.notify()
+        # Once built, the attribute cache patches itself
+        if self.building:
+            self.dirty.add(fid)
+
+    def add_geom(self, feat):
+        if self.tr is not None:
+            geom = QgsGeometry(feat.geometry())
+            geom.transform(self.tr)
+            feat.setGeometry(geom)
+        self.index.addFeature(feat)
+
+    # The index finds an entry by its bounding box, use the stored geometry
+    def remove_geom(self, fid):
+        old_geom = self.index.geometry(fid)
+        if not old_geom.isNull():
+            feat = QgsFeature(fid)
+            feat.setGeometry(old_geom)
+            self.index.deleteFeature(feat)
+
+    # Re-read every feature edited while the task was running
+    def sync_dirty(self):
+        for fid in self.dirty:
+            feat = self.lyr.getFeature(fid)
+            self.remove_geom(fid)
+            self.attr_cache.on_feat_deleted(fid)
+            if feat.isValid():
+                if feat.hasGeometry():
+                    self.add_geom(feat)
+                self.attr_cache.add(feat)
+
+        self.dirty    = set()
+        self.building = False
+
+    def mark_stale(self):
+        self.stale = True
+        self.notify()
+
+    def notify(self):
+        if self.on_edit is not None:
+            self.on_edit(self.lyr_id)
+
+
+# One IndexEntry per Source layer id, reused until the layer data source changes
+# With a disk cache the stored geometries are also kept across QGIS sessions
+# Builds run in a QgsTask, the previous entry keeps answering until the new one is swapped in
+class SpatialIndexRegistry(QObject):
+
+    buildProgress = pyqtSignal(str, float)
+    buildFinished = pyqtSignal(str, bool)
+    sourceEdited  = pyqtSignal(str)
+
+    def __init__(self, disk_cache = None):
+        super().__init__()
+        self.entries    = {}
+        self.tasks      = {}
+        self.disk_cache = disk_cache
+
+    # index_crs is the CRS to store the geometries in, None for the layer CRS
+    # engine is the neighbor engine of index_task.make_index
+    # Returns None when there is no usable index yet, a build is then started
+    # While rebuilding for another CRS the old entry keeps answering, queries use entry.crs
+    def get(self, lyr, SRC_FIELDS, index_crs = None, engine = 'qgis'):
+        entry = self.entries.get(lyr.id())
+        if self.is_current(entry, lyr, SRC_FIELDS, index_crs, engine):
+            return entry
+
+        self.start_build(lyr, SRC_FIELDS, entry, index_crs, engine)
+
+        if entry is not None and entry.attr_cache.covers(lyr, SRC_FIELDS):
+            return entry
+
+        return None
+
+    # Same as get, but builds on the calling thread, eg for scripts and benchmarks
+    def get_now(self, lyr, SRC_FIELDS, index_crs = None, engine = 'qgis'):
+        entry = self.entries.get(lyr.id())
+        if self.is_current(entry, lyr, SRC_FIELDS, index_crs, engine):
+            return entry
+
+        self.cancel(lyr.id())
+        task = self.make_task(lyr, SRC_FIELDS, entry, index_crs, engine)
+        task.run()
+        self.swap(task)
+
+        return self.entries[lyr.id()]
+
+    def is_current(self, entry, lyr, SRC_FIELDS, index_crs, engine = 'qgis'):
+        return entry is not None and not entry.stale and entry.attr_cache.covers(lyr, SRC_FIELDS) \
+               and entry.crs_key == crs_key(index_crs if index_crs is not None else lyr.crs()) \
+               and entry.engine == engine
+
+    def is_building(self, lyr_id = None):
+        return lyr_id in self.tasks if lyr_id else bool(self.tasks)
+
+    def start_build(self, lyr, SRC_FIELDS, old_entry, index_crs = None, engine = 'qgis'):
+        lyr_id = lyr.id()
+
+        # Only the current Source layer is built, drop the others
+        for other_id in list(self.tasks):
+            if other_id != lyr_id:
+                self.cancel(other_id)
+
+        running = self.tasks.get(lyr_id)
+        if running is not None:
+            if set(SRC_FIELDS).issubset(running.SRC_FIELDS) and running.entry.crs_key == \
+               crs_key(index_crs if index_crs is not None else lyr.crs()) and running.engine == engine:
+                return
+            self.cancel(lyr_id)
+
+        task = self.make_task(lyr, SRC_FIELDS, old_entry, index_crs, engine)
+        task.progressChanged.connect(self.on_task_progress)
+        task.taskCompleted.connect(self.on_task_completed)
+        task.taskTerminated.connect(self.on_task_terminated)
+
+        self.tasks[lyr_id] = task
+        QgsApplication.taskManager().addTask(task)
+
+    def make_task(self, lyr, SRC_FIELDS, old_entry, index_crs = None, engine = 'qgis'):
+        entry = IndexEntry(lyr, self.sourceEdited.emit, index_crs, engine)
+
+        # Same data source, CRS and engine, only the fields changed: reuse the geometry index
+        reuse_index = None
+        if old_entry is not None and not old_entry.stale and not old_entry.building \
+           and old_entry.crs_key == entry.crs_key and old_entry.engine == engine:
+            reuse_index = old_entry.index
+
+        # Unsaved edits are not part of the cache key, skip the disk cache then
+        # Layers without a file mtime to detect changes are never cached, see IndexDiskCache.cacheable
+        # The disk cache stores QgsSpatialIndex data, the segment grid is always rebuilt
+        use_disk   = self.disk_cache is not None and self.disk_cache.enabled() and not lyr.isModified() \
+                     and engine == 'qgis' and self.disk_cache.cacheable(lyr)
+        task       = IndexBuildTask(lyr, SRC_FIELDS, self.disk_cache if use_disk else None, reuse_index,
+                                    entry.crs if entry.tr is not None else None, engine)
+        task.entry = entry
+        self.connect(task.entry)
+
+        return task
+
+    def swap(self, task):
+        entry            = task.entry
+        entry.index      = task.index
+        entry.attr_cache = task.attr_cache
+        entry.attr_cache.attach(entry.lyr)
+        entry.sync_dirty()
+
+        old_entry = self.entries.get(entry.lyr_id)
+        if old_entry is not None:
+            self.disconnect(old_entry)
+        self.entries[entry.lyr_id] = entry
+
+    def cancel(self, lyr_id):
+        task = self.tasks.pop(lyr_id, None)
+        if task is not None:
+            self.disconnect(task.entry)
+            task.cancel()
+            self.buildFinished.emit(lyr_id, False)
+
+    def cancel_all(self):
+        for lyr_id in list(self.tasks):
+            self.cancel(lyr_id)
+
+    ######################
+    ### Task callbacks ###
+    ######################
+    def on_task_progress(self, progress):
+        task = self.sender()
+        if self.tasks.get(task.lyr_id) is task:
+            self.buildProgress.emit(task.lyr_id, progress)
+
+    def on_task_completed(self):
+        task = self.sender()
+        if self.tasks.get(task.lyr_id) is task:
+            del self.tasks[task.lyr_id]
+            self.swap(task)
+            self.buildFinished.emit(task.lyr_id, True)
+
+    def on_task_terminated(self):
+        task = self.sender()
+        if self.tasks.get(task.lyr_id) is task:
+            del self.tasks[task.lyr_id]
+            self.disconnect(task.entry)
+            self.buildFinished.emit(task.lyr_id, False)
+
+    ###############
+    ### Signals ###
+    ###############
+    def connect(self, entry):
+        lyr = entry.lyr
+        lyr.featureAdded.connect(entry.on_feat_added)
+        lyr.featureDeleted.connect(entry.on_feat_deleted)
+        lyr.geometryChanged.connect(entry.on_geom_changed)
+        lyr.attributeValueChanged.connect(entry.on_attr_changed)
+        lyr.dataSourceChanged.connect(entry.mark_stale)
+        lyr.subsetStringChanged.connect(entry.mark_stale)
+        lyr.crsChanged.connect(entry.mark_stale)
+
+        # Free the index when the layer is removed from the project
+        entry.on_lyr_deleted = lambda: self.remove(entry.lyr_id)
+        lyr.willBeDeleted.connect(entry.on_lyr_deleted)
+
+    def disconnect(self, entry):
+        lyr = entry.lyr
+        try:
+            lyr.featureAdded.disconnect(entry.on_feat_added)
+            lyr.featureDeleted.disconnect(entry.on_feat_deleted)
+            lyr.geometryChanged.disconnect(entry.on_geom_changed)
+            lyr.attributeValueChanged.disconnect(entry.on_attr_changed)
+            lyr.dataSourceChanged.disconnect(entry.mark_stale)
+            lyr.subsetStringChanged.disconnect(entry.mark_stale)
+            lyr.crsChanged.disconnect(entry.mark_stale)
+            lyr.willBeDeleted.disconnect(entry.on_lyr_deleted)
+        except (RuntimeError, TypeError):
+            # Layer already deleted
+            pass
+
+        if entry.attr_cache is not None:
+            entry.attr_cache.disconnect()
+
+    def remove(self, lyr_id):
+        self.cancel(lyr_id)
+        entry = self.entries.pop(lyr_id, None)
+        if entry is not None:
+            self.disconnect(entry)
+
+    def clear(self):
+        self.cancel_all()
+        for lyr_id in list(self.entries):
+            self.remove(lyr_id)
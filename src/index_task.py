@@ -0,0 +1,130 @@
+# QGIS Core
+from qgis.core import Qgis
+from qgis.core import QgsFeatureRequest
+from qgis.core import QgsFeedback
+from qgis.core import QgsProject
+from qgis.core import QgsSpatialIndex
+from qgis.core import QgsTask
+from qgis.core import QgsVectorLayerFeatureSource
+from qgis.core import QgsWkbTypes
+
+# Python
+from importlib.util import find_spec
+
+# Plugin
+from .attr_cache import AttrCache
+
+# Found without importing it, numpy is only imported once the NumPy engine is used
+def numpy_available():
+    return find_spec('numpy') is not None
+
+# The NumPy engine is used for line Source layers queried by single point Target layers
+def engine_supports(source_lyr, target_lyr):
+    return numpy_available() and source_lyr.geometryType() == Qgis.GeometryType.Line \
+           and QgsWkbTypes.flatType(target_lyr.wkbType()) == Qgis.WkbType.Point
+
+# Empty index of the neighbor engine, 'qgis' or 'numpy' (segment_index.SegmentIndex)
+def make_index(engine = 'qgis'):
+    if engine == 'numpy':
+        from .segment_index import SegmentIndex
+        return SegmentIndex()
+
+    return QgsSpatialIndex(flags = QgsSpatialIndex.Flag.FlagStoreFeatureGeometries)
+
+# Source index of the engine from a geometry-only iterator, None when canceled
+# QgsSpatialIndex is bulk loaded: the tree is packed in C++, much faster than one addFeature per feature.
+# PyQGIS only bulk loads from a QgsFeatureIterator, so attributes are read by fill_attr_cache in a second pass
+# The NumPy engine takes the features one by one, then builds its grid once
+def build_index(features, engine = 'qgis', feedback = None):
+    if engine == 'numpy':
+        index = make_index(engine)
+        for cnt, f in enumerate(features):
+            if feedback is not None and cnt % 1000 == 0 and feedback.isCanceled():
+                return None
+            if f.hasGeometry():
+                index.addFeature(f)
+        index.flush()
+
+        return index
+
+    index = QgsSpatialIndex(features, feedback, QgsSpatialIndex.Flag.FlagStoreFeatureGeometries)
+    if feedback is not None and feedback.isCanceled():
+        return None
+
+    return index
+
+# Fills the attribute cache, progress goes from start to 100
+# feedback can be a QgsTask or QgsFeedback, returns False when canceled
+def fill_attr_cache(features, attr_cache, feedback = None, nfeats = 1, start = 0):
+    for cnt, f in enumerate(features):
+        if feedback is not None and cnt % 1000 == 0:
+            if feedback.isCanceled():
+                return False
+            feedback.setProgress(start + (100 - start)*cnt/max(nfeats, 1))
+
+        attr_cache.add(f)
+
+    return True
+
+# Builds the Source index and attribute cache off the GUI thread
+# Everything touching the layer itself is done in __init__, on the main thread
+class IndexBuildTask(QgsTask):
+
+    def __init__(self, lyr, SRC_FIELDS, disk_cache = None, index = None, index_crs = None, engine = 'qgis'):
+        super().__init__('GetFeats: Building ' + lyr.name() + ' index', QgsTask.Flag.CanCancel)
+        self.lyr_id     = lyr.id()
+        self.SRC_FIELDS = list(SRC_FIELDS)
+        self.fields     = lyr.fields()
+        self.nfeats     = max(lyr.featureCount(), 1)
+        self.source     = QgsVectorLayerFeatureSource(lyr)
+
+        # Given an index only the attribute cache is filled, geometry is not read
+        self.index      = index
+        self.attr_cache = AttrCache()
+        self.disk_cache = disk_cache
+        self.disk_fpath = disk_cache.lyr_fpath(lyr, index_crs) if disk_cache else None
+
+        # Geometries are stored in index_crs when given, else in the layer CRS
+        self.index_crs  = index_crs
+        self.engine     = engine
+        self.tr_context = QgsProject.instance().transformContext()
+        self.from_disk  = False
+        self.entry      = None
+
+        # The bulk load only takes a QgsFeedback, it follows the task
+        self.feedback   = QgsFeedback()
+        self.feedback.progressChanged.connect(lambda progress: self.setProgress(progress/2))
+
+    def cancel(self):
+        self.feedback.cancel()
+        super().cancel()
+
+    def run(self):
+        if self.index is None and self.disk_fpath:
+            self.index     = self.disk_cache.load(self.disk_fpath, self.feedback)
+            self.from_disk = self.index is not None
+            if self.isCanceled():
+                return False
+
+        # Geometry pass, skipped when an index is reused or loaded from disk
+        fill_index = self.index is None
+        if fill_index:
+            geom_request = QgsFeatureRequest().setNoAttributes()
+            if self.index_crs is not None:
+                geom_request.setDestinationCrs(self.index_crs, self.tr_context)
+            self.index = build_index(self.source.getFeatures(geom_request), self.engine, self.feedback)
+            if self.index is None:
+                return False
+
+        # Attribute pass, geometry is not read
+        request = QgsFeatureRequest().setSubsetOfAttributes(self.SRC_FIELDS, self.fields)
+        request.setFlags(Qgis.FeatureRequestFlag.NoGeometry)
+        self.attr_cache.reset(self.SRC_FIELDS, self.fields)
+        if not fill_attr_cache(self.source.getFeatures(request), self.attr_cache, self, self.nfeats,
+                               50 if fill_index else 0):
+            return False
+
+        if fill_index and self.disk_fpath:
+            self.disk_cache.save(self.disk_fpath, self.index, self.attr_cache.fids)
+
+        return True
@@ -1,29 +1,27 @@
 # QGIS Core
 from qgis.core import QgsApplication
-from qgis.core import QgsProject
+from qgis.core import QgsFeatureRequest
+from qgis.core import QgsSettings
 from qgis.core import QgsWkbTypes
 
 # QGIS Utils
 from qgis.utils import iface
 
+# Plugin
+from .layer_registry import LayerRegistry
+from .table_tracker  import AttrTableTracker
+
 class InputCheck:
 
-    def __init__(self):
-        self.iface = iface
-        self.msg   = self.iface.messageBar()
-        self.qapp  = QgsApplication.instance()
-
-    def check_dup_layernames(self, dlg):
-        names = [layer.name() for layer in QgsProject.instance().mapLayers().values()]
-        flag  = len(set(names)) == len(names)
-        if flag:
-            dlg.activatePlugin.setEnabled(True)
-        else:
-            dlg.activatePlugin.setChecked(False)
-            dlg.activatePlugin.setEnabled(False)
-            self.msg.pushInfo('GetFeats:', 'Project contains multiple layers with same name')
+    def __init__(self, layers = None):
+        self.iface  = iface
+        self.msg    = self.iface.messageBar()
+        self.qapp   = QgsApplication.instance()
+        self.layers = layers if layers is not None else LayerRegistry()
+        self.tables = AttrTableTracker()
 
-        return flag
+        # (layer id, feature) of the last valid Target selection
+        self.valid_ft = None
 
     def check_dup_outfields(self, OUT_FIELDS):
         flag  = len(set(OUT_FIELDS)) == len(OUT_FIELDS)
@@ -32,19 +30,25 @@ class InputCheck:
 
         return flag
 
-    def check_lyr_valid(self, lyr_name):
-        lyrs  = QgsProject.instance().mapLayersByName(lyr_name)
-        nlyrs = len(lyrs)
-        res   = []
-        if nlyrs == 1:
-            res = lyrs[0]
-        elif nlyrs == 0:
-            self.msg.pushInfo('GetFeats:', lyr_name + ' not found')
-        elif nlyrs > 1:
-            self.msg.pushInfo('GetFeats:', 'Multiple layers found named ' + lyr_name)
+    def check_lyr_valid(self, lyr_id):
+        res = self.layers.layer(lyr_id)
+        if res is None:
+            self.msg.pushInfo('GetFeats:', 'Layer ' + self.layer_name(lyr_id) + ' not found')
+            res = []
 
         return res
 
+    # Name for messages: from the project layers, else the name saved with this id in settings, else the id
+    def layer_name(self, lyr_id):
+        name = self.layers.name(lyr_id)
+        if name is None:
+            s = QgsSettings()
+            for key in ['sourceLayer', 'targetLayer']:
+                if lyr_id and s.value('GetFeats/' + key + 'Id', '') == lyr_id:
+                    name = s.value('GetFeats/' + key, None)
+
+        return name or lyr_id
+
     def check_same_length_src_out(self, SRC_FIELDS0, OUT_FIELDS):
         flag = len(SRC_FIELDS0) == len(OUT_FIELDS)
         if not flag:
@@ -64,8 +68,7 @@ class InputCheck:
         return target_present and src_present
 
     def check_attr_table_open(self, lyr):
-        open_tables = [x for x in self.qapp.allWidgets() if 'QgsAttributeTableDialog' in x.objectName()]
-        flag        = any([lyr.id() in x.objectName() for x in open_tables])
+        flag = self.tables.is_open(lyr.id())
         if not flag:
             self.msg.pushInfo('GetFeats:', lyr.name() + ' attribute table not open')
         return flag
@@ -76,31 +79,30 @@ class InputCheck:
             self.msg.pushInfo('GetFeats:', lyr.name() + ' not in edit mode')
         return flag
 
-    def check_valid_feature(self, target_lyr, warn_nofeat = False):
-        feat_count   = target_lyr.selectedFeatureCount()
-        sel_feats    = target_lyr.selectedFeatures()
+    # Drop the validated Target feature, called on selection changes and edits of the Target layer
+    def clear_valid_feature(self, *args):
+        self.valid_ft = None
 
-        # If it is point layer, this will select only the first feature.
-        # Otherwise it is skipped when two points with same geom selected (tested only polygon)
-        if target_lyr.wkbType() == QgsWkbTypes.Point:
-            feat_coords  = [x.geometry().asPoint() for x in sel_feats]
-        else:
-            feat_coords  = [x.geometry() for x in sel_feats]
+    def check_valid_feature(self, target_lyr, warn_nofeat = False):
+        # Same selection as the last check and no edits since
+        if self.valid_ft is not None and self.valid_ft[0] == target_lyr.id():
+            return self.valid_ft[1]
 
-        unique_geoms = len(set(feat_coords))
-    
         target_ft = []
         if 'fid' not in target_lyr.fields().names():
             self.msg.pushInfo('GetFeats:', 'Skipped. No fid field in ' + target_lyr.name())
+            return target_ft
+
+        sel_ids    = target_lyr.selectedFeatureIds()
+        feat_count = len(sel_ids)
+        first_id, unique_geoms = self.count_sel_locations(target_lyr, sel_ids)
     
-        elif unique_geoms < 1:
+        if unique_geoms < 1:
             if warn_nofeat:
                 self.msg.pushInfo('GetFeats:', target_lyr.name() + ' has no feature selected')
-            else:
-                pass
     
         elif unique_geoms == 1:
-            target_ft = sel_feats[0]
+            target_ft = target_lyr.getFeature(first_id)
             fid       = target_ft.attribute('fid')
             if not str(fid).isdigit():
                 self.msg.pushInfo('GetFeats:', 'Skipped. Selected feature has invalid fid = ' + str(fid))
@@ -110,13 +112,34 @@ class InputCheck:
                 self.msg.pushInfo('GetFeats:', 'Skipped. Feature id = ' + str(target_ft.id()) + ' does not match fid = ' +  str(fid))
                 target_ft = []
     
-            elif feat_count > 1:
+            else:
+                if feat_count > 1:
                     self.msg.pushInfo('GetFeats:', 'Selected only the first feature (fid: ' + str(fid) + ')')
+                self.valid_ft = (target_lyr.id(), target_ft)
     
         elif unique_geoms > 1:
                 self.msg.pushInfo('GetFeats:', 'Skipped. Features at multiple locations selected')
     
         return target_ft
 
+    # Returns the first selected fid and 0, 1 or 2 (two or more) distinct locations
+    # Only geometries are read, and reading stops at the second location
+    def count_sel_locations(self, target_lyr, sel_ids):
+        if not sel_ids:
+            return None, 0
 
-
+        # If it is point layer, this will select only the first feature.
+        # Otherwise it is skipped when two points with same geom selected (tested only polygon)
+        is_point = target_lyr.wkbType() == QgsWkbTypes.Point
+
+        request   = QgsFeatureRequest().setFilterFids(sel_ids).setNoAttributes()
+        first_id  = None
+        first_loc = None
+        for feat in target_lyr.getFeatures(request):
+            loc = feat.geometry().asPoint() if is_point else bytes(feat.geometry().asWkb())
+            if first_id is None:
+                first_id, first_loc = feat.id(), loc
+            elif loc != first_loc:
+                return first_id, 2
+
+        return first_id, 0 if first_id is None else 1
@@ -0,0 +1,121 @@
+# Python
+from datetime import datetime
+import os
+import re
+import sqlite3
+import time
+
+# Lines of the older text log (qcplog.txt), written from the log page as plain text:
+#   <QDateTime.toString()>: <field> of fid <fid> in <layer> from <old value> to <new value>
+OLD_LOG_LINE = re.compile(r'^(.+?): (.+?) of fid (-?\d+) in (.+?) from (.*) to (.*)$')
+OLD_LOG_TS   = '%a %b %d %H:%M:%S %Y'
+
+COLUMNS = ['ts', 'layer_name', 'fid', 'field', 'old_value', 'new_value', 'ok', 'kind']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pastes (
+    id         INTEGER PRIMARY KEY,
+    ts         REAL    NOT NULL,
+    layer_id   TEXT    NOT NULL,
+    layer_name TEXT    NOT NULL,
+    fid        INTEGER,
+    field      TEXT    NOT NULL,
+    old_value  TEXT,
+    new_value  TEXT,
+    ok         INTEGER NOT NULL,
+    kind       TEXT    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pastes_ts    ON pastes (ts);
+CREATE INDEX IF NOT EXISTS pastes_layer ON pastes (layer_name, ts);
+CREATE INDEX IF NOT EXISTS pastes_field ON pastes (field, ts);
+'''
+
+# Append-only SQLite journal of the quick copy/paste edits, in the plugin user folder
+# Each paste is committed as it happens, the log page reads it back one page at a time
+class PasteJournal:
+
+    def __init__(self, fpath):
+        self.fpath = fpath
+        self.conn  = None
+
+    # Opened on first use, so the dialog does not touch the file until a paste or the log page
+    def db(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.fpath)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.executescript(SCHEMA)
+
+        return self.conn
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def add(self, lyr, fid, field, old_value, new_value, ok, kind = 'paste'):
+        self.add_many(lyr, [(fid, field, old_value, new_value, ok)], kind)
+
+    # entries are (fid, field, old value, new value, ok), written in one transaction
+    def add_many(self, lyr, entries, kind = 'paste'):
+        ts   = time.time()
+        rows = [(ts, lyr.id(), lyr.name(), fid, field, str(old), str(new), int(bool(ok)), kind)
+                for fid, field, old, new, ok in entries]
+        with self.db():
+            self.db().executemany('INSERT INTO pastes (ts, layer_id, layer_name, fid, field, old_value, '
+                                  'new_value, ok, kind) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    # One-time import of the older text log, returns the number of entries added
+    # The text kept no pass/fail color, entries are added as ok with kind 'imported'
+    # Lines without a readable time get the file time
+    def import_text_log(self, fpath):
+        file_ts = os.path.getmtime(fpath)
+        rows    = []
+        with open(fpath, 'r', errors = 'replace') as infile:
+            for line in infile:
+                match = OLD_LOG_LINE.match(line.strip())
+                if match is None:
+                    continue
+                dt, field, fid, lyr_name, old, new = match.groups()
+                try:
+                    ts = datetime.strptime(dt, OLD_LOG_TS).timestamp()
+                except ValueError:
+                    ts = file_ts
+                rows.append((ts, '', lyr_name, int(fid), field, old, new, 1, 'imported'))
+
+        with self.db():
+            self.db().executemany('INSERT INTO pastes (ts, layer_id, layer_name, fid, field, old_value, '
+                                  'new_value, ok, kind) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+        return len(rows)
+
+    def where(self, layer_name = None, field = None, t0 = None, t1 = None):
+        conds  = []
+        params = []
+        for cond, val in [('layer_name = ?', layer_name), ('field = ?', field), ('ts >= ?', t0), ('ts <= ?', t1)]:
+            if val is not None:
+                conds.append(cond)
+                params.append(val)
+
+        return (' WHERE ' + ' AND '.join(conds) if conds else ''), params
+
+    # Newest first
+    def query(self, limit, offset = 0, **filters):
+        where, params = self.where(**filters)
+        sql = 'SELECT ' + ', '.join(COLUMNS) + ' FROM pastes' + where + ' ORDER BY ts DESC, id DESC LIMIT ? OFFSET ?'
+
+        return self.db().execute(sql, params + [limit, offset]).fetchall()
+
+    def count(self, **filters):
+        where, params = self.where(**filters)
+
+        return self.db().execute('SELECT COUNT(*) FROM pastes' + where, params).fetchone()[0]
+
+    def distinct(self, column):
+        sql = 'SELECT DISTINCT ' + column + ' FROM pastes ORDER BY ' + column
+
+        return [x[0] for x in self.db().execute(sql)]
+
+    def clear(self):
+        with self.db():
+            self.db().execute('DELETE FROM pastes')
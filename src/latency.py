@@ -0,0 +1,120 @@
+# Python
+from collections import deque
+from datetime    import datetime
+from time        import perf_counter
+import csv
+import json
+import os
+
+# Stages of one selection -> table event, in pipeline order
+STAGES = ['validate', 'cache', 'index', 'transform', 'nearest', 'fetch', 'dedupe', 'prep', 'render']
+
+def percentile(sorted_vals, pct):
+    if not sorted_vals:
+        return 0
+    idx = min(int(round(pct/100*(len(sorted_vals) - 1))), len(sorted_vals) - 1)
+
+    return sorted_vals[idx]
+
+# Per-stage timings of the last `window` selection events
+# mark() is called between stages, it returns right away when no event is being recorded,
+# so with recording off the pipeline only pays for that attribute check
+class LatencyRecorder:
+
+    def __init__(self, enabled = False, window = 1000, nslowest = 10):
+        self.enabled  = enabled
+        self.window   = window
+        self.nslowest = nslowest
+        self.current  = None
+        self.clear()
+
+    def clear(self):
+        self.events  = deque(maxlen = self.window)
+        self.samples = {stage: deque(maxlen = self.window) for stage in STAGES + ['total']}
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        self.current = None
+
+    ##############
+    ### Events ###
+    ##############
+    def begin(self):
+        if self.enabled:
+            self.t0      = self.last = perf_counter()
+            self.current = {'ts': datetime.now().isoformat(timespec = 'milliseconds'), 'outcome': 'table'}
+
+    # Time since the previous mark goes to stage
+    def mark(self, stage):
+        if self.current is None:
+            return
+        now = perf_counter()
+        self.current[stage] = self.current.get(stage, 0) + (now - self.last)*1000
+        self.last = now
+
+    # Why the event stopped early, eg cached or waiting for the index
+    def outcome(self, outcome):
+        if self.current is not None:
+            self.current['outcome'] = outcome
+
+    def end(self):
+        if self.current is None:
+            return
+        event, self.current = self.current, None
+        event['total'] = (perf_counter() - self.t0)*1000
+        for stage in STAGES + ['total']:
+            if stage in event:
+                self.samples[stage].append(event[stage])
+        self.events.append(event)
+
+    ###############
+    ### Reports ###
+    ###############
+    def summary(self):
+        summary = {}
+        for stage in STAGES + ['total']:
+            vals = sorted(self.samples[stage])
+            if vals:
+                summary[stage] = {'count': len(vals),
+                                  'p50':   percentile(vals, 50),
+                                  'p95':   percentile(vals, 95),
+                                  'p99':   percentile(vals, 99),
+                                  'max':   vals[-1]}
+
+        return summary
+
+    def slowest(self):
+        return sorted(self.events, key = lambda x: x['total'], reverse = True)[:self.nslowest]
+
+    def stats(self):
+        stats = [('Recording', 'On' if self.enabled else 'Off'),
+                 ('Events',    str(len(self.events)) + ' / ' + str(self.window))]
+        for stage, vals in self.summary().items():
+            stats.append((stage + ' p50/p95/p99', '%.2f / %.2f / %.2f ms' % (vals['p50'], vals['p95'], vals['p99'])))
+
+        return stats
+
+    def slowest_stats(self):
+        stats = []
+        for event in self.slowest():
+            parts = ['%s %.1f' % (stage, event[stage]) for stage in STAGES if stage in event]
+            stats.append((event['ts'][11:], '%.1f ms (%s) %s' % (event['total'], event['outcome'], ', '.join(parts))))
+
+        return stats
+
+    # Writes latency.csv (one row per event) and latency.json (summary and events), returns the paths
+    def export(self, folder):
+        csv_fpath  = os.path.join(folder, 'latency.csv')
+        json_fpath = os.path.join(folder, 'latency.json')
+        columns    = ['ts', 'outcome', 'total'] + STAGES
+
+        with open(csv_fpath, 'w', newline = '') as outfile:
+            writer = csv.writer(outfile)
+            writer.writerow(columns)
+            for event in self.events:
+                writer.writerow([event.get(col, '') for col in columns])
+
+        with open(json_fpath, 'w') as outfile:
+            json.dump({'summary': self.summary(), 'events': list(self.events)}, outfile, indent = 1)
+
+        return csv_fpath, json_fpath
@@ -0,0 +1,124 @@
+# QGIS Core
+from qgis.core import QgsProject
+
+# Project layers by id, kept up to date from the QgsProject signals
+# The name index is only used to find layers stored in settings by name
+class LayerRegistry:
+
+    def __init__(self):
+        self.started = False
+        self.clear()
+
+    def clear(self):
+        self.layers    = {}
+        self.lyr_names = {}
+        self.names     = {}
+        self.renamed   = {}
+
+        # Last name of removed layers, for messages about a layer that is gone
+        self.old_names = {}
+
+    def start(self):
+        if self.started:
+            return
+
+        prj = QgsProject.instance()
+        prj.layersAdded.connect(self.on_layers_added)
+        prj.layersRemoved.connect(self.on_layers_removed)
+        prj.cleared.connect(self.on_cleared)
+        self.on_layers_added(list(prj.mapLayers().values()))
+        self.started = True
+
+    def stop(self):
+        if not self.started:
+            return
+
+        prj = QgsProject.instance()
+        try:
+            prj.layersAdded.disconnect(self.on_layers_added)
+            prj.layersRemoved.disconnect(self.on_layers_removed)
+            prj.cleared.disconnect(self.on_cleared)
+        except (RuntimeError, TypeError):
+            pass
+        self.on_cleared()
+        self.started = False
+
+    # Before start(), eg in scripts, fall back to the project
+    def layer(self, lyr_id):
+        if not self.started:
+            return QgsProject.instance().mapLayer(lyr_id)
+
+        return self.layers.get(lyr_id)
+
+    # First layer with this name, None if there is none
+    def by_name(self, name):
+        if not self.started:
+            lyrs = QgsProject.instance().mapLayersByName(name)
+            return lyrs[0] if lyrs else None
+
+        lyr_ids = self.names.get(name)
+
+        return self.layers[lyr_ids[0]] if lyr_ids else None
+
+    # Name of a project layer, or the last name of a removed one, None if unknown
+    def name(self, lyr_id):
+        if lyr_id in self.lyr_names:
+            return self.lyr_names[lyr_id]
+
+        return self.old_names.get(lyr_id)
+
+    # Layer stored in settings, by id if it is still in the project, otherwise by name
+    def resolve(self, lyr_id, name):
+        lyr = self.layer(lyr_id) if lyr_id else None
+
+        return lyr if lyr is not None else self.by_name(name)
+
+    ###############
+    ### Signals ###
+    ###############
+    def on_layers_added(self, lyrs):
+        for lyr in lyrs:
+            lyr_id = lyr.id()
+            self.layers[lyr_id] = lyr
+            self.add_name(lyr_id, lyr.name())
+
+            self.renamed[lyr_id] = lambda lyr_id = lyr_id: self.on_name_changed(lyr_id)
+            lyr.nameChanged.connect(self.renamed[lyr_id])
+
+    def on_layers_removed(self, lyr_ids):
+        for lyr_id in lyr_ids:
+            self.layers.pop(lyr_id, None)
+            self.renamed.pop(lyr_id, None)
+            if lyr_id in self.lyr_names:
+                self.old_names[lyr_id] = self.lyr_names[lyr_id]
+            self.remove_name(lyr_id)
+
+    def on_name_changed(self, lyr_id):
+        lyr = self.layers.get(lyr_id)
+        if lyr is not None:
+            self.remove_name(lyr_id)
+            self.add_name(lyr_id, lyr.name())
+
+    def on_cleared(self):
+        for lyr_id, lyr in self.layers.items():
+            try:
+                lyr.nameChanged.disconnect(self.renamed[lyr_id])
+            except (KeyError, RuntimeError, TypeError):
+                pass
+        self.clear()
+
+    def add_name(self, lyr_id, name):
+        self.lyr_names[lyr_id] = name
+        self.names.setdefault(name, []).append(lyr_id)
+
+    def remove_name(self, lyr_id):
+        name    = self.lyr_names.pop(lyr_id, None)
+        lyr_ids = self.names.get(name, [])
+        if lyr_id in lyr_ids:
+            lyr_ids.remove(lyr_id)
+            if not lyr_ids:
+                del self.names[name]
+
+    def stats(self):
+        return [('Project layers', len(self.layers)),
+                ('Shared names',   sum(1 for x in self.names.values() if len(x) > 1))]
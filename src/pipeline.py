@@ -0,0 +1,135 @@
+# QGIS Core
+from qgis.core import NULL
+from qgis.core import QgsField
+from qgis.core import QgsSettings
+from qgis.core import QgsVariantUtils
+
+# PyQt
+from qgis.PyQt.QtCore import QMetaType
+
+# Python
+import importlib.util
+import os
+
+# Plugin
+from .utils import rows_to_layer
+
+def custom_prep_path():
+    fname = QgsSettings().value("GetFeats/customPrepFile", "custom_prep_lotr.py")
+    return os.path.join(os.path.dirname(__file__), 'custom_prep', fname)
+
+def custom_prep_mtime():
+    try:
+        return os.path.getmtime(custom_prep_path())
+    except OSError:
+        return None
+
+# The prep script can load from a variable filename, None if it fails to load
+# A new module on every load and never put in sys.modules, so functions of another script,
+# or ones deleted since the last load, are not left on it
+def load_custom_prep():
+    try:
+        spec   = importlib.util.spec_from_file_location('custom_prep', custom_prep_path())
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+
+        return module
+    except:
+        return None
+
+# Result pipeline for the table, run on plain row tuples:
+# project -> dedupe -> custom prep (optional)
+
+# Build one row per Source feature, in the same (distance) order
+# Values are cast to strings as the old string-field memory layer did, NULL is kept
+def project_rows(src_rows, OUT_FIELDS, FIELDMAP, SRC_FIELDS):
+    str_fld = QgsField('value', QMetaType.Type.QString)
+    rows    = []
+    for f in src_rows:
+        row = []
+        for fld in OUT_FIELDS:
+            if FIELDMAP[fld] in SRC_FIELDS:
+                val = f[FIELDMAP[fld]]
+            else:
+                val = FIELDMAP[fld]
+
+            if not QgsVariantUtils.isNull(val):
+                try:
+                    val = str_fld.convertCompatible(val)
+                except ValueError:
+                    val = str(val)
+            row.append(val)
+
+        rows.append(tuple(row))
+
+    return rows
+
+# Drop rows with the same values in every output field, keep the first (nearest) one
+def dedupe_rows(rows):
+    seen   = set()
+    unique = []
+    for row in rows:
+        key = tuple(None if QgsVariantUtils.isNull(x) else x for x in row)
+        if key not in seen:
+            seen.add(key)
+            unique.append(row)
+
+    return unique
+
+# Compatibility path for prep scripts that take a layer and return features
+def layer_prep(prep_func, rows, OUT_FIELDS):
+    clean_lyr = rows_to_layer('clean_lyr', rows, OUT_FIELDS)
+
+    return [tuple(f.attributes()) for f in prep_func(clean_lyr)]
+
+###################
+### Prep stages ###
+###################
+# A prep stage takes (rows, OUT_FIELDS) and returns or yields rows
+# Rows can be tuples in OUT_FIELDS order or {field: value} dicts, missing dict fields are NULL
+# Scripts define prep_rows(rows, fields), or PREP_STAGES = [stage, ...] to chain several,
+# or the older custom_prep(clean_lyr) which is run through layer_stage
+
+def as_tuple(row, OUT_FIELDS):
+    if isinstance(row, dict):
+        return tuple(row.get(fld, NULL) for fld in OUT_FIELDS)
+
+    return tuple(row)
+
+# Adapter, runs a layer-in/features-out script as a stage
+# These scripts make a layer and may use the QGIS interface, they are flagged to run on the GUI thread
+def layer_stage(prep_func):
+    def stage(rows, OUT_FIELDS):
+        return layer_prep(prep_func, [as_tuple(row, OUT_FIELDS) for row in rows], OUT_FIELDS)
+
+    stage.gui_thread = True
+
+    return stage
+
+# Stages run lazily one after the other, the rows are only collected at the end
+def chain_stages(stages):
+    def chained(rows, OUT_FIELDS):
+        for stage in stages:
+            rows = stage(rows, OUT_FIELDS)
+
+        return [as_tuple(row, OUT_FIELDS) for row in rows]
+
+    chained.gui_thread = any(getattr(stage, 'gui_thread', False) for stage in stages)
+
+    return chained
+
+# The prep of a loaded script as one callable (rows, OUT_FIELDS) -> list of tuples
+def prep_chain(module):
+    if module is None:
+        raise ValueError('Custom prep script could not be loaded')
+
+    if hasattr(module, 'PREP_STAGES'):
+        stages = list(module.PREP_STAGES)
+    elif hasattr(module, 'prep_rows'):
+        stages = [module.prep_rows]
+    elif hasattr(module, 'custom_prep'):
+        stages = [layer_stage(module.custom_prep)]
+    else:
+        raise ValueError('Custom prep script has no prep_rows, PREP_STAGES or custom_prep')
+
+    return chain_stages(stages)
@@ -0,0 +1,189 @@
+# Python
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from time               import perf_counter
+
+# Plugin
+from .pipeline import custom_prep_mtime
+from .pipeline import custom_prep_path
+from .pipeline import load_custom_prep
+from .pipeline import prep_chain
+
+# Row lists per worker call of run_many, each call waits at most budget_ms per list
+PREP_CHUNK = 25
+
+# Each non-empty row list through the chain, a list that raises is kept unchanged
+# Returns (rows, ok) per list
+def prep_each(chain, rows_list, OUT_FIELDS):
+    out = []
+    for rows in rows_list:
+        if not rows:
+            out.append((rows, True))
+            continue
+        try:
+            out.append((chain(rows, OUT_FIELDS), True))
+        except:
+            out.append((rows, False))
+
+    return out
+
+# Runs the custom prep script in a worker thread with a time budget per call
+# The script is reloaded when the chosen file or its mtime changes, otherwise the loaded module is reused
+# A budget of 0, or a script with the older custom_prep(clean_lyr) form, runs on the calling thread
+# A worker past its budget cannot be stopped, no new worker is started until it has finished,
+# so at most one is ever left running
+class PrepRunner:
+
+    def __init__(self, budget_ms = 200):
+        self.budget_ms = budget_ms
+        self.pool      = None
+        self.version   = None
+        self.chain     = None
+        self.error     = None
+        self.stuck     = None
+
+        self.calls    = 0
+        self.ok       = 0
+        self.errors   = 0
+        self.timeouts = 0
+        self.busy     = 0
+        self.reloads  = 0
+        self.seconds  = 0.0
+        self.max_ms   = 0.0
+
+    def set_budget(self, budget_ms):
+        self.budget_ms = budget_ms
+
+    # Cheap when nothing changed: one settings read and one stat
+    def refresh(self):
+        version = (custom_prep_path(), custom_prep_mtime())
+        if version != self.version:
+            self.version  = version
+            self.reloads += 1
+            try:
+                self.chain = prep_chain(load_custom_prep())
+                self.error = None
+            except ValueError as e:
+                self.chain = None
+                self.error = str(e)
+
+        return self.version
+
+    def on_gui_thread(self):
+        return self.budget_ms <= 0 or getattr(self.chain, 'gui_thread', False)
+
+    # True while a worker that went past its budget is still running
+    def worker_stuck(self):
+        if self.stuck is not None and self.stuck.done():
+            self.stuck = None
+
+        return self.stuck is not None
+
+    # Returns (rows, status), status is 'ok', 'error', 'timeout' or 'busy' (an earlier call still running)
+    # On error, timeout or busy the rows are returned unchanged
+    def run(self, rows, OUT_FIELDS):
+        out_rows, status = self.call(self.chain, (rows, OUT_FIELDS), self.budget_ms)
+
+        return (out_rows, 'ok') if status == 'ok' else (rows, status)
+
+    # Prep of many row lists (eg one per Target feature for auto fill) in chunks of PREP_CHUNK lists,
+    # one worker call and a budget of budget_ms per list for each chunk, so a stuck script blocks
+    # for one chunk at most. feedback (QgsFeedback, optional) gets the progress and can cancel
+    # Returns (rows_list, nfailed, status), status as in run or 'canceled'
+    # A list that fails is returned unchanged and counted in nfailed, as are all lists after
+    # the chunk that stopped the run when the status is not 'ok'
+    def run_many(self, rows_list, OUT_FIELDS, feedback = None):
+        out_rows = []
+        nfailed  = 0
+        status   = 'ok'
+        for start in range(0, len(rows_list), PREP_CHUNK):
+            if feedback is not None and feedback.isCanceled():
+                status = 'canceled'
+                break
+
+            chunk = rows_list[start:start + PREP_CHUNK]
+            out_list, status = self.call(prep_each, (self.chain, chunk, OUT_FIELDS), self.budget_ms*len(chunk))
+            if status != 'ok':
+                break
+            out_rows += [rows for rows, ok in out_list]
+            nfailed  += sum(not ok for rows, ok in out_list)
+            if feedback is not None:
+                feedback.setProgress(100*len(out_rows)/len(rows_list))
+
+        rest = rows_list[len(out_rows):]
+
+        return out_rows + rest, nfailed + sum(1 for rows in rest if rows), status
+
+    # Runs func(*args) on this thread or in the worker, returns (result, status)
+    def call(self, func, args, budget_ms):
+        self.refresh()
+        self.calls += 1
+        if self.chain is None:
+            self.errors += 1
+            return None, 'error'
+
+        gui_thread = self.on_gui_thread()
+        if not gui_thread and self.worker_stuck():
+            self.busy += 1
+            return None, 'busy'
+
+        t0 = perf_counter()
+        try:
+            if gui_thread:
+                out = func(*args)
+            else:
+                future = self.executor().submit(func, *args)
+                out    = future.result(timeout = budget_ms/1000)
+        except FutureTimeout:
+            # A Python thread cannot be stopped, keep track of it until it finishes on its own
+            self.timeouts += 1
+            self.stuck     = future
+            self.pool.shutdown(wait = False)
+            self.pool = None
+            return None, 'timeout'
+        except:
+            self.errors += 1
+            return None, 'error'
+        finally:
+            elapsed       = perf_counter() - t0
+            self.seconds += elapsed
+            self.max_ms   = max(self.max_ms, 1000*elapsed)
+
+        self.ok += 1
+
+        return out, 'ok'
+
+    def executor(self):
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = 'GetFeatsPrep')
+
+        return self.pool
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait = False)
+            self.pool = None
+
+    def stats(self):
+        avg_ms = 1000*self.seconds/self.calls if self.calls else 0
+        fname  = self.version[0].replace('\\', '/').rsplit('/', 1)[-1] if self.version else '-'
+
+        if self.budget_ms <= 0:
+            budget = 'Off (GUI thread)'
+        elif getattr(self.chain, 'gui_thread', False):
+            budget = 'Off (custom_prep runs on the GUI thread)'
+        else:
+            budget = str(self.budget_ms) + ' ms'
+
+        return [('Script',       fname),
+                ('Load error',   self.error or 'None'),
+                ('Reloads',      self.reloads),
+                ('Time budget',  budget),
+                ('Calls',        self.calls),
+                ('Succeeded',    self.ok),
+                ('Errors',       self.errors),
+                ('Timeouts',     self.timeouts),
+                ('Stuck worker', 'Yes' if self.worker_stuck() else 'No'),
+                ('Skipped busy', self.busy),
+                ('Avg time',     '{:.2f} ms'.format(avg_ms)),
+                ('Max time',     '{:.2f} ms'.format(self.max_ms))]
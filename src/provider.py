@@ -0,0 +1,25 @@
+# QGIS Core
+from qgis.core import QgsProcessingProvider
+
+# PyQt
+from qgis.PyQt.QtGui import QIcon
+
+# Python
+import os
+
+# Plugin
+from .bulk_algorithm import BulkGetFeatsAlgorithm
+
+class GetFeatsProvider(QgsProcessingProvider):
+
+    def loadAlgorithms(self):
+        self.addAlgorithm(BulkGetFeatsAlgorithm())
+
+    def id(self):
+        return 'getfeats'
+
+    def name(self):
+        return 'GetFeats'
+
+    def icon(self):
+        return QIcon(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'img', 'icon.png'))
@@ -1,8 +1,4 @@
-# QGIS Core
-from qgis.core import QgsProject
-
 # PyQt
-from qgis.PyQt.Qt     import QDateTime
 from qgis.PyQt.QtCore import pyqtSlot
 
 # QGIS Utils
@@ -13,10 +9,10 @@ from .input_check import InputCheck
 
 class QuickCopyPaste:
 
-    def __init__(self, dlg):
+    def __init__(self, dlg, chk = None):
         self.iface = iface
         self.msg   = self.iface.messageBar()
-        self.chk   = InputCheck()
+        self.chk   = chk if chk is not None else InputCheck()
         self.dlg   = dlg
         self.did_select = False
 
@@ -35,11 +31,13 @@ class QuickCopyPaste:
                 self.msg.pushInfo('GetFeats:', 'Cannot modify a field named fid')
 
     def copycell(self, fld_name, selval):
-        TARGET_LYR_NAME = self.dlg.targetLayer.currentLayer().name()
-        active_lyr_flag = TARGET_LYR_NAME == self.iface.activeLayer().name()
+        TARGET_LYR_ID   = self.dlg.targetLayer.currentLayer().id()
+        active_lyr      = self.iface.activeLayer()
+        active_lyr_flag = active_lyr is not None and TARGET_LYR_ID == active_lyr.id()
+        target_lyr      = self.chk.check_lyr_valid(TARGET_LYR_ID)
 
-        if self.chk.check_lyr_valid(TARGET_LYR_NAME) and active_lyr_flag:
-            target_lyr = QgsProject.instance().mapLayersByName(TARGET_LYR_NAME)[0]
+        if target_lyr and active_lyr_flag:
+            TARGET_LYR_NAME = target_lyr.name()
             edit_flag  = self.chk.check_layer_is_editable(target_lyr)
             open_flag  = self.chk.check_attr_table_open(target_lyr)
             target_ft  = self.chk.check_valid_feature(target_lyr, warn_nofeat = True)
@@ -49,41 +47,50 @@ class QuickCopyPaste:
                 # Returns -1 if field not found
                 if target_fld_idx > -1:
                     oldval = str(target_ft[target_fld_idx])
-                    # Paste the data and reload the table
-                    target_lyr.dataProvider().changeAttributeValues({target_ft.id(): {target_fld_idx: selval}})
-
-                    # reloadData() deselects the feature, reselect and flag so getfeats doesn't run
-                    self.did_select = True
-                    target_lyr.dataProvider().reloadData()
-                    target_lyr.select(target_ft.id())
-                    self.did_select = False
-
-                    # Append to the log page
-                    # Color red if it failed for some reason
-                    # QGIS will auto-cast int to float, this should not be flagged red
-                    str_list = [str(selval), str(selval) + '.0']
-                    if str(target_lyr.selectedFeatures()[0][target_fld_idx]) in str_list:
-                        color_str = 'color:#b7b0ff;">'
+                    if self.dlg.bufferedPaste.isChecked():
+                        newval = self.paste_buffered(target_lyr, target_ft, target_fld_idx, fld_name, selval)
                     else:
-                        color_str = 'color:#ff774a;">'
+                        newval = self.paste_provider(target_lyr, target_ft, target_fld_idx, selval)
 
-                    logmsg = self.format_log(fld_name, str(target_ft.id()), TARGET_LYR_NAME, 
-                                             oldval, selval, color_str)
-                    self.dlg.copyPasteLog.append(logmsg)
+                    # Write to the journal right away, flagged failed if the value did not stick
+                    # or was not written at all (None)
+                    # QGIS will auto-cast int to float, this should not be flagged failed
+                    str_list = [str(selval), str(selval) + '.0']
+                    ok       = newval is not None and str(newval) in str_list
+                    self.dlg.journal.add(target_lyr, target_ft.id(), fld_name, oldval, selval, ok)
+                    self.dlg.on_journal_added()
                 else:
                     self.msg.pushInfo('GetFeats:', TARGET_LYR_NAME + ' has no matching field: ' + fld_name)
 
-    def format_log(self, fld_name, fid, TARGET_LYR_NAME, oldval, selval, color_str):
-        dt0      = QDateTime.currentDateTime().toString()
-        pre_bold = '<span style=" font-weight:600; font-style:bold;'
-        dt   = pre_bold + color_str + dt0             + '</span>'
-        fld  = pre_bold + '">'      + fld_name        + '</span>'
-        fid  = pre_bold + '">fid '  + fid             + '</span>'
-        lyr  = pre_bold + '">'      + TARGET_LYR_NAME + '</span>'
-        val0 = pre_bold + '">'      + oldval          + '</span>'
-        val  = pre_bold + '">'      + selval          + '</span>'
-        logmsg = dt + ": " + fld + ' of ' + fid + ' in ' + lyr + ' from ' + val0 + ' to ' + val
-
-        return logmsg
-
+    # One undo command in the layer edit buffer, the attribute table updates only this row
+    # Returns the value read back from the layer, None if the value does not fit the field
+    def paste_buffered(self, target_lyr, target_ft, target_fld_idx, fld_name, selval):
+        # The edit buffer keeps the value as given, cast it to the field type like the provider would
+        # A value that cannot be cast would only fail when the edits are saved, so it is not written
+        fld = target_lyr.fields()[target_fld_idx]
+        try:
+            newval = fld.convertCompatible(selval)
+        except ValueError:
+            self.msg.pushInfo('GetFeats:', 'Cannot paste ' + str(selval) + ' into ' + fld_name + 
+                              ' (' + fld.typeName() + ')')
+            return None
+
+        target_lyr.beginEditCommand('GetFeats: paste ' + fld_name)
+        if target_lyr.changeAttributeValue(target_ft.id(), target_fld_idx, newval, target_ft[target_fld_idx]):
+            target_lyr.endEditCommand()
+        else:
+            target_lyr.destroyEditCommand()
+
+        return target_lyr.getFeature(target_ft.id())[target_fld_idx]
+
+    # Writes straight to the data source, not undoable and reloads the whole layer
+    def paste_provider(self, target_lyr, target_ft, target_fld_idx, selval):
+        target_lyr.dataProvider().changeAttributeValues({target_ft.id(): {target_fld_idx: selval}})
+
+        # reloadData() deselects the feature, reselect and flag so getfeats doesn't run
+        self.did_select = True
+        target_lyr.dataProvider().reloadData()
+        target_lyr.select(target_ft.id())
+        self.did_select = False
 
+        return target_lyr.selectedFeatures()[0][target_fld_idx]
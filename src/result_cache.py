@@ -0,0 +1,71 @@
+# Python
+from collections import OrderedDict
+
+# Bounded LRU of the final table rows per selected Target feature
+# Values are (source layer id, nns, rows), nns is kept to redo the Source selection
+class ResultCache:
+
+    def __init__(self, max_entries = 256):
+        self.max_entries = max_entries
+        self.entries     = OrderedDict()
+        self.hits        = 0
+        self.misses      = 0
+        self.evictions   = 0
+        self.prep_mtime  = None
+
+    # The parameters of run_getfeats plus the Target feature and its location
+    def make_key(self, target_lyr, target_ft, source_lyr, FIELDMAP, MAX_DISTANCE, NEIGHBORS, USE_CUSTOM_PREP):
+        geom_wkb = bytes(target_ft.geometry().asWkb())
+
+        return (target_lyr.id(), target_ft.id(), geom_wkb, source_lyr.id(), tuple(FIELDMAP.items()),
+                MAX_DISTANCE, NEIGHBORS, USE_CUSTOM_PREP)
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+
+        return value
+
+    def put(self, key, src_lyr_id, nns, rows):
+        if self.max_entries <= 0:
+            return
+
+        self.entries[key] = (src_lyr_id, nns, rows)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last = False)
+            self.evictions += 1
+
+    def set_max_entries(self, max_entries):
+        self.max_entries = max_entries
+        while len(self.entries) > max(max_entries, 0):
+            self.entries.popitem(last = False)
+
+    # Source layer edited: drop everything built from it
+    def invalidate_source(self, src_lyr_id):
+        for key in [k for k, v in self.entries.items() if v[0] == src_lyr_id]:
+            del self.entries[key]
+
+    # Custom prep file changed: drop the rows that went through it
+    def check_prep_mtime(self, mtime):
+        if mtime != self.prep_mtime:
+            for key in [k for k in self.entries if k[-1]]:
+                del self.entries[key]
+            self.prep_mtime = mtime
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        rate  = 100*self.hits/total if total else 0
+
+        return [('Hits',      self.hits),
+                ('Misses',    self.misses),
+                ('Hit rate',  '%.1f %%' % rate),
+                ('Entries',   str(len(self.entries)) + ' / ' + str(self.max_entries)),
+                ('Evictions', self.evictions)]
@@ -0,0 +1,57 @@
+# PyQt
+from qgis.PyQt.QtCore import QObject
+from qgis.PyQt.QtCore import QTimer
+
+# Sits between selectionChanged and run_getfeats
+# Events within the debounce window are coalesced, only the latest selection is run
+class SelectionScheduler(QObject):
+
+    def __init__(self, handler, debounce_ms = 30):
+        super().__init__()
+        self.handler     = handler
+        self.debounce_ms = debounce_ms
+        self.pending     = None
+
+        self.received = 0
+        self.executed = 0
+        self.dropped  = 0
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.fire)
+
+    def set_debounce(self, debounce_ms):
+        self.debounce_ms = debounce_ms
+
+    def schedule(self, selected, deselected):
+        self.received += 1
+        if self.pending is not None:
+            self.dropped += 1
+        self.pending = (selected, deselected)
+        self.timer.start(max(self.debounce_ms, 0))
+
+    def fire(self):
+        if self.pending is None:
+            return
+
+        # The run is synchronous on the GUI thread, selections made meanwhile are queued
+        # and merged by the next debounce
+        args, self.pending = self.pending, None
+        self.executed += 1
+        self.handler(*args)
+
+    def cancel(self):
+        self.timer.stop()
+        if self.pending is not None:
+            self.dropped += 1
+        self.pending = None
+
+    def queue_depth(self):
+        return 1 if self.pending is not None else 0
+
+    def stats(self):
+        return [('Debounce',            str(self.debounce_ms) + ' ms'),
+                ('Events received',     self.received),
+                ('Runs',                self.executed),
+                ('Dropped (coalesced)', self.dropped),
+                ('Queue depth',         self.queue_depth())]
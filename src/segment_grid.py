@@ -0,0 +1,251 @@
+# Python
+from math import ceil
+from math import pi
+from math import sqrt
+
+# numpy is optional, this module is only imported by the NumPy engine (index_task.make_index)
+import numpy as np
+
+SEGS_PER_CELL = 2
+MAX_CELLS     = 1 << 22
+MAX_PAIRS     = 1 << 21
+
+# Exact distance from each point to each segment, all arrays of the same length
+def seg_dist(px, py, x0, y0, x1, y1):
+    dx = x1 - x0
+    dy = y1 - y0
+    l2 = dx*dx + dy*dy
+    t  = ((px - x0)*dx + (py - y0)*dy)/np.where(l2 > 0, l2, 1)
+    t  = np.clip(np.where(l2 > 0, t, 0), 0, 1)
+
+    return np.hypot(px - (x0 + t*dx), py - (y0 + t*dy))
+
+# Expands (start, count) runs into one flat index array
+def expand_runs(starts, counts):
+    total = int(counts.sum())
+    if total == 0:
+        return np.zeros(0, dtype = np.int64)
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+
+    return np.repeat(starts, counts) + np.arange(total) - offsets
+
+# Line segments in contiguous arrays, bucketed in a uniform grid
+# owner is the feature id of each segment, a feature is as near as its nearest segment
+# Segments are never moved, deleted features are only flagged dead (see kill)
+class SegmentGrid:
+
+    def __init__(self, x0, y0, x1, y1, owner):
+        self.x0    = np.asarray(x0, dtype = np.float64)
+        self.y0    = np.asarray(y0, dtype = np.float64)
+        self.x1    = np.asarray(x1, dtype = np.float64)
+        self.y1    = np.asarray(y1, dtype = np.float64)
+        self.owner = np.asarray(owner, dtype = np.int64)
+        self.alive = np.ones(len(self.owner), dtype = bool)
+
+        # Segments of one fid, for kill and segments
+        self.by_fid     = np.argsort(self.owner, kind = 'stable')
+        self.sorted_fid = self.owner[self.by_fid]
+
+        self.build_grid()
+
+    def __len__(self):
+        return len(self.owner)
+
+    def build_grid(self):
+        n = len(self.owner)
+        if n == 0:
+            self.xmin, self.ymin, self.cell, self.nx, self.ny = 0.0, 0.0, 1.0, 1, 1
+            self.cell_start = np.zeros(2, dtype = np.int64)
+            self.cell_segs  = np.zeros(0, dtype = np.int64)
+            self.nfids      = 0
+            return
+
+        minx = np.minimum(self.x0, self.x1)
+        maxx = np.maximum(self.x0, self.x1)
+        miny = np.minimum(self.y0, self.y1)
+        maxy = np.maximum(self.y0, self.y1)
+        self.xmin, self.ymin = float(minx.min()), float(miny.min())
+        width  = float(maxx.max()) - self.xmin
+        height = float(maxy.max()) - self.ymin
+
+        # About SEGS_PER_CELL segments per cell, fewer cells for very long thin extents
+        ncells    = min(max(n//SEGS_PER_CELL, 1), MAX_CELLS)
+        self.cell = sqrt(max(width*height, 1e-18)/ncells) or 1.0
+        self.cell = max(self.cell, max(width, height)/MAX_CELLS*4, 1e-9)
+        self.nx   = max(int(width/self.cell) + 1, 1)
+        self.ny   = max(int(height/self.cell) + 1, 1)
+
+        # Each segment goes into every cell its bounding box touches
+        ix0, iy0 = self.cell_of(minx, miny)
+        ix1, iy1 = self.cell_of(maxx, maxy)
+        w    = ix1 - ix0 + 1
+        cnts = w*(iy1 - iy0 + 1)
+        seg  = np.repeat(np.arange(n), cnts)
+        k    = np.arange(len(seg)) - np.repeat(np.cumsum(cnts) - cnts, cnts)
+        cid  = (iy0[seg] + k//w[seg])*self.nx + ix0[seg] + k%w[seg]
+
+        order           = np.argsort(cid, kind = 'stable')
+        self.cell_segs  = seg[order]
+        self.cell_start = np.concatenate([[0], np.cumsum(np.bincount(cid, minlength = self.nx*self.ny))])
+        self.nfids      = len(np.unique(self.owner))
+
+    def cell_of(self, xs, ys):
+        ix = np.clip(np.floor((xs - self.xmin)/self.cell), 0, self.nx - 1).astype(np.int64)
+        iy = np.clip(np.floor((ys - self.ymin)/self.cell), 0, self.ny - 1).astype(np.int64)
+
+        return ix, iy
+
+    # Flag the segments of fid as deleted, returns False when fid has none left
+    def kill(self, fid):
+        idx = self.fid_segments(fid)
+        found = bool(self.alive[idx].any())
+        self.alive[idx] = False
+
+        return found
+
+    def fid_segments(self, fid):
+        lo = np.searchsorted(self.sorted_fid, fid, side = 'left')
+        hi = np.searchsorted(self.sorted_fid, fid, side = 'right')
+
+        return self.by_fid[lo:hi]
+
+    # (x0, y0, x1, y1) of the live segments of fid, in insertion order
+    def segments(self, fid):
+        idx = np.sort(self.fid_segments(fid))
+        idx = idx[self.alive[idx]]
+
+        return [(self.x0[i], self.y0[i], self.x1[i], self.y1[i]) for i in idx]
+
+    def live_arrays(self):
+        keep = self.alive
+
+        return self.x0[keep], self.y0[keep], self.x1[keep], self.y1[keep], self.owner[keep]
+
+    ###############
+    ### Queries ###
+    ###############
+    # Same result as QgsSpatialIndex.nearestNeighbor with stored geometries: nearest first,
+    # ties at the last distance are all returned, max_dist <= 0 means no limit
+    def nearest(self, px, py, k, max_dist = 0, with_dist = False):
+        return self.nearest_batch(np.array([px]), np.array([py]), k, max_dist, with_dist)[0]
+
+    # fid lists for many points at once, (fid, distance) lists with with_dist
+    # All points of a chunk search the same square of cells with vectorized distances,
+    # points that need a wider search are retried with a doubled radius
+    def nearest_batch(self, pxs, pys, k, max_dist = 0, with_dist = False):
+        pxs = np.asarray(pxs, dtype = np.float64)
+        pys = np.asarray(pys, dtype = np.float64)
+        out = [None]*len(pxs)
+        if len(self.owner) == 0 or k < 1:
+            return [[] for _ in out]
+
+        todo   = np.arange(len(pxs))
+        radius = self.start_radius(k, max_dist)
+        while len(todo):
+            # Past the whole grid every segment is a candidate, one pass is then complete
+            covers = (2*radius + 1)**2 >= self.nx*self.ny
+            ncells = (2*radius + 1)**2 if not covers else self.nx*self.ny
+            pairs  = max(ncells*len(self.owner)/(self.nx*self.ny), 1)
+            chunk  = max(int(MAX_PAIRS/pairs), 1)
+
+            retry = []
+            for start in range(0, len(todo), chunk):
+                idx = todo[start:start + chunk]
+                res = self.search(pxs[idx], pys[idx], k, max_dist, radius, covers)
+                for i, found in zip(idx, res):
+                    if found is None:
+                        retry.append(i)
+                    else:
+                        out[i] = list(found.items()) if with_dist else list(found)
+            todo   = np.array(retry, dtype = np.int64)
+            radius = radius*2 + 1
+
+        return out
+
+    # Radius in cells of the circle expected to hold k features plus one cell, or max_dist when smaller
+    def start_radius(self, k, max_dist):
+        fids_per_cell = max(self.nfids/(self.nx*self.ny), 1e-9)
+        radius        = ceil(sqrt(k/(pi*fids_per_cell))) + 1
+        if max_dist > 0:
+            radius = min(radius, ceil(max_dist/self.cell))
+
+        return max(radius, 1)
+
+    # One pass over the square of cells around each point
+    # Returns {fid: distance} per point in order, or None when the square cannot prove the answer
+    def search(self, pxs, pys, k, max_dist, radius, covers):
+        m = len(pxs)
+        if covers:
+            qid = np.repeat(np.arange(m), len(self.owner))
+            seg = np.tile(np.arange(len(self.owner)), m)
+        else:
+            qix = np.floor((pxs - self.xmin)/self.cell).astype(np.int64)
+            qiy = np.floor((pys - self.ymin)/self.cell).astype(np.int64)
+            off = np.arange(-radius, radius + 1)
+            cx  = (qix[:, None, None] + off[None, None, :]).repeat(len(off), axis = 1)
+            cy  = (qiy[:, None, None] + off[None, :, None]).repeat(len(off), axis = 2)
+            ok  = (cx >= 0) & (cx < self.nx) & (cy >= 0) & (cy < self.ny)
+            cid = (cy*self.nx + cx)[ok]
+            qcl = np.broadcast_to(np.arange(m)[:, None, None], cx.shape)[ok]
+
+            starts = self.cell_start[cid]
+            counts = self.cell_start[cid + 1] - starts
+            seg    = self.cell_segs[expand_runs(starts, counts)]
+            qid    = np.repeat(qcl, counts)
+
+        live = self.alive[seg]
+        seg  = seg[live]
+        qid  = qid[live]
+        dist = seg_dist(pxs[qid], pys[qid], self.x0[seg], self.y0[seg], self.x1[seg], self.y1[seg])
+        fid  = self.owner[seg]
+
+        # Segments outside the square are at least reach from the point
+        if covers:
+            reach = np.full(m, np.inf)
+        else:
+            left   = self.xmin + (qix - radius)*self.cell
+            bottom = self.ymin + (qiy - radius)*self.cell
+            side   = (2*radius + 1)*self.cell
+            reach  = np.minimum.reduce([pxs - left, left + side - pxs, pys - bottom, bottom + side - pys])
+            full   = (qix - radius <= 0) & (qix + radius >= self.nx - 1) & \
+                     (qiy - radius <= 0) & (qiy + radius >= self.ny - 1)
+            reach  = np.where(full, np.inf, reach)
+
+        # Only candidates nearer than reach and max_dist can be in a proven answer
+        limit = reach if max_dist <= 0 else np.minimum(reach, np.nextafter(max_dist, np.inf))
+        near  = dist < limit[qid]
+        qid, fid, dist = qid[near], fid[near], dist[near]
+
+        # Each point by distance then fid, the first segment of a fid is its nearest
+        order  = np.lexsort((fid, dist, qid))
+        fid    = fid[order].tolist()
+        dist   = dist[order].tolist()
+        bounds = np.searchsorted(qid[order], np.arange(m + 1)).tolist()
+
+        res = []
+        for q in range(m):
+            within = max_dist > 0 and reach[q] > max_dist
+            fids   = fid[bounds[q]:bounds[q + 1]]
+            dists  = dist[bounds[q]:bounds[q + 1]]
+            found  = self.first_k(fids, dists, k)
+            if found is None and (within or reach[q] == np.inf):
+                # Fewer than k, but nothing else is in range
+                found = self.first_k(fids, dists, len(fids) + 1, True)
+            res.append(found)
+
+        return res
+
+    # First k distinct fids plus ties of the k-th distance, None when there are fewer (unless allow_fewer)
+    # A candidate list holds everything nearer than reach, so k fids found in it are final
+    def first_k(self, fids, dists, k, allow_fewer = False):
+        seen = {}
+        kth  = None
+        for f, d in zip(fids, dists):
+            if kth is not None and d > kth:
+                break
+            if f not in seen:
+                seen[f] = d
+                if len(seen) == k:
+                    kth = d
+
+        return seen if kth is not None or allow_fewer else None
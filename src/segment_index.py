@@ -0,0 +1,162 @@
+# QGIS Core
+from qgis.core import Qgis
+from qgis.core import QgsGeometry
+from qgis.core import QgsLineString
+from qgis.core import QgsPoint
+from qgis.core import QgsPointXY
+
+# Python
+from array import array
+
+# Plugin
+from .segment_grid import SegmentGrid
+from .segment_grid import np
+
+# Pending segments merged into the main grid past this count, or a tenth of its size
+MERGE_MIN = 10000
+
+# x and y lists of each part, curves are segmentized and points are one vertex parts
+def part_vertices(geom):
+    for part in geom.constParts():
+        if isinstance(part, QgsPoint):
+            yield [part.x()], [part.y()]
+        else:
+            if not isinstance(part, QgsLineString):
+                part = part.curveToLine()
+            yield part.xVector(), part.yVector()
+
+# Same interface as QgsSpatialIndex with stored geometries, for point queries on line and point features
+# Segments live in a SegmentGrid, added features wait in a small delta grid until merged
+class SegmentIndex:
+
+    def __init__(self):
+        self.main  = None
+        self.delta = None
+        self.clear_pending()
+
+    def clear_pending(self):
+        self.px0    = array('d')
+        self.py0    = array('d')
+        self.px1    = array('d')
+        self.py1    = array('d')
+        self.powner = array('q')
+        self.delta  = None
+
+    def addFeature(self, feat):
+        geom = feat.geometry()
+        if geom.isNull():
+            return False
+
+        fid = feat.id()
+        for xs, ys in part_vertices(geom):
+            if len(xs) == 1:
+                xs, ys = xs*2, ys*2
+            self.px0.extend(xs[:-1])
+            self.py0.extend(ys[:-1])
+            self.px1.extend(xs[1:])
+            self.py1.extend(ys[1:])
+            self.powner.extend([fid]*(len(xs) - 1))
+        self.delta = None
+
+        return True
+
+    def deleteFeature(self, feat):
+        fid   = feat.id()
+        found = self.main is not None and self.main.kill(fid)
+        if fid in self.powner:
+            keep = [i for i, x in enumerate(self.powner) if x != fid]
+            pending = [self.px0, self.py0, self.px1, self.py1, self.powner]
+            self.clear_pending()
+            for old, new in zip(pending, [self.px0, self.py0, self.px1, self.py1, self.powner]):
+                new.extend(old[i] for i in keep)
+            found = True
+
+        return found
+
+    # The stored segments of fid, consecutive segments joined into lines
+    def geometry(self, fid):
+        segs = self.main.segments(fid) if self.main is not None else []
+        segs = segs + [(self.px0[i], self.py0[i], self.px1[i], self.py1[i])
+                       for i, x in enumerate(self.powner) if x == fid]
+        if not segs:
+            return QgsGeometry()
+        if len(segs) == 1 and segs[0][:2] == segs[0][2:]:
+            return QgsGeometry.fromPointXY(QgsPointXY(segs[0][0], segs[0][1]))
+
+        lines = []
+        for x0, y0, x1, y1 in segs:
+            if not lines or lines[-1][-1] != QgsPointXY(x0, y0):
+                lines.append([QgsPointXY(x0, y0)])
+            lines[-1].append(QgsPointXY(x1, y1))
+
+        return QgsGeometry.fromPolylineXY(lines[0]) if len(lines) == 1 else QgsGeometry.fromMultiPolylineXY(lines)
+
+    # Builds the main grid from everything added so far, called by the build task
+    def flush(self):
+        if not len(self.powner):
+            if self.main is None:
+                self.main = SegmentGrid([], [], [], [], [])
+            return
+
+        # Copies, an array exporting its buffer could not grow anymore
+        arrays = [np.array(x) for x in [self.px0, self.py0, self.px1, self.py1, self.powner]]
+        if self.main is not None:
+            arrays = [np.concatenate([old, new]) for old, new in zip(self.main.live_arrays(), arrays)]
+        self.main = SegmentGrid(*arrays)
+        self.clear_pending()
+
+    # Grids to query, merging the pending segments when there are many
+    def grids(self):
+        if self.main is None or len(self.powner) > max(MERGE_MIN, len(self.main)//10):
+            self.flush()
+        if len(self.powner) and self.delta is None:
+            self.delta = SegmentGrid(*[np.array(x) for x in [self.px0, self.py0, self.px1, self.py1, self.powner]])
+
+        return [self.main] + ([self.delta] if len(self.powner) else [])
+
+    ###############
+    ### Queries ###
+    ###############
+    def nearestNeighbor(self, point, neighbors = 1, maxDistance = 0):
+        pt = point if isinstance(point, QgsPointXY) else query_point(point)
+
+        return self.nearest_xy([pt.x()], [pt.y()], neighbors, maxDistance)[0]
+
+    # One fid list per geometry, None geometries get an empty list
+    def nearest_batch(self, geoms, neighbors, max_dist = 0):
+        idx = [i for i, geom in enumerate(geoms) if geom is not None]
+        pts = [query_point(geoms[i]) for i in idx]
+        res = self.nearest_xy([pt.x() for pt in pts], [pt.y() for pt in pts], neighbors, max_dist)
+
+        out = [[] for _ in geoms]
+        for i, fids in zip(idx, res):
+            out[i] = fids
+
+        return out
+
+    def nearest_xy(self, xs, ys, k, max_dist):
+        grids = self.grids()
+        if len(grids) == 1:
+            return grids[0].nearest_batch(xs, ys, k, max_dist)
+
+        # Both answers are complete for their own segments, the union holds the overall answer
+        res = [grid.nearest_batch(xs, ys, k, max_dist, with_dist = True) for grid in grids]
+        out = []
+        for pairs in zip(*res):
+            best = {}
+            for f, d in pairs[0] + pairs[1]:
+                if f not in best or d < best[f]:
+                    best[f] = d
+            items = sorted((d, f) for f, d in best.items())
+            if len(items) > k:
+                items = [x for x in items if x[0] <= items[k - 1][0]]
+            out.append([f for _, f in items])
+
+        return out
+
+# The engine answers single point queries, other geometries are left to QgsSpatialIndex
+def query_point(geom):
+    if geom.isMultipart() or geom.type() != Qgis.GeometryType.Point:
+        raise ValueError('SegmentIndex only answers single point queries')
+
+    return geom.asPoint()
@@ -0,0 +1,77 @@
+# Live signal connections of the plugin to project layers, keyed by layer id
+# Connecting again replaces the old connection, so a layer is never subscribed twice
+class SubscriptionManager:
+
+    def __init__(self):
+        self.layers     = {}
+        self.subs       = {}
+        self.on_deleted = {}
+
+    def connect(self, lyr, signal_name, slot):
+        lyr_id = lyr.id()
+        old    = self.subs.get(lyr_id, {}).get(signal_name)
+        if old is not None:
+            if old == slot:
+                return
+            self.disconnect(lyr_id, signal_name)
+
+        getattr(lyr, signal_name).connect(slot)
+        self.subs.setdefault(lyr_id, {})[signal_name] = slot
+
+        # Forget the layer when it is removed from the project, Qt drops its connections
+        if lyr_id not in self.layers:
+            self.layers[lyr_id]     = lyr
+            self.on_deleted[lyr_id] = lambda: self.forget(lyr_id)
+            lyr.willBeDeleted.connect(self.on_deleted[lyr_id])
+
+    # Keep signal_name connected on lyr only, eg selectionChanged of the current Target layer
+    def retarget(self, lyr, signal_name, slot):
+        for lyr_id in list(self.subs):
+            if lyr_id != lyr.id():
+                self.disconnect(lyr_id, signal_name)
+
+        self.connect(lyr, signal_name, slot)
+
+    def disconnect(self, lyr_id, signal_name = None):
+        lyr      = self.layers.get(lyr_id)
+        lyr_subs = self.subs.get(lyr_id, {})
+        names    = [signal_name] if signal_name else list(lyr_subs)
+        for name in names:
+            slot = lyr_subs.pop(name, None)
+            if slot is not None:
+                try:
+                    getattr(lyr, name).disconnect(slot)
+                except (RuntimeError, TypeError):
+                    # Layer already deleted
+                    pass
+
+        if lyr is not None and not lyr_subs:
+            try:
+                lyr.willBeDeleted.disconnect(self.on_deleted[lyr_id])
+            except (RuntimeError, TypeError):
+                pass
+            self.forget(lyr_id)
+
+    def disconnect_all(self, signal_name = None):
+        for lyr_id in list(self.subs):
+            self.disconnect(lyr_id, signal_name)
+
+    def forget(self, lyr_id):
+        self.layers.pop(lyr_id, None)
+        self.subs.pop(lyr_id, None)
+        self.on_deleted.pop(lyr_id, None)
+
+    def count(self):
+        return sum(len(x) for x in self.subs.values())
+
+    # One line per layer, for the Diagnostics page
+    def stats(self):
+        stats = []
+        for lyr_id, lyr_subs in self.subs.items():
+            try:
+                name = self.layers[lyr_id].name()
+            except RuntimeError:
+                name = lyr_id
+            stats.append((name, ', '.join(sorted(lyr_subs))))
+
+        return stats or [('Connected layers', 0)]
@@ -0,0 +1,94 @@
+# PyQt
+from qgis.PyQt.QtCore import QAbstractTableModel
+from qgis.PyQt.QtCore import QModelIndex
+from qgis.PyQt.QtCore import Qt
+from qgis.PyQt.QtGui  import QColor
+
+# Results table, one tuple of display strings per row
+# A new result set replaces the rows in bulk, only rows that differ are signaled to the view
+class ResultTableModel(QAbstractTableModel):
+
+    def __init__(self, parent = None):
+        super().__init__(parent)
+        self.headers = []
+        self.rows    = []
+
+    def rowCount(self, parent = QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent = QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index, role = Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role not in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ToolTipRole):
+            return None
+
+        row = self.rows[index.row()]
+        col = index.column()
+
+        return row[col] if col < len(row) else None
+
+    def headerData(self, section, orientation, role = Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+
+        if orientation == Qt.Orientation.Horizontal:
+            return self.headers[section] if section < len(self.headers) else None
+
+        return section + 1
+
+    def set_rows(self, headers, rows):
+        headers = list(headers)
+        rows    = [tuple(str(x) for x in row) for row in rows]
+
+        # New columns, the view has to be rebuilt anyway
+        if headers != self.headers:
+            self.beginResetModel()
+            self.headers = headers
+            self.rows    = rows
+            self.endResetModel()
+            return
+
+        nold = len(self.rows)
+        nnew = len(rows)
+        ncommon = min(nold, nnew)
+
+        # Changed rows in place, signaled as contiguous runs
+        start = None
+        for i in range(ncommon + 1):
+            changed = i < ncommon and self.rows[i] != rows[i]
+            if changed:
+                self.rows[i] = rows[i]
+                if start is None:
+                    start = i
+            elif start is not None:
+                self.dataChanged.emit(self.index(start, 0), self.index(i - 1, len(self.headers) - 1))
+                start = None
+
+        if nnew > nold:
+            self.beginInsertRows(QModelIndex(), nold, nnew - 1)
+            self.rows.extend(rows[nold:])
+            self.endInsertRows()
+        elif nnew < nold:
+            self.beginRemoveRows(QModelIndex(), nnew, nold - 1)
+            del self.rows[nnew:]
+            self.endRemoveRows()
+
+
+# One page of the copy/paste journal, failed pastes in red like the old log
+class JournalTableModel(ResultTableModel):
+
+    def __init__(self, parent = None):
+        super().__init__(parent)
+        self.failed = set()
+
+    def data(self, index, role = Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.ForegroundRole and index.isValid() and index.row() in self.failed:
+            return QColor('#ff774a')
+
+        return super().data(index, role)
+
+    def set_page(self, headers, rows, failed):
+        self.failed = set(failed)
+        self.set_rows(headers, rows)
+
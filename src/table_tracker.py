@@ -0,0 +1,102 @@
+# QGIS Core
+from qgis.core import QgsApplication
+
+# Python
+from time import perf_counter
+
+PREFIX = 'QgsAttributeTableDialog/'
+
+# Open attribute tables by layer id, QGIS names each dialog 'QgsAttributeTableDialog/<layer id>'
+# Tables already open are found by one widget scan on start, later ones when they get focus
+# They are dropped when destroyed, a check is a dict lookup and never walks the widgets
+class AttrTableTracker:
+
+    def __init__(self):
+        self.qapp    = QgsApplication.instance()
+        self.tables  = {}
+        self.started = False
+
+        self.checks  = 0
+        self.hits    = 0
+        self.scans   = 0
+        self.seconds = 0.0
+
+    def start(self):
+        if not self.started:
+            self.qapp.focusChanged.connect(self.on_focus_changed)
+            self.started = True
+            self.scan()
+
+    def stop(self):
+        if self.started:
+            try:
+                self.qapp.focusChanged.disconnect(self.on_focus_changed)
+            except (RuntimeError, TypeError):
+                pass
+            self.started = False
+        self.tables = {}
+
+    def is_open(self, lyr_id):
+        t0 = perf_counter()
+        self.checks += 1
+
+        flag = self.lookup(lyr_id)
+        if flag:
+            self.hits += 1
+
+        self.seconds += perf_counter() - t0
+
+        return flag
+
+    def lookup(self, lyr_id):
+        widget = self.tables.get(lyr_id)
+        if widget is None:
+            return False
+
+        try:
+            return widget.objectName() == PREFIX + lyr_id
+        except RuntimeError:
+            # Deleted without the destroyed signal reaching us
+            self.tables.pop(lyr_id, None)
+            return False
+
+    # Walks every widget once and registers all open tables, only on start
+    def scan(self):
+        self.scans += 1
+        for widget in self.qapp.allWidgets():
+            self.register(widget)
+
+    def register(self, widget):
+        name = widget.objectName()
+        if name.startswith(PREFIX):
+            lyr_id = name[len(PREFIX):]
+            if self.tables.get(lyr_id) is not widget:
+                self.tables[lyr_id] = widget
+                widget.destroyed.connect(lambda _ = None, lyr_id = lyr_id, widget = widget: self.forget(lyr_id, widget))
+            return True
+
+        return False
+
+    def forget(self, lyr_id, widget):
+        if self.tables.get(lyr_id) is widget:
+            del self.tables[lyr_id]
+
+    ###############
+    ### Signals ###
+    ###############
+    def on_focus_changed(self, old, new):
+        # Walk up from the focused widget, the dialog is a few parents above
+        widget = new
+        while widget is not None:
+            if self.register(widget):
+                return
+            widget = widget.parentWidget()
+
+    def stats(self):
+        avg_ms = 1000*self.seconds/self.checks if self.checks else 0
+
+        return [('Open tables known', len(self.tables)),
+                ('Checks',            self.checks),
+                ('Cached answers',    self.hits),
+                ('Widget scans',      self.scans),
+                ('Avg check',         '{:.3f} ms'.format(avg_ms))]
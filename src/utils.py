@@ -1,4 +1,5 @@
 # QGIS Core
+from qgis.core import QgsFeature
 from qgis.core import QgsField
 from qgis.core import QgsVectorLayer
 
@@ -21,6 +22,21 @@ def make_new_layer(name, OUT_FIELDS):
 
     return new_layer
 
+# Make a new layer holding the given rows, for the layer-based custom prep scripts
+def rows_to_layer(name, rows, OUT_FIELDS):
+    new_layer = make_new_layer(name, OUT_FIELDS)
+    fields    = new_layer.fields()
+
+    features = []
+    for row in rows:
+        feat = QgsFeature(fields)
+        feat.setAttributes(list(row))
+        features.append(feat)
+
+    new_layer.dataProvider().addFeatures(features)
+
+    return new_layer
+
 def est_degree_error(lat, max_dist):
     lat_rad       = lat*pi/180 
     m_per_deg_lat = 111132.954 - 559.822 * cos( 2.0 * lat_rad ) + 1.175 * cos( 4.0 * lat_rad)